@@ -1,104 +1,172 @@
 from __future__ import annotations
 
-from typing import List
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Hashable, List, Optional, Tuple
+
+import hashlib
+import os
+import threading
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LinearRegression
+
+# scikit-learn 在首次训练时才加载
+from . import backends
+from .metrics import STAGE_SECONDS, cache_result
+
+if TYPE_CHECKING:
+	from sklearn.ensemble import RandomForestClassifier
+	from sklearn.linear_model import LinearRegression
+
+# 已训练模型按 (城市, 数据版本) 缓存；设置 ALERT_MODEL_DIR 后同时用 joblib 落盘
+ALERT_MODEL_CACHE_SIZE = int(os.environ.get("ALERT_MODEL_CACHE_SIZE", "64"))
+ALERT_MODEL_DIR = os.environ.get("ALERT_MODEL_DIR", "")
+
+_MODELS: "OrderedDict[Hashable, tuple]" = OrderedDict()
+_MODELS_LOCK = threading.Lock()
+
+# 1970-01-01 的 proleptic 序数，用于把 datetime64[D] 直接换算成 toordinal()
+_EPOCH_ORDINAL = 719163
+
+_FEATURES = [
+	("temperature_c", 20.0),
+	("precipitation_mm", 0.0),
+	("wind_speed_ms", 3.0),
+	("humidity", 60.0),
+]
+
+
+def _to_ordinal(dates) -> np.ndarray:
+	return pd.to_datetime(dates).values.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+
+
+def _clean_history(df: pd.DataFrame) -> pd.DataFrame:
+	"""只取训练所需列并填充缺失，不复制整张历史表。"""
+	data = {"date": pd.to_datetime(df["date"], errors="coerce").ffill().bfill().values}
+	for col, default in _FEATURES:
+		if col in df:
+			data[col] = pd.to_numeric(df[col], errors="coerce").fillna(default).to_numpy(dtype=float)
+		else:
+			data[col] = np.full(len(df), default)
+	return pd.DataFrame(data)
 
 
-def _train_temp_linear_regression(df: pd.DataFrame) -> LinearRegression:
-	data = df.copy()
+def _train_temp_linear_regression(data: pd.DataFrame) -> LinearRegression:
 	# 仅使用有温度与日期的样本
 	data = data[["date", "temperature_c"]].dropna()
-	data["date"] = pd.to_datetime(data["date"]).map(pd.Timestamp.toordinal)
-	dates = data["date"].values.reshape(-1, 1)
+	dates = _to_ordinal(data["date"]).reshape(-1, 1)
 	temp = data["temperature_c"].astype(float).values
-	model = LinearRegression()
+	model = backends.sklearn().LinearRegression()
 	model.fit(dates, temp)
 	return model
 
 
-def _train_rf_risk_classifier(df: pd.DataFrame) -> RandomForestClassifier:
-	"""使用规则合成历史标签，并训练随机森林做二分类（低/高风险）。对缺失值做填充。"""
-	data = df.copy()
-	# 确保列存在
-	for col, default in [
-		("temperature_c", 20.0),
-		("precipitation_mm", 0.0),
-		("wind_speed_ms", 3.0),
-		("humidity", 60.0),
-	]:
-		if col not in data:
-			data[col] = default
-	# 转为数值并填充缺失
-	for col in ["temperature_c", "precipitation_mm", "wind_speed_ms", "humidity"]:
-		data[col] = pd.to_numeric(data[col], errors="coerce").fillna(data[col].median()).fillna(0.0)
-
-	X = data[["temperature_c", "precipitation_mm", "wind_speed_ms", "humidity"]].values
+def _train_rf_risk_classifier(data: pd.DataFrame) -> RandomForestClassifier:
+	"""使用规则合成历史标签，并训练随机森林做二分类（低/高风险）。输入需已由 _clean_history 清洗。"""
+	X = data[[col for col, _ in _FEATURES]].to_numpy(dtype=float)
+	temp, prec, wind = X[:, 0], X[:, 1], X[:, 2]
 	# 合成标签：低温/高温/大雨视为高风险
-	labels = (
-		(data["temperature_c"] < 0)
-		| (data["temperature_c"] > 35)
-		| (data["precipitation_mm"] > 10)
-		| (data["wind_speed_ms"] > 8)
-	)
-	y = labels.astype(int).values
-	model = RandomForestClassifier(n_estimators=120, max_depth=6, random_state=42)
+	y = ((temp < 0) | (temp > 35) | (prec > 10) | (wind > 8)).astype(int)
+	model = backends.sklearn().RandomForestClassifier(n_estimators=120, max_depth=6, random_state=42)
 	model.fit(X, y)
 	return model
 
 
-def generate_alerts(history_df: pd.DataFrame, forecast_list: List[dict]) -> List[dict]:
-	"""生成未来几天的天气风险预警。对历史数据先做缺失清洗，避免训练报错。"""
-	data = history_df.copy()
-	# 清洗缺失与列缺失
-	for col, default in [
-		("temperature_c", 20.0),
-		("precipitation_mm", 0.0),
-		("humidity", 60.0),
-		("wind_speed_ms", 3.0),
-	]:
-		if col not in data:
-			data[col] = default
-		data[col] = pd.to_numeric(data[col], errors="coerce").fillna(default)
-	data["date"] = pd.to_datetime(data["date"], errors="coerce").fillna(method="ffill").fillna(method="bfill")
-
-	lin = _train_temp_linear_regression(data)
-	rf = _train_rf_risk_classifier(data)
+def _model_path(cache_key: Hashable) -> Optional[Path]:
+	if not ALERT_MODEL_DIR:
+		return None
+	digest = hashlib.sha1(repr(cache_key).encode("utf-8")).hexdigest()[:16]
+	return Path(ALERT_MODEL_DIR) / f"alerts-{digest}.joblib"
+
+
+def _get_models(history_df: pd.DataFrame, cache_key: Optional[Hashable]) -> Tuple[LinearRegression, RandomForestClassifier]:
+	if cache_key is not None:
+		with _MODELS_LOCK:
+			models = _MODELS.get(cache_key)
+			if models is not None:
+				_MODELS.move_to_end(cache_key)
+		if models is not None:
+			cache_result("alert_model", "hit")
+			return models
+	path = _model_path(cache_key) if cache_key is not None else None
+	models = None
+	if path is not None and path.exists():
+		try:
+			import joblib
+			models = joblib.load(path)
+		except Exception:
+			models = None
+	if models is not None:
+		cache_result("alert_model", "disk")
+	else:
+		cache_result("alert_model", "miss")
+		with STAGE_SECONDS.time(stage="alert_train"):
+			data = _clean_history(history_df)
+			models = (_train_temp_linear_regression(data), _train_rf_risk_classifier(data))
+		if path is not None:
+			try:
+				import joblib
+				path.parent.mkdir(parents=True, exist_ok=True)
+				joblib.dump(models, path)
+			except Exception:
+				pass
+	if cache_key is not None:
+		with _MODELS_LOCK:
+			_MODELS[cache_key] = models
+			_MODELS.move_to_end(cache_key)
+			while len(_MODELS) > ALERT_MODEL_CACHE_SIZE:
+				_MODELS.popitem(last=False)
+	return models
+
+
+def _column(items: List[dict], key: str) -> np.ndarray:
+	"""取出各天的某个字段，缺失记为 NaN。"""
+	values = [item.get(key) for item in items]
+	return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def generate_alerts(history_df: pd.DataFrame, forecast_list: List[dict], cache_key: Optional[Hashable] = None) -> List[dict]:
+	"""生成未来几天的天气风险预警。
+
+	cache_key（如 (城市, 数据版本)）相同时复用已训练的模型；所有预测日在一次批量调用中打分。
+	"""
+	if not forecast_list:
+		return []
+	lin, rf = _get_models(history_df, cache_key)
+
+	dates = [item["date"] for item in forecast_list]
+	baseline = lin.predict(_to_ordinal(dates).reshape(-1, 1))
+
+	temp = _column(forecast_list, "temperature_c")
+	prec = _column(forecast_list, "precipitation_mm")
+	wind = _column(forecast_list, "wind_speed_ms")
+	hum = _column(forecast_list, "humidity")
+	feat = np.column_stack([
+		np.where(np.isnan(temp), baseline, temp),
+		np.nan_to_num(prec, nan=0.0),
+		np.nan_to_num(wind, nan=3.0),
+		np.nan_to_num(hum, nan=60.0),
+	])
+	high_risk = rf.predict(feat).astype(int) == 1
+
+	# 规则原因（缺失值按原逐条判断时的默认值处理）
+	masks = [
+		(np.nan_to_num(temp, nan=0.0) < -5, "极端低温"),
+		(np.nan_to_num(temp, nan=100.0) > 35, "极端高温"),
+		(np.nan_to_num(prec, nan=0.0) > 10, "强降水"),
+		(np.nan_to_num(wind, nan=0.0) > 8, "大风"),
+	]
 
 	results: List[dict] = []
-	for item in forecast_list:
-		date_str = item["date"]
-		date_ord = pd.Timestamp(date_str).toordinal()
-		baseline_temp = float(lin.predict([[date_ord]])[0])
-
-		feat = np.array([
-			item.get("temperature_c", baseline_temp),
-			item.get("precipitation_mm", 0.0),
-			item.get("wind_speed_ms", 3.0),
-			item.get("humidity", 60.0),
-		]).reshape(1, -1)
-		pred = int(rf.predict(feat)[0])
-		level = "高风险" if pred == 1 else "低风险"
-
-		reasons = []
-		if item.get("temperature_c", 0) < -5:
-			reasons.append("极端低温")
-		if item.get("temperature_c", 100) > 35:
-			reasons.append("极端高温")
-		if item.get("precipitation_mm", 0) > 10:
-			reasons.append("强降水")
-		if item.get("wind_speed_ms", 0) > 8:
-			reasons.append("大风")
-		if not reasons and level == "高风险":
+	for i, date_str in enumerate(dates):
+		reasons = [label for mask, label in masks if mask[i]]
+		if not reasons and high_risk[i]:
 			reasons.append("综合风险较高")
-
 		results.append({
 			"date": date_str,
-			"level": level,
-			"baseline_temp": baseline_temp,
+			"level": "高风险" if high_risk[i] else "低风险",
+			"baseline_temp": float(baseline[i]),
 			"reasons": reasons,
 		})
 
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import json
+import os
+import sys
+import threading
+import time
+
+# 禁用 TensorFlow 的 INFO/WARNING 日志与 oneDNN 提示（需在导入 TensorFlow 之前设置）
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+
+# 启动时预加载的后端（逗号分隔，或 all）；默认全部延迟到首次使用时加载
+PRELOAD_BACKENDS = os.environ.get("PRELOAD_BACKENDS", "")
+
+_PROCESS_T0 = time.time()
+
+_lock = threading.Lock()
+_loaded: Dict[str, Any] = {}
+_report: Dict[str, dict] = {}
+
+
+def _rss_mb() -> Optional[float]:
+	"""当前进程常驻内存（MB），无法获取时返回 None。"""
+	try:
+		import psutil  # type: ignore
+		return psutil.Process().memory_info().rss / 1024 / 1024
+	except Exception:
+		pass
+	try:
+		with open("/proc/self/statm") as fh:
+			pages = int(fh.read().split()[1])
+		return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+	except Exception:
+		return None
+
+
+def _load_statsmodels():
+	from statsmodels.tsa.arima.model import ARIMA
+	return ARIMA
+
+
+def _load_tensorflow():
+	import tensorflow as tf  # type: ignore
+	from tensorflow import keras  # type: ignore
+	return tf, keras
+
+
+def _load_sklearn():
+	from sklearn.ensemble import RandomForestClassifier
+	from sklearn.linear_model import LinearRegression
+	from sklearn.neighbors import BallTree, NearestNeighbors
+	return SimpleNamespace(
+		RandomForestClassifier=RandomForestClassifier,
+		LinearRegression=LinearRegression,
+		NearestNeighbors=NearestNeighbors,
+		BallTree=BallTree,
+	)
+
+
+_LOADERS: Dict[str, Callable[[], Any]] = {
+	"statsmodels": _load_statsmodels,
+	"tensorflow": _load_tensorflow,
+	"sklearn": _load_sklearn,
+}
+
+# 可选后端：导入失败时返回 None 而非抛出
+_OPTIONAL = {"tensorflow"}
+
+
+def load(name: str) -> Any:
+	"""按名称加载后端（只加载一次），并记录导入耗时与内存增量。"""
+	if name in _loaded:
+		return _loaded[name]
+	with _lock:
+		if name in _loaded:
+			return _loaded[name]
+		rss_before = _rss_mb()
+		t0 = time.perf_counter()
+		error = None
+		try:
+			value = _LOADERS[name]()
+		except Exception as exc:
+			if name not in _OPTIONAL:
+				raise
+			value, error = None, repr(exc)
+		rss_after = _rss_mb()
+		_report[name] = {
+			"loaded": True,
+			"available": value is not None,
+			"seconds": round(time.perf_counter() - t0, 4),
+			"rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+			"loaded_at": round(time.time() - _PROCESS_T0, 3),
+			"error": error,
+		}
+		_loaded[name] = value
+		return value
+
+
+def arima():
+	"""statsmodels 的 ARIMA 类。"""
+	return load("statsmodels")
+
+
+def tensorflow():
+	"""(tf, keras) 元组；未安装 TensorFlow 时返回 None。"""
+	return load("tensorflow")
+
+
+def sklearn():
+	"""包含 RandomForestClassifier / LinearRegression / NearestNeighbors / BallTree 的命名空间。"""
+	return load("sklearn")
+
+
+def preload_names() -> List[str]:
+	"""PRELOAD_BACKENDS 指定的后端名称（all 表示全部）。"""
+	raw = PRELOAD_BACKENDS.strip()
+	return list(_LOADERS) if raw == "all" else [n.strip() for n in raw.split(",") if n.strip()]
+
+
+def preload(names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+	"""预加载后端；names 为空时读取 PRELOAD_BACKENDS 环境变量。"""
+	if names is None:
+		names = preload_names()
+	for name in names:
+		if name in _LOADERS:
+			try:
+				load(name)
+			except Exception:
+				pass
+	return report()
+
+
+def report() -> Dict[str, Any]:
+	"""启动与导入报告：进程存活时长、当前常驻内存、各后端加载情况。"""
+	rss = _rss_mb()
+	return {
+		"uptime_seconds": round(time.time() - _PROCESS_T0, 3),
+		"rss_mb": round(rss, 1) if rss is not None else None,
+		"backends": {name: _report.get(name, {"loaded": False}) for name in _LOADERS},
+	}
+
+
+def _main() -> None:
+	"""命令行：python -m app.backends [--preload]，输出应用导入耗时、内存与各后端加载报告（JSON）。"""
+	rss_before = _rss_mb()
+	t0 = time.perf_counter()
+	import app.main  # noqa: F401
+	from app import backends  # 以 -m 运行时本文件是 __main__，需使用包内的同一模块实例
+	app_import = {
+		"seconds": round(time.perf_counter() - t0, 4),
+		"rss_delta_mb": round(_rss_mb() - rss_before, 1) if rss_before is not None else None,
+	}
+	if "--preload" in sys.argv[1:]:
+		backends.preload(list(_LOADERS))
+	out = backends.report()
+	out["app_import"] = app_import
+	print(json.dumps(out, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+	_main()
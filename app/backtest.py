@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .bench import BENCH_DIR, FIXTURE_SEED, _git_commit, _versions, make_history
+
+# 滚动起点回测：在每个城市的历史上选取多个预测起点，只用起点之前的数据运行各引擎，
+# 与起点之后的实测比较误差，并记录每个引擎的耗时与内存。城市 × 起点在多个进程中并行。
+
+# 参与比较的引擎：persistence 为“明天同今天”的基线；lstm 只预测温度
+ENGINES = ("persistence", "fast", "arima", "lstm", "ensemble")
+TARGETS = ("temperature_c", "tmax", "tmin", "precipitation_mm")
+# 默认训练窗口与服务一致（data_loader.HISTORY_WINDOW_DAYS）
+DEFAULT_WINDOW = int(os.environ.get("HISTORY_WINDOW_DAYS", "90"))
+DEFAULT_HORIZON = 7
+# 本地历史库中没有该城市时生成的合成历史长度（天）
+SYNTHETIC_DAYS = 730
+
+
+def origins(n_days: int, window: int, horizon: int, count: int, step: int) -> List[int]:
+	"""预测起点（在连续日序列中的下标）：最后一个起点之后恰好留出 horizon 天，向前每隔 step 天一个，最多 count 个。"""
+	last = n_days - horizon
+	return sorted(i for i in range(last, window - 1, -max(1, step)))[-max(1, count):] if last >= window else []
+
+
+def load_history(city: str, source: str = "auto", synthetic_days: int = SYNTHETIC_DAYS) -> Tuple[Optional[pd.DataFrame], str]:
+	"""(按日期排序的历史, 来源)。source：store 只用本地历史库；synthetic 用基准夹具；auto 优先历史库。"""
+	if source in ("auto", "store"):
+		from . import history_store
+
+		stored = history_store.load(city)
+		if stored is not None:
+			return stored[0].sort_values("date").reset_index(drop=True), "history-store"
+		if source == "store":
+			return None, "missing"
+	seed = FIXTURE_SEED + sum(city.encode("utf-8"))
+	return make_history(synthetic_days, seed=seed), "synthetic"
+
+
+def _daily(df: pd.DataFrame) -> pd.DataFrame:
+	"""补齐为连续日序列（缺测日期的数值为 NaN），起点下标才能直接对应日期。"""
+	df = df.assign(date=pd.to_datetime(df["date"]).dt.normalize()).drop_duplicates("date", keep="last")
+	full = pd.date_range(df["date"].min(), df["date"].max(), freq="D")
+	return df.set_index("date").reindex(full).rename_axis("date").reset_index()
+
+
+def _series(df: pd.DataFrame, col: str) -> pd.Series:
+	return pd.Series(df[col].to_numpy(dtype=float), index=df["date"])
+
+
+# 每个引擎：(训练数据, 步数, 城市) -> (温度预测, 降水预测或 None)
+def _persistence(train: pd.DataFrame, steps: int, city: str):
+	last = train.dropna(subset=["temperature_c"]).iloc[-1]
+	return np.full(steps, float(last["temperature_c"])), np.full(steps, float(np.nan_to_num(last["precipitation_mm"])))
+
+
+def _fast(train: pd.DataFrame, steps: int, city: str):
+	from . import fast_engine
+
+	return fast_engine.forecast_frame(train, steps)
+
+
+def _arima(train: pd.DataFrame, steps: int, city: str):
+	from .forecasting import _arima_forecast
+
+	# 与服务相同按城市缓存阶数：同一进程内该城市的第一个起点承担阶数搜索
+	return (
+		_arima_forecast(_series(train, "temperature_c"), steps, cache_key=(city, "temperature_c")),
+		_arima_forecast(_series(train, "precipitation_mm"), steps, cache_key=(city, "precipitation_mm")),
+	)
+
+
+def _lstm(train: pd.DataFrame, steps: int, city: str):
+	from .forecasting import _lstm_forecast
+
+	temp = _lstm_forecast(_series(train, "temperature_c"), steps, cache_key=(city, "temperature_c"))
+	if temp is None:
+		raise RuntimeError("tensorflow unavailable")
+	return temp, None
+
+
+def _ensemble(train: pd.DataFrame, steps: int, city: str):
+	from .forecasting import local_model_forecast
+
+	return local_model_forecast(train, steps, city, "ensemble")
+
+
+_ENGINE_FUNCS: Dict[str, Callable] = {
+	"persistence": _persistence, "fast": _fast, "arima": _arima, "lstm": _lstm, "ensemble": _ensemble,
+}
+
+
+def _run_engine(engine: str, train: pd.DataFrame, steps: int, city: str) -> List[dict]:
+	"""本地模型 + 融合逻辑（无外部预测，与服务的 local_only 路径相同），返回逐日输出。"""
+	from .forecasting import fuse_with_external
+
+	temp, prec = _ENGINE_FUNCS[engine](train, steps, city)
+	out = fuse_with_external(train, temp, np.zeros(steps) if prec is None else prec, None, steps)
+	if prec is None:
+		for d in out:
+			d["precipitation_mm"] = None
+	return out
+
+
+def _errors(forecast: List[dict], actual: pd.DataFrame) -> Dict[str, Tuple[float, float, int]]:
+	"""各目标的 (绝对误差和, 平方误差和, 有效天数)，便于跨起点汇总。"""
+	out = {}
+	for col in TARGETS:
+		if col not in actual:
+			continue
+		pred = np.array([np.nan if d[col] is None else d[col] for d in forecast], dtype=float)
+		err = pred - actual[col].to_numpy(dtype=float)[:len(pred)]
+		err = err[np.isfinite(err)]
+		if len(err):
+			out[col] = (float(np.abs(err).sum()), float((err ** 2).sum()), int(len(err)))
+	return out
+
+
+def _init_worker(model_dir: str) -> None:
+	os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+	warnings.simplefilter("ignore")
+	logging.getLogger("tensorflow").setLevel(logging.ERROR)
+	from . import forecasting
+
+	# 城市 × 起点已经并行，阶数搜索串行；LSTM 模型写入各进程自己的临时目录，不读写服务的模型缓存
+	forecasting.ARIMA_N_JOBS = 1
+	forecasting.LSTM_MODEL_DIR = Path(model_dir) / str(os.getpid())
+
+
+def _forget_lstm() -> None:
+	"""清空本进程的 LSTM 模型缓存（同一起点的数据相同，否则会直接命中之前训练的模型）。"""
+	from . import forecasting
+
+	forecasting._LSTM_MODELS.clear()
+	for path in forecasting.LSTM_MODEL_DIR.glob("*.keras"):
+		path.unlink()
+
+
+def run_origin(
+	city: str, train: pd.DataFrame, actual: pd.DataFrame, engines: Sequence[str], memory: bool = True,
+) -> List[dict]:
+	"""在一个起点上依次运行各引擎，返回 [{city, origin, engine, seconds, peak_kib, errors | error}]。"""
+	steps = len(actual)
+	origin = actual["date"].iloc[0].date().isoformat()
+	records = []
+	for engine in engines:
+		record = {"city": city, "origin": origin, "engine": engine}
+		try:
+			# lstm 与 ensemble 各自从头训练，不复用另一个引擎在同一起点训练好的模型
+			if engine in ("lstm", "ensemble"):
+				_forget_lstm()
+			gc.collect()
+			t0 = time.perf_counter()
+			forecast = _run_engine(engine, train, steps, city)
+			record["seconds"] = time.perf_counter() - t0
+			record["errors"] = _errors(forecast, actual)
+			if memory:
+				# 单独再运行一次并跟踪 Python 分配（不含 TensorFlow 原生内存），不与计时混用
+				if engine in ("lstm", "ensemble"):
+					_forget_lstm()
+				gc.collect()
+				tracemalloc.start()
+				try:
+					_run_engine(engine, train, steps, city)
+					record["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+				finally:
+					tracemalloc.stop()
+		except Exception as exc:
+			record["error"] = f"{type(exc).__name__}: {exc}"
+		records.append(record)
+	return records
+
+
+def _tasks(
+	cities: Sequence[str], source: str, window: int, horizon: int, count: int, step: int, synthetic_days: int,
+	sources: Dict[str, str],
+) -> Iterator[Tuple[str, pd.DataFrame, pd.DataFrame]]:
+	"""逐城市切出 (城市, 训练窗口, 起点之后的实测)，sources 中记录各城市的历史来源。"""
+	for city in cities:
+		df, sources[city] = load_history(city, source, synthetic_days)
+		if df is None or df.empty:
+			continue
+		df = _daily(df)
+		for i in origins(len(df), window, horizon, count, step):
+			yield city, df.iloc[i - window:i].reset_index(drop=True), df.iloc[i:i + horizon].reset_index(drop=True)
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+	return float(np.percentile(np.asarray(values), q))
+
+
+def summarize(records: List[dict]) -> Dict[str, dict]:
+	"""按引擎汇总：MAE/RMSE（所有城市、起点与预测日合并计算）、单次耗时与内存分位数、失败次数。"""
+	out: Dict[str, dict] = {}
+	for engine in dict.fromkeys(r["engine"] for r in records):
+		rows = [r for r in records if r["engine"] == engine]
+		ok = [r for r in rows if "error" not in r]
+		metrics = {}
+		for col in TARGETS:
+			parts = [r["errors"][col] for r in ok if col in r["errors"]]
+			n = sum(p[2] for p in parts)
+			if n:
+				metrics[col] = {
+					"mae": round(sum(p[0] for p in parts) / n, 4),
+					"rmse": round(float(np.sqrt(sum(p[1] for p in parts) / n)), 4),
+					"n": n,
+				}
+		seconds = [r["seconds"] * 1000 for r in ok]
+		peaks = [r["peak_kib"] for r in ok if "peak_kib" in r]
+		out[engine] = {
+			"runs": len(rows),
+			"failed": len(rows) - len(ok),
+			"errors": sorted({r["error"] for r in rows if "error" in r})[:3],
+			"median_ms": round(statistics.median(seconds), 3) if seconds else None,
+			"p95_ms": round(_percentile(seconds, 95), 3) if seconds else None,
+			"total_s": round(sum(seconds) / 1000, 3),
+			"peak_kib": round(statistics.median(peaks), 1) if peaks else None,
+			"metrics": metrics,
+		}
+	return out
+
+
+def run(
+	cities: Sequence[str],
+	engines: Sequence[str] = ENGINES,
+	source: str = "auto",
+	window: int = DEFAULT_WINDOW,
+	horizon: int = DEFAULT_HORIZON,
+	count: int = 8,
+	step: int = 7,
+	workers: int = 0,
+	memory: bool = True,
+	synthetic_days: int = SYNTHETIC_DAYS,
+	progress: Callable[[List[dict]], None] = lambda records: None,
+) -> dict:
+	"""运行回测，返回 {"meta", "summary", "cities", "records"}。workers 为 0 时取 CPU 数，1 时在本进程执行。"""
+	os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+	warnings.simplefilter("ignore")
+	workers = workers or os.cpu_count() or 1
+	sources: Dict[str, str] = {}
+	tasks = list(_tasks(cities, source, window, horizon, count, step, synthetic_days, sources))
+	records: List[dict] = []
+	started = time.time()
+	with tempfile.TemporaryDirectory(prefix="weather-backtest-") as model_dir:
+		if workers <= 1:
+			from . import forecasting
+
+			saved = forecasting.ARIMA_N_JOBS, forecasting.LSTM_MODEL_DIR
+			_init_worker(model_dir)
+			try:
+				for city, train, actual in tasks:
+					records.extend(run_origin(city, train, actual, engines, memory))
+					progress(records)
+			finally:
+				forecasting.ARIMA_N_JOBS, forecasting.LSTM_MODEL_DIR = saved
+		else:
+			# spawn：与计算层一致，避免 fork 继承 TensorFlow 状态
+			with ProcessPoolExecutor(
+				max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+				initializer=_init_worker, initargs=(model_dir,),
+			) as pool:
+				futures = [pool.submit(run_origin, city, train, actual, engines, memory) for city, train, actual in tasks]
+				for future in as_completed(futures):
+					records.extend(future.result())
+					progress(records)
+	records.sort(key=lambda r: (r["city"], r["origin"], engines.index(r["engine"])))
+	return {
+		"meta": {
+			"started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+			"seconds": round(time.time() - started, 1),
+			"commit": _git_commit(),
+			"cpu_count": os.cpu_count(),
+			"workers": workers,
+			"versions": _versions(),
+			"window": window, "horizon": horizon, "origins": count, "step": step, "engines": list(engines),
+			"sources": sources,
+		},
+		"summary": summarize(records),
+		"cities": {city: summarize([r for r in records if r["city"] == city]) for city in cities if sources[city] != "missing"},
+		"records": records,
+	}
+
+
+def _format_summary(summary: Dict[str, dict]) -> List[str]:
+	lines = [f"{'engine':<12} {'runs':>5} {'median ms':>11} {'p95 ms':>11} {'peak KiB':>10}  " + "  ".join(f"{c} MAE/RMSE" for c in TARGETS)]
+	for engine, s in summary.items():
+		cells = []
+		for col in TARGETS:
+			m = s["metrics"].get(col)
+			cells.append(f"{m['mae']:.2f}/{m['rmse']:.2f}" if m else "-")
+		peak = "-" if s["peak_kib"] is None else f"{s['peak_kib']:.1f}"
+		median = "-" if s["median_ms"] is None else f"{s['median_ms']:.1f}"
+		p95 = "-" if s["p95_ms"] is None else f"{s['p95_ms']:.1f}"
+		lines.append(f"{engine:<12} {s['runs']:>5} {median:>11} {p95:>11} {peak:>10}  " + "  ".join(f"{c:>22}" for c in cells))
+		if s["failed"]:
+			lines.append(f"{'':<12} failed {s['failed']}: {'; '.join(s['errors'])}")
+	return lines
+
+
+def _main(argv: Sequence[str]) -> int:
+	"""命令行：python -m app.backtest [--cities 北京,上海] [--engines fast,arima] [--origins 8] [--step 7] [--window 90] [--workers 4] [--out 文件]"""
+	from .data_loader import CITY_COORDS
+
+	parser = argparse.ArgumentParser(prog="python -m app.backtest", description="滚动起点回测：比较各预测引擎的误差与耗时")
+	parser.add_argument("--cities", default="", help="城市列表（逗号分隔，默认全部内置城市）")
+	parser.add_argument("--engines", default=",".join(ENGINES), help=f"可选：{', '.join(ENGINES)}")
+	parser.add_argument("--source", choices=("auto", "store", "synthetic"), default="auto", help="历史来源：本地历史库 / 合成夹具")
+	parser.add_argument("--synthetic-days", type=int, default=SYNTHETIC_DAYS)
+	parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="每个起点使用的训练天数")
+	parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON, help="预测天数")
+	parser.add_argument("--origins", type=int, default=8, help="每个城市的起点数")
+	parser.add_argument("--step", type=int, default=7, help="相邻起点间隔（天）")
+	parser.add_argument("--workers", type=int, default=0, help="进程数（默认 CPU 数，1 为单进程）")
+	parser.add_argument("--no-memory", action="store_true", help="不测量峰值内存")
+	parser.add_argument("--out", help=f"结果文件（默认 {BENCH_DIR}/backtest-<时间>.json）")
+	args = parser.parse_args(argv)
+
+	engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+	unknown = [e for e in engines if e not in ENGINES]
+	if unknown:
+		parser.error(f"未知引擎 {', '.join(unknown)}，可选：{', '.join(ENGINES)}")
+	cities = [c.strip() for c in args.cities.split(",") if c.strip()] or list(CITY_COORDS)
+
+	def progress(records: List[dict]) -> None:
+		print(f"\r{len(records)} runs", end="", file=sys.stderr, flush=True)
+
+	out = run(
+		cities, engines, args.source, args.window, args.horizon, args.origins, args.step,
+		args.workers, not args.no_memory, args.synthetic_days, progress,
+	)
+	print(file=sys.stderr)
+	print("\n".join(_format_summary(out["summary"])))
+	path = Path(args.out) if args.out else BENCH_DIR / f"backtest-{time.strftime('%Y%m%d-%H%M%S')}.json"
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+	print(f"-> {path}")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import argparse
+import fnmatch
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 基准结果默认保存目录（每次运行一个 JSON 文件）
+BENCH_DIR = Path(os.environ.get("BENCH_DIR", str(Path(__file__).resolve().parent.parent / "data" / "benchmarks")))
+# 默认历史长度（天）：30 天 ~ 10 年
+DEFAULT_DAYS = (30, 90, 365, 1825, 3650)
+# 固定的夹具参数，保证每次运行输入完全一致
+FIXTURE_SEED = 20240601
+FIXTURE_END = "2024-06-30"
+FORECAST_DAYS = 7
+# 多城市批量预测用例的城市数
+BATCH_CITIES = 200
+
+NLP_QUERIES = [
+	"明天北京温度多少", "未来一周会有暴雨预警吗", "明天穿什么衣服出门", "最近的历史天气模式分析",
+	"你好", "后天会不会降水", "高温风险大吗", "8.23 穿什么",
+]
+
+
+def make_history(days: int, seed: int = FIXTURE_SEED, end: str = FIXTURE_END, gap_ratio: float = 0.0) -> pd.DataFrame:
+	"""确定性的历史夹具：年周期 + 月周期 + 噪声，列与 data_loader 的输出一致。gap_ratio 为随机缺测天数占比。"""
+	rng = np.random.default_rng(seed + days)
+	dates = pd.date_range(end=pd.Timestamp(end), periods=days, freq="D")
+	doy = dates.dayofyear.to_numpy(dtype=float)
+	t = np.arange(days, dtype=float)
+	temp = 13.0 - 15.0 * np.cos(2 * np.pi * (doy - 15) / 365.25) + 2.0 * np.sin(2 * np.pi * t / 30.0) + rng.normal(0, 1.5, days)
+	df = pd.DataFrame({
+		"date": dates,
+		"temperature_c": temp,
+		"tmin": temp - rng.uniform(3.0, 5.0, days),
+		"tmax": temp + rng.uniform(3.0, 5.0, days),
+		"precipitation_mm": np.clip(rng.gamma(1.2, 2.0, days) * (0.2 + (temp - temp.min()) / (np.ptp(temp) + 1e-6)), 0, None),
+		"humidity": np.clip(60 + 10 * np.sin(2 * np.pi * t / 10) + rng.normal(0, 4, days), 45, 90),
+		"wind_speed_ms": np.clip(3 + 2 * np.sin(2 * np.pi * t / 12) + rng.normal(0, 0.8, days), 1, 9),
+	})
+	if gap_ratio > 0 and days > 2:
+		drop = rng.choice(np.arange(1, days - 1), size=int((days - 2) * gap_ratio), replace=False)
+		df = df.drop(index=drop).reset_index(drop=True)
+	return df
+
+
+def make_external(history: pd.DataFrame, days: int = FORECAST_DAYS, seed: int = FIXTURE_SEED) -> pd.DataFrame:
+	"""与 _parse_open_meteo_forecast 输出结构相同的外部预测夹具（接在历史末日之后）。"""
+	rng = np.random.default_rng(seed)
+	last = pd.to_datetime(history["date"].iloc[-1]).normalize()
+	temp = float(history["temperature_c"].tail(7).mean()) + rng.normal(0, 1.0, days)
+	return pd.DataFrame({
+		"date": [(last + pd.Timedelta(days=i + 1)).date().isoformat() for i in range(days)],
+		"temperature_c": temp,
+		"tmin": temp - 4.0,
+		"tmax": temp + 4.0,
+		"precipitation_mm": rng.gamma(1.2, 2.0, days),
+		"humidity": rng.uniform(45, 90, days),
+		"wind_speed_ms": rng.uniform(1, 9, days),
+	})
+
+
+def _series(df: pd.DataFrame, col: str) -> pd.Series:
+	return pd.Series(df[col].values, index=pd.to_datetime(df["date"]))
+
+
+class Case(NamedTuple):
+	"""一个基准用例。prepare(days) 在计时之外执行（准备输入、清理缓存），返回被计时的无参函数。"""
+	name: str
+	prepare: Callable[[Optional[int]], Callable[[], Any]]
+	# 是否依赖历史长度（否则只按 days=None 运行一次）
+	sized: bool = True
+	# 耗时较长的用例（阶数搜索、模型训练）使用 heavy_repeat
+	heavy: bool = False
+	# 需要的可选后端，不可用时跳过
+	requires: str = ""
+
+
+def _cases(model_dir: Path) -> List[Case]:
+	from . import alerts, encoding, fast_engine, forecasting
+	from .nlp import parse_intent
+	from .recommend import recommend_outfit
+
+	def ensure_daily(days):
+		s = _series(make_history(days, gap_ratio=0.05), "temperature_c")
+		return lambda: forecasting._ensure_daily_series(s)
+
+	def select_order(days):
+		s = forecasting._ensure_daily_series(_series(make_history(days), "temperature_c"))
+		return lambda: forecasting._select_arima_order(s)
+
+	def arima_cold(days):
+		s = _series(make_history(days), "temperature_c")
+		return lambda: forecasting._arima_forecast(s, FORECAST_DAYS)
+
+	def arima_warm(days):
+		s = _series(make_history(days), "temperature_c")
+		key = ("__bench__", f"arima-{days}")
+		forecasting._arima_forecast(s, FORECAST_DAYS, cache_key=key)
+		return lambda: forecasting._arima_forecast(s, FORECAST_DAYS, cache_key=key)
+
+	def lstm_cold(days):
+		s = _series(make_history(days), "temperature_c")
+		forecasting._LSTM_MODELS.clear()
+		for old in model_dir.glob("*.keras"):
+			old.unlink()
+		return lambda: forecasting._lstm_forecast(s, FORECAST_DAYS, cache_key=("__bench__", f"lstm-{days}"))
+
+	def lstm_warm(days):
+		s = _series(make_history(days), "temperature_c")
+		key = ("__bench__", f"lstm-{days}")
+		forecasting._lstm_forecast(s, FORECAST_DAYS, cache_key=key)
+		return lambda: forecasting._lstm_forecast(s, FORECAST_DAYS, cache_key=key)
+
+	def fast(days):
+		df = make_history(days, gap_ratio=0.05)
+		return lambda: fast_engine.forecast_frame(df, FORECAST_DAYS)
+
+	def fast_batch(days):
+		frames = {f"city-{i}": make_history(days, seed=i, gap_ratio=0.05) for i in range(BATCH_CITIES)}
+		return lambda: forecasting.forecast_cities_fast(frames, FORECAST_DAYS)
+
+	def fusion(days):
+		df = make_history(days)
+		ext = make_external(df)
+		model = np.asarray(ext["temperature_c"], dtype=float) + 0.5
+		prec = np.asarray(ext["precipitation_mm"], dtype=float)
+
+		def run():
+			delta_max, delta_min = forecasting._estimate_spread_from_history(df)
+			return forecasting._fuse_forecast(model, prec, ext, list(ext["date"]), 60.0, 3.0, delta_max, delta_min)
+		return run
+
+	def _forecast_list(df):
+		ext = make_external(df)
+		return forecasting._fuse_forecast(
+			ext["temperature_c"].to_numpy(), ext["precipitation_mm"].to_numpy(), ext, list(ext["date"]), 60.0, 3.0, 4.5, 4.5,
+		)
+
+	def alerts_cold(days):
+		df = make_history(days)
+		fl = _forecast_list(df)
+		return lambda: alerts.generate_alerts(df, fl)
+
+	def alerts_warm(days):
+		df = make_history(days)
+		fl = _forecast_list(df)
+		key = ("__bench__", f"alerts-{days}")
+		alerts.generate_alerts(df, fl, cache_key=key)
+		return lambda: alerts.generate_alerts(df, fl, cache_key=key)
+
+	def recommend(_):
+		fl = _forecast_list(make_history(30))
+		return lambda: [
+			recommend_outfit(d["temperature_c"], d["precipitation_mm"], d["wind_speed_ms"], d["humidity"]) for d in fl
+		]
+
+	def intent(_):
+		return lambda: [parse_intent(q) for q in NLP_QUERIES]
+
+	def history_rows_json(days):
+		df = make_history(days)
+		return lambda: encoding.dumps(encoding.history_rows(df))
+
+	def history_columns_json(days):
+		df = make_history(days)
+		return lambda: encoding.dumps(encoding.history_columns(df))
+
+	return [
+		Case("ensure_daily_series", ensure_daily),
+		Case("select_arima_order", select_order, heavy=True),
+		Case("arima_forecast_cold", arima_cold, heavy=True),
+		Case("arima_forecast_warm", arima_warm),
+		Case("lstm_forecast_cold", lstm_cold, heavy=True, requires="tensorflow"),
+		Case("lstm_forecast_warm", lstm_warm, requires="tensorflow"),
+		Case("fast_forecast", fast),
+		Case("fast_forecast_batch", fast_batch),
+		Case("fuse_forecast", fusion),
+		Case("generate_alerts_cold", alerts_cold, heavy=True),
+		Case("generate_alerts_warm", alerts_warm),
+		Case("recommend_outfit", recommend, sized=False),
+		Case("parse_intent", intent, sized=False),
+		Case("history_rows_json", history_rows_json),
+		Case("history_columns_json", history_columns_json),
+	]
+
+
+def _measure(case: Case, days: Optional[int], repeat: int, memory: bool) -> dict:
+	times = []
+	for _ in range(repeat):
+		fn = case.prepare(days)
+		gc.collect()
+		t0 = time.perf_counter()
+		fn()
+		times.append(time.perf_counter() - t0)
+	peak = None
+	if memory:
+		# 单独再运行一次并跟踪分配（tracemalloc 会拖慢执行，不与计时混用）
+		fn = case.prepare(days)
+		gc.collect()
+		tracemalloc.start()
+		try:
+			fn()
+			peak = tracemalloc.get_traced_memory()[1]
+		finally:
+			tracemalloc.stop()
+	ms = [t * 1000 for t in times]
+	return {
+		"case": case.name,
+		"days": days,
+		"repeat": repeat,
+		"min_ms": round(min(ms), 3),
+		"median_ms": round(statistics.median(ms), 3),
+		"mean_ms": round(statistics.fmean(ms), 3),
+		"max_ms": round(max(ms), 3),
+		"peak_kib": round(peak / 1024, 1) if peak is not None else None,
+	}
+
+
+def _git_commit() -> Optional[str]:
+	try:
+		out = subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent.parent,
+			capture_output=True, text=True, timeout=5,
+		)
+		return out.stdout.strip() or None
+	except Exception:
+		return None
+
+
+def _versions() -> Dict[str, Optional[str]]:
+	out = {}
+	for name in ("numpy", "pandas", "statsmodels", "sklearn", "tensorflow", "orjson"):
+		module = sys.modules.get(name)
+		out[name] = getattr(module, "__version__", None) if module is not None else None
+	return out
+
+
+def run(
+	days: Sequence[int] = DEFAULT_DAYS,
+	only: Sequence[str] = (),
+	repeat: int = 5,
+	heavy_repeat: int = 2,
+	memory: bool = True,
+	progress: Callable[[dict], None] = lambda r: None,
+) -> dict:
+	"""运行基准（完全离线），返回 {"meta": ..., "results": [...]}。only 为用例名的通配模式。"""
+	# 拟合过程中的收敛/参数警告与 TensorFlow 日志不影响计时，避免刷屏
+	os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+	warnings.simplefilter("ignore")
+	from . import backends, forecasting
+
+	# 后端导入不计入用例耗时；LSTM 模型写入临时目录，不读写服务使用的模型缓存
+	for name in ("statsmodels", "sklearn", "tensorflow"):
+		backends.load(name)
+	model_dir = Path(tempfile.mkdtemp(prefix="weather-bench-"))
+	saved_dir, forecasting.LSTM_MODEL_DIR = forecasting.LSTM_MODEL_DIR, model_dir
+	results: List[dict] = []
+	started = time.time()
+	try:
+		for case in _cases(model_dir):
+			if only and not any(fnmatch.fnmatch(case.name, pattern) for pattern in only):
+				continue
+			if case.requires and backends.load(case.requires) is None:
+				results.append({"case": case.name, "days": None, "skipped": f"{case.requires} unavailable"})
+				progress(results[-1])
+				continue
+			n = heavy_repeat if case.heavy else repeat
+			if not case.heavy:
+				case.prepare(days[0] if case.sized and days else None)()  # 预热
+			for d in (days if case.sized else [None]):
+				results.append(_measure(case, d, max(1, n), memory))
+				progress(results[-1])
+	finally:
+		forecasting.LSTM_MODEL_DIR = saved_dir
+		for path in model_dir.glob("*"):
+			path.unlink()
+		model_dir.rmdir()
+	return {
+		"meta": {
+			"started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+			"seconds": round(time.time() - started, 1),
+			"commit": _git_commit(),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"cpu_count": os.cpu_count(),
+			"arima_n_jobs": forecasting.ARIMA_N_JOBS,
+			"versions": _versions(),
+			"fixture": {"seed": FIXTURE_SEED, "end": FIXTURE_END, "forecast_days": FORECAST_DAYS},
+			"repeat": repeat,
+			"heavy_repeat": heavy_repeat,
+		},
+		"results": results,
+	}
+
+
+def _key(result: dict):
+	return result["case"], result.get("days")
+
+
+def compare(base: dict, new: dict, threshold: float = 0.1) -> List[dict]:
+	"""按 (用例, 天数) 对比两次运行的中位耗时；ratio = 新 / 旧，超过 1 + threshold 记为变慢。"""
+	old = {_key(r): r for r in base.get("results", []) if "median_ms" in r}
+	rows = []
+	for r in new.get("results", []):
+		prev = old.get(_key(r))
+		if prev is None or "median_ms" not in r:
+			continue
+		ratio = r["median_ms"] / prev["median_ms"] if prev["median_ms"] > 0 else float("inf")
+		status = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "same"
+		rows.append({
+			"case": r["case"], "days": r.get("days"),
+			"base_ms": prev["median_ms"], "new_ms": r["median_ms"], "ratio": round(ratio, 3),
+			"base_peak_kib": prev.get("peak_kib"), "new_peak_kib": r.get("peak_kib"), "status": status,
+		})
+	return rows
+
+
+def _format_result(r: dict) -> str:
+	days = "-" if r.get("days") is None else r["days"]
+	if "skipped" in r:
+		return f"{r['case']:<24} {days:>6}  skipped: {r['skipped']}"
+	peak = "-" if r.get("peak_kib") is None else f"{r['peak_kib']:.1f}"
+	return f"{r['case']:<24} {days:>6}  median {r['median_ms']:>11.3f} ms  min {r['min_ms']:>11.3f} ms  peak {peak:>10} KiB"
+
+
+def _format_compare(row: dict) -> str:
+	days = "-" if row["days"] is None else row["days"]
+	return (
+		f"{row['case']:<24} {days:>6}  {row['base_ms']:>11.3f} -> {row['new_ms']:>11.3f} ms"
+		f"  x{row['ratio']:<6} {row['status']}"
+	)
+
+
+def _load(path: str) -> dict:
+	return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def _main(argv: Sequence[str]) -> int:
+	"""命令行：
+	python -m app.bench run [--days 30,365] [--only 'arima*'] [--repeat 5] [--heavy-repeat 2] [--no-memory] [--out 文件] [--baseline 旧结果]
+	python -m app.bench compare 旧结果.json 新结果.json [--threshold 0.1]
+	"""
+	parser = argparse.ArgumentParser(prog="python -m app.bench", description="预测/预警/推荐热点路径的离线基准")
+	sub = parser.add_subparsers(dest="command")
+	p_run = sub.add_parser("run", help="运行基准并保存 JSON 结果")
+	p_run.add_argument("--days", default=",".join(map(str, DEFAULT_DAYS)), help="历史长度（天），逗号分隔")
+	p_run.add_argument("--only", action="append", default=[], help="只运行匹配的用例（通配符，可重复）")
+	p_run.add_argument("--repeat", type=int, default=5)
+	p_run.add_argument("--heavy-repeat", type=int, default=2, help="阶数搜索、模型训练等耗时用例的重复次数")
+	p_run.add_argument("--no-memory", action="store_true", help="不测量峰值内存")
+	p_run.add_argument("--out", help=f"结果文件（默认 {BENCH_DIR}/bench-<时间>.json）")
+	p_run.add_argument("--baseline", help="与该结果文件对比")
+	p_run.add_argument("--threshold", type=float, default=0.1)
+	p_cmp = sub.add_parser("compare", help="对比两次运行结果")
+	p_cmp.add_argument("base")
+	p_cmp.add_argument("new")
+	p_cmp.add_argument("--threshold", type=float, default=0.1)
+	args = parser.parse_args(argv)
+
+	if args.command == "run":
+		days = [int(d) for d in args.days.split(",") if d.strip()]
+		out = run(days, args.only, args.repeat, args.heavy_repeat, not args.no_memory, lambda r: print(_format_result(r), flush=True))
+		path = Path(args.out) if args.out else BENCH_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+		path.parent.mkdir(parents=True, exist_ok=True)
+		path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+		print(f"-> {path}")
+		base = _load(args.baseline) if args.baseline else None
+		new = out
+	elif args.command == "compare":
+		base, new = _load(args.base), _load(args.new)
+	else:
+		parser.print_help()
+		return 2
+	if base is not None:
+		for row in compare(base, new, args.threshold):
+			print(_format_compare(row))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(_main(sys.argv[1:]))
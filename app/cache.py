@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import threading
+import time
+
+from .metrics import cache_result
+
+
+class TTLCache:
+	"""线程安全的 TTL + LRU 缓存。
+
+	- ttl 秒后条目过期（get 视为未命中）
+	- 超过 maxsize 时淘汰最久未使用的条目
+	- 每个条目可附带一个标签（如内容哈希），供 ETag 等校验使用
+	- 命中/未命中按 name 计入 weather_cache_requests_total
+	"""
+
+	def __init__(self, ttl: float, maxsize: int = 128, name: str = "cache"):
+		self.ttl = float(ttl)
+		self.maxsize = int(maxsize)
+		self.name = name
+		self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: Hashable, default: Any = None) -> Any:
+		with self._lock:
+			item = self._data.get(key)
+			if item is not None and item[0] <= time.monotonic():
+				del self._data[key]
+				item = None
+			if item is not None:
+				self._data.move_to_end(key)
+		cache_result(self.name, "miss" if item is None else "hit")
+		return default if item is None else item[1]
+
+	def get_stale(self, key: Hashable, record: bool = True) -> Optional[Tuple[Any, bool]]:
+		"""返回 (值, 是否未过期)；过期条目不删除，供 stale-while-revalidate 使用。
+
+		record=False 时不计入命中统计（用于同一次请求内的重复检查）。
+		"""
+		with self._lock:
+			item = self._data.get(key)
+			if item is not None:
+				self._data.move_to_end(key)
+		if item is None:
+			if record:
+				cache_result(self.name, "miss")
+			return None
+		expires_at, value, _ = item
+		fresh = expires_at > time.monotonic()
+		if record:
+			cache_result(self.name, "hit" if fresh else "stale")
+		return value, fresh
+
+	def tag(self, key: Hashable, fresh_only: bool = True) -> Optional[str]:
+		"""条目的标签；不存在（或 fresh_only 时已过期）返回 None。不影响 LRU 顺序。"""
+		with self._lock:
+			item = self._data.get(key)
+		if item is None or (fresh_only and item[0] <= time.monotonic()):
+			return None
+		return item[2]
+
+	def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, tag: Optional[str] = None) -> None:
+		expires_at = time.monotonic() + (self.ttl if ttl is None else float(ttl))
+		with self._lock:
+			self._data[key] = (expires_at, value, tag)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def pop(self, key: Hashable, default: Any = None) -> Any:
+		with self._lock:
+			item = self._data.pop(key, None)
+		return default if item is None else item[1]
+
+	def discard(self, predicate: Callable[[Hashable], bool]) -> int:
+		"""删除 predicate(key) 为真的全部条目，返回删除的条目数。"""
+		with self._lock:
+			keys = [key for key in self._data if predicate(key)]
+			for key in keys:
+				del self._data[key]
+		return len(keys)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self) -> int:
+		with self._lock:
+			return len(self._data)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# 已加载城市数据的内存上限（字节，默认 64 MiB）；90 天的城市约 4 KiB，单个 worker 可常驻上万个城市
+CITY_STORE_BUDGET = int(os.environ.get("CITY_STORE_BUDGET", "") or 64 * 1024 * 1024)
+# 超出预算时在最久未使用的这么多个城市中挑选淘汰对象
+CITY_STORE_EVICT_SAMPLE = int(os.environ.get("CITY_STORE_EVICT_SAMPLE", "8"))
+
+# 每个条目除数组外的固定开销估计（字典、元数据等 Python 对象）
+_ENTRY_OVERHEAD = 1024
+# float32 约 7 位有效数字：还原时四舍五入到该小数位数，上游 1～2 位小数的数据可精确恢复
+_DECIMALS = 4
+
+
+def _compact_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+	"""按列转为紧凑数组：数值列 float32，日期列 datetime64[D]，其余列保持原样。"""
+	columns: Dict[str, np.ndarray] = {}
+	for name in df.columns:
+		values = df[name].to_numpy()
+		if np.issubdtype(values.dtype, np.datetime64):
+			values = values.astype("datetime64[D]")
+		elif values.dtype.kind in "fiub":
+			values = values.astype(np.float32)
+		columns[name] = values
+	return columns
+
+
+def _frame(columns: Dict[str, np.ndarray]) -> pd.DataFrame:
+	"""从紧凑数组还原 DataFrame（数值列为 float64、日期列为 datetime64[ns]，与加载时的结构一致）。"""
+	data = {}
+	for name, values in columns.items():
+		if values.dtype == np.float32:
+			values = np.round(values.astype(np.float64), _DECIMALS)
+		elif np.issubdtype(values.dtype, np.datetime64):
+			values = values.astype("datetime64[ns]")
+		data[name] = values
+	return pd.DataFrame(data, copy=False)
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+	"""按存储精度（float32）往返一次的副本；数据版本应在此之后计算，才与之后从存储读出的数据一致。"""
+	return _frame(_compact_columns(df))
+
+
+class CityEntry:
+	__slots__ = ("columns", "source", "version", "loaded_at", "nbytes", "last_used")
+
+	def __init__(self, columns: Dict[str, np.ndarray], source: str, version: str):
+		self.columns = columns
+		self.source = source
+		self.version = version
+		self.loaded_at = time.time()
+		self.nbytes = _ENTRY_OVERHEAD + sum(int(v.nbytes) for v in columns.values())
+		self.last_used = time.monotonic()
+
+	def frame(self) -> pd.DataFrame:
+		return _frame(self.columns)
+
+	def latest_date(self) -> Optional[pd.Timestamp]:
+		dates = self.columns.get("date")
+		if dates is None or not len(dates):
+			return None
+		return pd.Timestamp(dates.max())
+
+
+class CityStore:
+	"""按内存预算（字节）而不是条目数限制的城市数据存储，线程安全。
+
+	- 每个城市保存为紧凑的列式数组（数值 float32），读取时还原为 DataFrame
+	- 超出预算时在最久未使用的若干城市中，优先淘汰“闲置时间 × 占用字节”最大的
+	- 刚写入的城市不会被淘汰（单个城市超出预算时也保留）
+	"""
+
+	def __init__(self, budget: int = CITY_STORE_BUDGET, evict_sample: int = CITY_STORE_EVICT_SAMPLE):
+		self.budget = max(0, int(budget))
+		self.evict_sample = max(1, int(evict_sample))
+		self._data: "OrderedDict[str, CityEntry]" = OrderedDict()
+		self._bytes = 0
+		self._evictions = 0
+		self._lock = threading.Lock()
+
+	def get(self, city: str) -> Optional[pd.DataFrame]:
+		"""城市数据（每次返回新还原的 DataFrame）；不存在时返回 None。"""
+		with self._lock:
+			entry = self._data.get(city)
+			if entry is None:
+				return None
+			self._data.move_to_end(city)
+			entry.last_used = time.monotonic()
+		return entry.frame()
+
+	def peek(self, city: str) -> Optional[CityEntry]:
+		"""条目元数据（来源、版本等），不影响 LRU 顺序。"""
+		with self._lock:
+			return self._data.get(city)
+
+	def put(self, city: str, df: pd.DataFrame, source: str, version: str) -> None:
+		entry = CityEntry(_compact_columns(df), source, version)
+		with self._lock:
+			old = self._data.pop(city, None)
+			if old is not None:
+				self._bytes -= old.nbytes
+			self._data[city] = entry
+			self._bytes += entry.nbytes
+			self._evict(keep=city)
+
+	def _evict(self, keep: str) -> None:
+		now = time.monotonic()
+		while self._bytes > self.budget and len(self._data) > 1:
+			candidates: List[Tuple[float, str]] = []
+			for city, entry in self._data.items():
+				if city == keep:
+					continue
+				candidates.append(((now - entry.last_used + 1.0) * entry.nbytes, city))
+				if len(candidates) >= self.evict_sample:
+					break
+			_, victim = max(candidates)
+			self._bytes -= self._data.pop(victim).nbytes
+			self._evictions += 1
+
+	def pop(self, city: str) -> Optional[CityEntry]:
+		"""移除单个城市，返回其条目（不存在时返回 None）。"""
+		with self._lock:
+			entry = self._data.pop(city, None)
+			if entry is not None:
+				self._bytes -= entry.nbytes
+			return entry
+
+	def items(self) -> List[Tuple[str, CityEntry]]:
+		with self._lock:
+			return list(self._data.items())
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+			self._bytes = 0
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"cities": len(self._data),
+				"bytes": self._bytes,
+				"budget": self.budget,
+				"evictions": self._evictions,
+			}
+
+	def __contains__(self, city: str) -> bool:
+		with self._lock:
+			return city in self._data
+
+	def __len__(self) -> int:
+		with self._lock:
+			return len(self._data)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+
+def _default_workers() -> int:
+	cpus = os.cpu_count() or 1
+	return min(4, cpus) if cpus > 1 else 0
+
+
+# 模型计算（ARIMA/LSTM 拟合、预警模型训练）使用的进程数；0 表示在请求线程内计算（仍受下面的排队与并发限制）
+COMPUTE_WORKERS = int(os.environ.get("COMPUTE_WORKERS", "") or _default_workers())
+# 排队 + 执行中的计算任务上限，超出时请求直接返回 503
+COMPUTE_QUEUE_SIZE = int(os.environ.get("COMPUTE_QUEUE_SIZE", "") or max(4, 4 * max(COMPUTE_WORKERS, 1)))
+# 等待阶段并发名额的最长时间（秒），超时返回 503
+COMPUTE_QUEUE_TIMEOUT = float(os.environ.get("COMPUTE_QUEUE_TIMEOUT", "10"))
+# 各阶段同时执行的任务数上限，如 "forecast=2,alerts=1"；未列出的阶段为 max(1, COMPUTE_WORKERS)
+COMPUTE_STAGE_LIMITS = os.environ.get("COMPUTE_STAGE_LIMITS", "")
+# 后台任务（预计算、过期重算）同时占用的计算名额上限；后台任务不计入 COMPUTE_QUEUE_SIZE
+COMPUTE_BACKGROUND_SLOTS = int(os.environ.get("COMPUTE_BACKGROUND_SLOTS", "1"))
+# 拒绝时建议客户端的重试间隔（秒）
+COMPUTE_RETRY_AFTER = int(os.environ.get("COMPUTE_RETRY_AFTER", "5"))
+
+_TASKS = metrics.gauge("weather_compute_tasks", "计算任务数（state: queued 排队 / running 执行中）", ("stage", "state"))
+_REJECTED = metrics.counter("weather_compute_rejected_total", "被拒绝的计算任务数（reason: queue_full / timeout）", ("stage", "reason"))
+_WAIT_SECONDS = metrics.histogram("weather_compute_wait_seconds", "计算任务排队等待时间（秒）", ("stage",))
+_RUN_SECONDS = metrics.histogram("weather_compute_seconds", "计算任务执行时间（秒，含进程间传输）", ("stage",))
+
+
+class ComputeSaturated(RuntimeError):
+	"""计算队列已满或排队超时，请求应以 503 + Retry-After 拒绝。"""
+
+	def __init__(self, message: str, retry_after: int = COMPUTE_RETRY_AFTER):
+		super().__init__(message)
+		self.retry_after = retry_after
+
+
+def _parse_limits(text: str) -> Dict[str, int]:
+	limits = {}
+	for part in text.split(","):
+		name, _, value = part.partition("=")
+		if name.strip() and value.strip():
+			limits[name.strip()] = max(1, int(value))
+	return limits
+
+
+_local = threading.local()
+
+
+@contextmanager
+def background() -> Iterator[None]:
+	"""后台任务（预计算、过期重算）：不计入、也不受队列上限拒绝，排队时一直等待名额；同时执行数受 COMPUTE_BACKGROUND_SLOTS 限制。"""
+	previous = getattr(_local, "background", False)
+	_local.background = True
+	try:
+		yield
+	finally:
+		_local.background = previous
+
+
+def _call_with_metrics(fn: Callable[..., Any], *args) -> Tuple[Any, dict]:
+	"""在计算进程中执行任务，连同该进程累计的阶段耗时与缓存计数增量（metrics.drain）一起返回。
+
+	任务抛出异常时增量留在进程内，随该进程的下一个任务带回。
+	"""
+	result = fn(*args)
+	return result, metrics.drain()
+
+
+def _init_worker() -> None:
+	os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+	os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+	from . import forecasting
+
+	# 进程池已提供并行，worker 内的阶数搜索串行执行，避免嵌套进程
+	forecasting.ARIMA_N_JOBS = 1
+
+
+class ComputeTier:
+	"""CPU 密集计算的执行层：有界队列 + 每阶段并发上限 + 进程池。
+
+	调用方在自己的线程里阻塞等待结果；队列已满时立即拒绝，等待名额超时同样拒绝（后台任务除外）。
+	后台任务另有独立的名额（background_slots），不占用面向请求的队列上限，最多同时占用这么多个阶段并发名额。
+	workers 为 0 时在调用线程内执行，排队与并发限制不变。
+	"""
+
+	def __init__(
+		self,
+		workers: int = COMPUTE_WORKERS,
+		queue_size: int = COMPUTE_QUEUE_SIZE,
+		queue_timeout: float = COMPUTE_QUEUE_TIMEOUT,
+		limits: Optional[Dict[str, int]] = None,
+		background_slots: int = COMPUTE_BACKGROUND_SLOTS,
+	):
+		self.workers = max(0, int(workers))
+		self.queue_size = max(1, int(queue_size))
+		self.queue_timeout = float(queue_timeout)
+		self.limits = dict(limits if limits is not None else _parse_limits(COMPUTE_STAGE_LIMITS))
+		self._slots: Dict[str, threading.BoundedSemaphore] = {}
+		self._queued: Dict[str, int] = {}
+		self._running: Dict[str, int] = {}
+		self._pending = 0
+		self._background = 0
+		self._background_slots = threading.BoundedSemaphore(max(1, int(background_slots)))
+		self._lock = threading.Lock()
+		self._pool: Optional[ProcessPoolExecutor] = None
+		self._pool_lock = threading.Lock()
+
+	def _slot(self, stage: str) -> threading.BoundedSemaphore:
+		with self._lock:
+			slot = self._slots.get(stage)
+			if slot is None:
+				slot = self._slots[stage] = threading.BoundedSemaphore(self.limits.get(stage, max(1, self.workers)))
+			return slot
+
+	def _get_pool(self) -> ProcessPoolExecutor:
+		with self._pool_lock:
+			if self._pool is None:
+				# spawn：避免 fork 继承后台线程与 TensorFlow 状态
+				self._pool = ProcessPoolExecutor(
+					max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+				)
+			return self._pool
+
+	def _reset_pool(self, broken: ProcessPoolExecutor) -> None:
+		with self._pool_lock:
+			if self._pool is broken:
+				self._pool = None
+		broken.shutdown(wait=False, cancel_futures=True)
+
+	def _execute(self, fn: Callable[..., Any], args: tuple) -> Any:
+		if self.workers == 0:
+			return fn(*args)
+		pool = self._get_pool()
+		try:
+			result, snapshot = pool.submit(_call_with_metrics, fn, *args).result()
+		except BrokenProcessPool:
+			# worker 异常退出（如内存不足被杀）：重建进程池并重试一次
+			self._reset_pool(pool)
+			result, snapshot = self._get_pool().submit(_call_with_metrics, fn, *args).result()
+		# 计算进程内的阶段耗时与模型缓存命中计入本进程的 /api/metrics
+		metrics.merge(snapshot)
+		return result
+
+	def _count(self, table: Dict[str, int], stage: str, delta: int) -> None:
+		with self._lock:
+			table[stage] = table.get(stage, 0) + delta
+
+	def run(self, stage: str, fn: Callable[..., Any], *args) -> Any:
+		"""在计算层执行 fn(*args)（进程池模式下 fn 与参数需可 pickle），返回其结果。"""
+		if getattr(_local, "background", False):
+			return self._run_background(stage, fn, args)
+		with self._lock:
+			if self._pending >= self.queue_size:
+				_REJECTED.inc(stage=stage, reason="queue_full")
+				raise ComputeSaturated(f"计算队列已满（{self._pending}/{self.queue_size}）")
+			self._pending += 1
+		try:
+			return self._run_slot(stage, fn, args, timeout=self.queue_timeout)
+		finally:
+			with self._lock:
+				self._pending -= 1
+
+	def _run_background(self, stage: str, fn: Callable[..., Any], args: tuple) -> Any:
+		with self._lock:
+			self._background += 1
+		try:
+			with self._background_slots:
+				return self._run_slot(stage, fn, args, timeout=None)
+		finally:
+			with self._lock:
+				self._background -= 1
+
+	def _run_slot(self, stage: str, fn: Callable[..., Any], args: tuple, timeout: Optional[float]) -> Any:
+		slot = self._slot(stage)
+		self._count(self._queued, stage, 1)
+		t0 = time.perf_counter()
+		try:
+			acquired = slot.acquire() if timeout is None else slot.acquire(timeout=timeout)
+		finally:
+			self._count(self._queued, stage, -1)
+		_WAIT_SECONDS.observe(time.perf_counter() - t0, stage=stage)
+		if not acquired:
+			_REJECTED.inc(stage=stage, reason="timeout")
+			raise ComputeSaturated(f"{stage} 排队超过 {self.queue_timeout:g} 秒")
+		self._count(self._running, stage, 1)
+		try:
+			with _RUN_SECONDS.time(stage=stage):
+				return self._execute(fn, args)
+		finally:
+			self._count(self._running, stage, -1)
+			slot.release()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"workers": self.workers,
+				"queue_size": self.queue_size,
+				"pending": self._pending,
+				"background": self._background,
+				"queued": dict(self._queued),
+				"running": dict(self._running),
+			}
+
+	def shutdown(self) -> None:
+		with self._pool_lock:
+			pool, self._pool = self._pool, None
+		if pool is not None:
+			pool.shutdown(wait=False, cancel_futures=True)
+
+
+tier = ComputeTier()
+
+
+def _collect_metrics() -> None:
+	stats = tier.stats()
+	for state in ("queued", "running"):
+		for stage, n in stats[state].items():
+			_TASKS.set(n, stage=stage, state=state)
+
+
+metrics.register_collector(_collect_metrics)
+
+
+# 以下为在计算进程中执行的任务（模块级函数，可被 pickle）
+
+def _local_models(
+	df: pd.DataFrame, days: int, city: str, orders: dict, engine: str,
+) -> Tuple[np.ndarray, np.ndarray, dict]:
+	from . import forecasting
+
+	forecasting.remember_arima_orders(orders)
+	temp_model, prec_local = forecasting.local_model_forecast(df, days, city, engine)
+	return temp_model, prec_local, forecasting.arima_orders(city)
+
+
+def _alerts(df: pd.DataFrame, forecast_list: List[dict], cache_key) -> List[dict]:
+	from .alerts import generate_alerts
+
+	return generate_alerts(df, forecast_list, cache_key=cache_key)
+
+
+def forecast(df: pd.DataFrame, days: int, city: str, external=None, engine: Optional[str] = None) -> List[dict]:
+	"""在计算层拟合本地模型，外部预测在本进程中并行拉取，最后在本进程融合。
+
+	engine=fast 的计算不到一毫秒，直接在本线程执行，不经过队列（计算层饱和时仍可用）。
+	"""
+	from . import forecasting
+
+	engine = engine or forecasting.FORECAST_ENGINE
+	if engine == "fast":
+		return forecasting.forecast_temperature_and_precipitation(df, days, city, external, engine)
+	if external is None:
+		try:
+			external = forecasting.prefetch_open_meteo_forecast(days, city)
+		except Exception:
+			external = None
+	temp_model, prec_local, orders = tier.run(
+		"forecast", _local_models, df, days, city, forecasting.arima_orders(city), engine,
+	)
+	# 同步计算进程选定的阶数，下次无论分配到哪个进程都可跳过阶数搜索
+	forecasting.remember_arima_orders(orders)
+	return forecasting.fuse_with_external(df, temp_model, prec_local, external, days)
+
+
+def alerts(df: pd.DataFrame, forecast_list: List[dict], cache_key=None) -> List[dict]:
+	return tier.run("alerts", _alerts, df, forecast_list, cache_key)
+
+
+def shutdown() -> None:
+	tier.shutdown()
@@ -2,18 +2,56 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
+import hashlib
+import os
+import time
 import numpy as np
 import pandas as pd
-import requests
-import time
+from urllib.parse import quote
+
+from . import gazetteer, history_store, metrics
+from .city_store import CITY_STORE_BUDGET, CityStore, compact
+from .metrics import CITY_LOAD_SECONDS, cache_result
+from .singleflight import SingleFlight
+from .upstream import get_json, get_json_many
 
 ROOT = Path(__file__).resolve().parent.parent
 DATA_FILE = ROOT / "weather_prediction_dataset.csv"
 
-# 数据来源标记（open-meteo-recent / open-meteo-archive / csv / synthetic）
-LAST_SOURCE: str = "unknown"
+# 按城市的数据存储（按内存预算淘汰，见 app.city_store），支持单个城市重新拉取而不影响其他城市
+# 来源：open-meteo-recent / open-meteo-archive / history-store / csv / synthetic
+_CITY_STORE = CityStore(CITY_STORE_BUDGET)
+
+# 只能退化到这些来源时，不覆盖已缓存的 API 数据
+_FALLBACK_SOURCES = ("history-store", "csv", "synthetic")
+
+# 从本地历史库返回给模型的天数窗口（与近 90 天接口保持一致）
+HISTORY_WINDOW_DAYS = int(os.environ.get("HISTORY_WINDOW_DAYS", "90"))
+
+# Open‑Meteo 接口地址：OPEN_METEO_BASE_URL 一次性指向本地替身（如 http://127.0.0.1:8090，见 app.openmeteo_stub），
+# 也可分别覆盖预测 / 归档 / 地理编码接口
+OPEN_METEO_BASE_URL = os.environ.get("OPEN_METEO_BASE_URL", "").rstrip("/")
+OPEN_METEO_FORECAST_URL = os.environ.get(
+	"OPEN_METEO_FORECAST_URL",
+	f"{OPEN_METEO_BASE_URL}/v1/forecast" if OPEN_METEO_BASE_URL else "https://api.open-meteo.com/v1/forecast",
+)
+OPEN_METEO_ARCHIVE_URL = os.environ.get(
+	"OPEN_METEO_ARCHIVE_URL",
+	f"{OPEN_METEO_BASE_URL}/v1/era5" if OPEN_METEO_BASE_URL else "https://archive-api.open-meteo.com/v1/era5",
+)
+OPEN_METEO_GEOCODING_URL = os.environ.get(
+	"OPEN_METEO_GEOCODING_URL",
+	f"{OPEN_METEO_BASE_URL}/v1/search" if OPEN_METEO_BASE_URL else "https://geocoding-api.open-meteo.com/v1/search",
+)
+
+# 同一城市的并发冷加载/地理编码只执行一次，其余请求等待其结果
+_LOADS = SingleFlight("city-load")
+_GEOCODES = SingleFlight("geocode")
+
+# refresh_data 触发后需要一并失效的下游缓存（如预测缓存）
+_REFRESH_HOOKS: List[Callable[[str], None]] = []
 
 # 常用城市坐标（可扩展）
 CITY_COORDS = {
@@ -38,7 +76,7 @@ CITY_COORDS = {
 
 
 def _geocode_city(name: str) -> Optional[Tuple[float, float]]:
-	"""使用 Open-Meteo 地理编码将任意城市名称解析为坐标（缓存）。
+	"""使用 Open-Meteo 地理编码将任意城市名称解析为坐标（本地地名表无法解析时的兜底，结果落盘）。
 
 	- 仅保留中国结果（country_code == 'CN'）
 	- 支持在名称后追加省份提示（如 "南阳,河南"）以精确匹配
@@ -51,11 +89,11 @@ def _geocode_city(name: str) -> Optional[Tuple[float, float]]:
 		admin_hint = parts[1].strip() if len(parts) > 1 else ""
 
 		url = (
-			"https://geocoding-api.open-meteo.com/v1/search?name="
-			+ requests.utils.quote(query)
+			OPEN_METEO_GEOCODING_URL + "?name="
+			+ quote(query)
 			+ "&count=10&language=zh"
 		)
-		items = _http_get_json(url, timeout=15, retries=2).get("results") or []
+		items = get_json(url, timeout=15, retries=2).get("results") or []
 		if not items:
 			return None
 
@@ -71,7 +109,9 @@ def _geocode_city(name: str) -> Optional[Tuple[float, float]]:
 		rank = {"PPLC": 5, "PPLA": 4, "PPLA2": 4, "PPLA3": 4, "PPLA4": 4, "PPL": 3}
 		items.sort(key=lambda it: (rank.get((it.get("feature_code") or "").upper(), 1), int(it.get("population") or 0)), reverse=True)
 		top = items[0]
-		return float(top.get("latitude")), float(top.get("longitude"))
+		coords = float(top.get("latitude")), float(top.get("longitude"))
+		gazetteer.remember(raw, *coords)
+		return coords
 	except Exception:
 		return None
 
@@ -81,8 +121,12 @@ def _coords_for(city: str) -> Tuple[float, float]:
 	name = (city or "北京").strip()
 	if name in CITY_COORDS:
 		return CITY_COORDS[name]
-	# 若不在内置表，尝试地理编码（支持中文/拼音/英文）
-	coords = _geocode_city(name)
+	# 本地地名表（中文/拼音，含已落盘的远程结果），无需网络
+	coords = gazetteer.resolve(name)
+	if coords:
+		return coords
+	# 最后才访问远程地理编码（支持英文等其他写法）
+	coords = _GEOCODES.do(name, lambda: _geocode_city(name))
 	if coords:
 		return coords
 	# default
@@ -94,37 +138,52 @@ def get_city_coords(city: str) -> Tuple[float, float]:
 	return _coords_for(city)
 
 
-def _fetch_open_meteo_recent(lat: float, lon: float, past_days: int = 90) -> Optional[pd.DataFrame]:
-	"""使用 forecast 接口的 past_days 获取近90天左右的历史与未来预测更一致的数据。"""
+_DAILY_VARS = "temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max,relative_humidity_2m_mean"
+
+# 批量接口单次请求的最多城市数
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "50"))
+
+
+def _parse_daily(d: dict) -> Optional[pd.DataFrame]:
+	"""将 Open‑Meteo 的 daily 字段解析为统一列名的 DataFrame。"""
+	times = d.get("time", [])
+	if not times:
+		return None
+	tmax = np.asarray(d.get("temperature_2m_max", []), dtype=float)
+	tmin = np.asarray(d.get("temperature_2m_min", []), dtype=float)
+	prec = np.asarray(d.get("precipitation_sum", []), dtype=float)
+	wind_kmh = np.asarray(d.get("windspeed_10m_max", []), dtype=float)
+	hum = np.asarray(d.get("relative_humidity_2m_mean", []), dtype=float)
+	tavg = (tmax + tmin) / 2.0
+	wind_ms = wind_kmh / 3.6
+	return pd.DataFrame({
+		"date": pd.to_datetime(times),
+		"temperature_c": tavg,
+		"tmin": tmin,
+		"tmax": tmax,
+		"precipitation_mm": prec,
+		"humidity": hum if hum.size else [60.0] * len(times),
+		"wind_speed_ms": wind_ms if wind_ms.size else [3.0] * len(times),
+	})
+
+
+def _recent_url(lat, lon, past_days: int) -> str:
 	past_days = int(max(1, min(past_days, 92)))
-	url = (
-		"https://api.open-meteo.com/v1/forecast"
+	return (
+		OPEN_METEO_FORECAST_URL +
 		f"?latitude={lat}&longitude={lon}"
 		"&past_days=" + str(past_days) +
-		"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max,relative_humidity_2m_mean"
+		# 只要已观测的日期，未来的预测日不能当作历史落盘
+		"&forecast_days=0" +
+		"&daily=" + _DAILY_VARS +
 		"&timezone=Asia%2FShanghai"
 	)
+
+
+def _fetch_open_meteo_recent(lat: float, lon: float, past_days: int = 90) -> Optional[pd.DataFrame]:
+	"""使用 forecast 接口的 past_days 获取近90天左右的历史与未来预测更一致的数据。"""
 	try:
-		d = _http_get_json(url, timeout=30, retries=2).get("daily", {})
-		times = d.get("time", [])
-		if not times:
-			return None
-		tmax = np.asarray(d.get("temperature_2m_max", []), dtype=float)
-		tmin = np.asarray(d.get("temperature_2m_min", []), dtype=float)
-		prec = np.asarray(d.get("precipitation_sum", []), dtype=float)
-		wind_kmh = np.asarray(d.get("windspeed_10m_max", []), dtype=float)
-		hum = np.asarray(d.get("relative_humidity_2m_mean", []), dtype=float)
-		tavg = (tmax + tmin) / 2.0
-		wind_ms = wind_kmh / 3.6
-		return pd.DataFrame({
-			"date": pd.to_datetime(times),
-			"temperature_c": tavg,
-			"tmin": tmin,
-			"tmax": tmax,
-			"precipitation_mm": prec,
-			"humidity": hum if hum.size else [60.0] * len(times),
-			"wind_speed_ms": wind_ms if wind_ms.size else [3.0] * len(times),
-		})
+		return _parse_daily(get_json(_recent_url(lat, lon, past_days), timeout=30, retries=2).get("daily", {}))
 	except Exception:
 		return None
 
@@ -132,56 +191,144 @@ def _fetch_open_meteo_recent(lat: float, lon: float, past_days: int = 90) -> Opt
 def _fetch_open_meteo_daily(lat: float, lon: float, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
 	"""从 Open-Meteo 归档拉取日度数据。"""
 	url = (
-		"https://archive-api.open-meteo.com/v1/era5"
+		OPEN_METEO_ARCHIVE_URL +
 		f"?latitude={lat}&longitude={lon}"
 		"&start_date=" + start_date + "&end_date=" + end_date +
-		"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max,relative_humidity_2m_mean"
+		"&daily=" + _DAILY_VARS +
 		"&timezone=Asia%2FShanghai"
 	)
 	try:
-		daily = _http_get_json(url, timeout=30, retries=2).get("daily", {})
-		dates = daily.get("time", [])
-		if not dates:
-			return None
-		tmax = np.asarray(daily.get("temperature_2m_max", []), dtype=float)
-		tmin = np.asarray(daily.get("temperature_2m_min", []), dtype=float)
-		prec = np.asarray(daily.get("precipitation_sum", []), dtype=float)
-		wind = np.asarray(daily.get("windspeed_10m_max", []), dtype=float)
-		hum = np.asarray(daily.get("relative_humidity_2m_mean", []), dtype=float)
-		tavg = (tmax + tmin) / 2.0
-		wind_ms = wind / 3.6
-		return pd.DataFrame({
-			"date": pd.to_datetime(dates),
-			"temperature_c": tavg,
-			"tmin": tmin,
-			"tmax": tmax,
-			"precipitation_mm": prec,
-			"humidity": hum if hum.size else [60.0] * len(dates),
-			"wind_speed_ms": wind_ms if wind_ms.size else [3.0] * len(dates),
-		})
+		return _parse_daily(get_json(url, timeout=30, retries=2).get("daily", {}))
 	except Exception:
 		return None
 
 
-@lru_cache(maxsize=12)
-def load_city_weather(city: str = "北京") -> pd.DataFrame:
-	"""加载指定城市的历史天气数据。优先 API，其次本地 CSV，最后合成。"""
-	global LAST_SOURCE
+def split_multi_location(js, count: int) -> List[dict]:
+	"""Open‑Meteo 多坐标请求返回数组（单坐标时为对象），统一拆成长度为 count 的列表。"""
+	if isinstance(js, list):
+		items = [it if isinstance(it, dict) else {} for it in js]
+	elif isinstance(js, dict) and js:
+		items = [js]
+	else:
+		items = []
+	if len(items) != count:
+		return [{} for _ in range(count)]
+	return items
+
+
+def _fetch_open_meteo_recent_bulk(coords: Sequence[Tuple[float, float]], past_days: int = 90) -> List[Optional[pd.DataFrame]]:
+	"""一次请求拉取多个坐标的近期数据（按 BULK_CHUNK_SIZE 分片并发），按输入顺序返回。"""
+	chunks = [list(coords[i:i + BULK_CHUNK_SIZE]) for i in range(0, len(coords), BULK_CHUNK_SIZE)]
+	urls = [
+		_recent_url(",".join(str(c[0]) for c in chunk), ",".join(str(c[1]) for c in chunk), past_days)
+		for chunk in chunks
+	]
+	frames: List[Optional[pd.DataFrame]] = []
+	for chunk, js in zip(chunks, get_json_many(urls, timeout=60, retries=2)):
+		for item in split_multi_location(js, len(chunk)):
+			try:
+				frames.append(_parse_daily(item.get("daily", {})))
+			except Exception:
+				frames.append(None)
+	return frames
+
+
+def _observed(df: pd.DataFrame) -> pd.DataFrame:
+	"""去掉今天之后的行（上游预测日），历史库与增量补拉只基于已观测的日期。"""
+	today = pd.Timestamp.today().normalize()
+	return df[pd.to_datetime(df["date"]) <= today].reset_index(drop=True)
+
+
+def _gap_days(df: pd.DataFrame) -> int:
+	"""最后一个已观测日期距今天的天数。"""
+	return int((pd.Timestamp.today().normalize() - pd.to_datetime(df["date"]).max()).days)
+
+
+def _load_stored(city: str) -> Optional[Tuple[pd.DataFrame, str, float]]:
+	"""读取本地历史库并剔除预测日（旧版本可能写入过）；没有已观测数据时视为不存在。"""
+	stored = history_store.load(city)
+	if stored is None:
+		return None
+	df = _observed(stored[0])
+	return (df, stored[1], stored[2]) if not df.empty else None
+
+
+def _history_window(df: pd.DataFrame) -> pd.DataFrame:
+	anchor = min(df["date"].max(), pd.Timestamp.today().normalize())
+	start = anchor - pd.Timedelta(days=HISTORY_WINDOW_DAYS)
+	return df[df["date"] >= start].reset_index(drop=True)
+
+
+def _load_from_store(city: str, lat: float, lon: float, force: bool = False) -> Optional[Tuple[pd.DataFrame, str]]:
+	"""从本地历史库加载，只向上游补拉最后日期之后的数据并合并落盘。"""
+	stored = _load_stored(city)
+	if stored is None:
+		cache_result("history_store", "miss")
+		return None
+	df_old, source, saved_at = stored
+	if not force and history_store.is_fresh(saved_at):
+		cache_result("history_store", "hit")
+		return _history_window(df_old), source
+	cache_result("history_store", "stale")
+
+	today = pd.Timestamp.today().normalize()
+	last = df_old["date"].max()
+	gap = _gap_days(df_old)
+	# 多补拉 2 天，覆盖上游对近期数据的修订
+	if gap > 90:
+		start_date = (last - pd.Timedelta(days=2)).date().isoformat()
+		df_new = _fetch_open_meteo_daily(lat, lon, start_date, today.date().isoformat())
+		new_source = "open-meteo-archive"
+	else:
+		df_new = _fetch_open_meteo_recent(lat, lon, max(gap, 0) + 2)
+		new_source = "open-meteo-recent"
+	if df_new is not None:
+		df_new = _observed(df_new)
+	if df_new is None or df_new.empty:
+		# 上游不可用：直接使用本地历史
+		return _history_window(df_old), "history-store"
+	merged = history_store.merge(df_old, df_new)
+	history_store.save(city, merged, new_source)
+	return _history_window(merged), new_source
+
+
+def _fetch_city_weather(city: str, force: bool = False) -> Tuple[pd.DataFrame, str]:
+	"""拉取指定城市的历史天气数据（不走内存缓存），返回 (数据, 来源)。
+
+	优先本地历史库 + 增量补拉，其次 API 全量，再次本地 CSV，最后合成。
+	force=True 时忽略历史库的新鲜度，总是向上游补拉最新数据。
+	"""
+	t0 = time.perf_counter()
+	df, source = _select_city_weather(city, force)
+	CITY_LOAD_SECONDS.observe(time.perf_counter() - t0, source=source)
+	return df, source
+
+
+def _select_city_weather(city: str, force: bool) -> Tuple[pd.DataFrame, str]:
 	lat, lon = _coords_for(city)
 
+	# 0) 本地历史库
+	stored = _load_from_store(city, lat, lon, force)
+	if stored is not None:
+		return stored
+
 	# 1) 近 90 天
 	df_recent = _fetch_open_meteo_recent(lat, lon, 90)
+	if df_recent is not None:
+		df_recent = _observed(df_recent)
 	if df_recent is not None and len(df_recent) >= 30:
-		LAST_SOURCE = "open-meteo-recent"
-		return df_recent.sort_values("date").reset_index(drop=True)
+		df_recent = df_recent.sort_values("date").reset_index(drop=True)
+		history_store.save(city, df_recent, "open-meteo-recent")
+		return df_recent, "open-meteo-recent"
 
 	# 2) 归档一年
 	end_date = pd.Timestamp.today().normalize().date().isoformat()
 	start_date = (pd.Timestamp.today().normalize() - pd.Timedelta(days=365)).date().isoformat()
 	df_api = _fetch_open_meteo_daily(lat, lon, start_date, end_date)
 	if df_api is not None:
-		LAST_SOURCE = "open-meteo-archive"
-		return df_api.sort_values("date").reset_index(drop=True)
+		df_api = df_api.sort_values("date").reset_index(drop=True)
+		history_store.save(city, df_api, "open-meteo-archive")
+		return df_api, "open-meteo-archive"
 
 	# 3) 本地 CSV 尝试（结构兼容）
 	if DATA_FILE.exists():
@@ -219,8 +366,7 @@ def load_city_weather(city: str = "北京") -> pd.DataFrame:
 						df[col] = default
 
 			if not need_synth:
-				LAST_SOURCE = "csv"
-				return df
+				return df, "csv"
 		except Exception:
 			pass
 
@@ -250,42 +396,203 @@ def load_city_weather(city: str = "北京") -> pd.DataFrame:
 		"humidity": hum,
 		"wind_speed_ms": wind,
 	})
-	LAST_SOURCE = "synthetic"
+	return df, "synthetic"
+
+
+def _publish_city_weather(city: str, df: pd.DataFrame, source: str) -> pd.DataFrame:
+	"""写入城市数据存储，返回按存储精度还原的数据（数据版本以它为准）。"""
+	df = compact(df)
+	_CITY_STORE.put(city, df, source, get_data_version(df))
 	return df
 
 
-def get_data_source() -> str:
-	return LAST_SOURCE
+def is_city_loaded(city: str) -> bool:
+	return city in _CITY_STORE
 
 
-def refresh_data(city: str = "北京") -> str:
-	"""清空缓存并重新拉取数据，返回新的数据来源标记。"""
-	global LAST_SOURCE
-	load_city_weather.cache_clear()
-	_ = load_city_weather(city)
-	return LAST_SOURCE
+def get_loaded_version(city: str) -> Optional[str]:
+	"""已在内存中的城市数据版本；未加载时返回 None（不触发加载）。"""
+	entry = _CITY_STORE.peek(city)
+	return entry.version if entry is not None else None
 
 
-# 兼容旧函数名
-@lru_cache(maxsize=1)
-def load_beijing_weather() -> pd.DataFrame:
-	return load_city_weather("北京")
+def load_city_weather(city: str = "北京") -> pd.DataFrame:
+	"""加载指定城市的历史天气数据（按内存预算缓存）。"""
+	df = _CITY_STORE.get(city)
+	cache_result("city", "miss" if df is None else "hit")
+	if df is not None:
+		return df
+	return _LOADS.do(city, lambda: _load_uncached(city))
+
 
+def _load_uncached(city: str) -> pd.DataFrame:
+	# 排队期间可能已由批量加载等其他路径写入缓存
+	df = _CITY_STORE.get(city)
+	if df is not None:
+		return df
+	df, source = _fetch_city_weather(city)
+	return _publish_city_weather(city, df, source)
 
-# --- HTTP 重试辅助 ---
-def _http_get_json(url: str, timeout: float = 15.0, retries: int = 2, backoff_base: float = 0.5) -> dict:
-	"""GET 并返回 JSON，带指数退避的轻量重试。失败返回空 dict。
 
-	- retries 表示额外重试次数（总尝试=1+retries）
-	- backoff 形如 0.5, 1.0, 2.0 ... 秒
+def load_cities_weather(cities: Sequence[str]) -> Dict[str, pd.DataFrame]:
+	"""批量加载多个城市的历史数据。
+
+	已缓存或本地历史库新鲜的城市直接返回；其余城市合并为少量多坐标请求，
+	拆分后与本地历史库合并落盘；批量请求失败的城市再逐个走 load_city_weather。
+	"""
+	result: Dict[str, pd.DataFrame] = {}
+	pending: List[Tuple[str, Optional[Tuple[pd.DataFrame, str, float]]]] = []
+	for city in dict.fromkeys(cities):
+		df = _CITY_STORE.get(city)
+		cache_result("city", "miss" if df is None else "hit")
+		if df is not None:
+			result[city] = df
+			continue
+		stored = _load_stored(city)
+		if stored is not None and history_store.is_fresh(stored[2]):
+			result[city] = _publish_city_weather(city, _history_window(stored[0]), stored[1])
+			continue
+		pending.append((city, stored))
+
+	if pending:
+		if all(stored is not None for _, stored in pending):
+			gap = max(_gap_days(stored[0]) for _, stored in pending)
+			past_days = max(gap, 0) + 2
+		else:
+			past_days = 90
+		frames = _fetch_open_meteo_recent_bulk([_coords_for(city) for city, _ in pending], past_days)
+		for (city, stored), df_new in zip(pending, frames):
+			if df_new is not None:
+				df_new = _observed(df_new)
+			if df_new is None or df_new.empty or (stored is None and len(df_new) < 30):
+				result[city] = load_city_weather(city)
+				continue
+			df_new = df_new.sort_values("date").reset_index(drop=True)
+			merged = history_store.merge(stored[0], df_new) if stored is not None else df_new
+			history_store.save(city, merged, "open-meteo-recent")
+			df = _history_window(merged) if stored is not None else df_new
+			result[city] = _publish_city_weather(city, df, "open-meteo-recent")
+	return {city: result[city] for city in dict.fromkeys(cities)}
+
+
+def reload_city_weather(city: str, prepare: Optional[Callable[[pd.DataFrame], None]] = None) -> pd.DataFrame:
+	"""重新拉取单个城市的数据并替换缓存，返回当前生效的数据。
+
+	- 拉取与 prepare(df)（如预先计算预测）完成前，读请求仍拿到旧数据
+	- 若新数据只能退化到 csv/合成而旧数据来自 API，则保留旧数据
 	"""
-	for attempt in range(retries + 1):
+	old = _CITY_STORE.peek(city)
+	df, source = _fetch_city_weather(city, force=True)
+	if old is not None and source in _FALLBACK_SOURCES and old.source not in _FALLBACK_SOURCES:
+		return old.frame()
+	# 预先计算使用与存储相同精度的数据，数据版本与之后读出的一致
+	df = compact(df)
+	if prepare is not None:
+		prepare(df)
+	return _publish_city_weather(city, df, source)
+
+
+def reload_stored_city_weather(city: str, prepare: Optional[Callable[[pd.DataFrame], None]] = None) -> Optional[pd.DataFrame]:
+	"""只从本地历史库（可能由其他 worker 写入）重新加载城市数据，不访问上游；库中没有该城市时返回 None。
+
+	数据版本未变时直接返回当前数据；否则与 reload_city_weather 一样先 prepare(df) 再替换。
+	"""
+	stored = _load_stored(city)
+	if stored is None:
+		return None
+	df = compact(_history_window(stored[0]))
+	entry = _CITY_STORE.peek(city)
+	if entry is not None and entry.version == get_data_version(df):
+		return entry.frame()
+	if prepare is not None:
+		prepare(df)
+	return _publish_city_weather(city, df, stored[1])
+
+
+def get_data_source(city: str) -> str:
+	"""城市当前数据的来源；未加载时返回 unknown。"""
+	entry = _CITY_STORE.peek(city)
+	return entry.source if entry is not None else "unknown"
+
+
+def city_metadata() -> Dict[str, dict]:
+	"""已加载城市的来源与新鲜度：数据版本、加载时间、最新数据日期及其距今天数。"""
+	now = time.time()
+	today = pd.Timestamp.today().normalize()
+	out: Dict[str, dict] = {}
+	for city, entry in _CITY_STORE.items():
+		latest = entry.latest_date()
+		out[city] = {
+			"source": entry.source,
+			"version": entry.version,
+			"loaded_at": entry.loaded_at,
+			"age_seconds": round(now - entry.loaded_at, 3),
+			"latest_date": latest.date().isoformat() if latest is not None else None,
+			"lag_days": int((today - latest.normalize()).days) if latest is not None else None,
+		}
+	return out
+
+
+def get_data_version(df: pd.DataFrame) -> str:
+	"""数据版本：对历史数据内容做哈希，内容不变则版本不变。"""
+	digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+	return digest.hexdigest()[:12]
+
+
+def register_refresh_hook(hook: Callable[[str], None]) -> None:
+	"""注册 refresh_data 时的回调，参数为被刷新的城市名。"""
+	if hook not in _REFRESH_HOOKS:
+		_REFRESH_HOOKS.append(hook)
+
+
+def refresh_data(city: str = "北京") -> str:
+	"""清除该城市的缓存并向上游补拉最新数据，返回新的数据来源标记（其余城市的数据与缓存保留）。"""
+	_CITY_STORE.pop(city)
+	for hook in list(_REFRESH_HOOKS):
 		try:
-			r = requests.get(url, timeout=timeout)
-			r.raise_for_status()
-			return r.json() or {}
+			hook(city)
 		except Exception:
-			if attempt >= retries:
-				break
-			time.sleep(backoff_base * (2 ** attempt))
-	return {}
+			pass
+	df, source = _fetch_city_weather(city, force=True)
+	_publish_city_weather(city, df, source)
+	return source
+
+
+def city_store_stats() -> dict:
+	"""城市数据存储的占用：城市数、字节数、预算与累计淘汰次数。"""
+	return _CITY_STORE.stats()
+
+
+# 兼容旧函数名（与其他城市共用同一份存储）
+def load_beijing_weather() -> pd.DataFrame:
+	return load_city_weather("北京")
+
+
+_CITY_INFO = metrics.gauge("weather_city_data_info", "已加载城市的数据来源（值恒为 1）", ("city", "source"))
+_CITY_AGE = metrics.gauge("weather_city_data_age_seconds", "城市数据自加载以来的秒数", ("city",))
+_CITY_LAG = metrics.gauge("weather_city_data_lag_days", "城市最新数据日期距今天数", ("city",))
+_STORE_BYTES = metrics.gauge("weather_city_store_bytes", "城市数据存储占用的字节数（state: used 已用 / budget 预算）", ("state",))
+_STORE_CITIES = metrics.gauge("weather_city_store_cities", "城市数据存储中的城市数")
+_STORE_EVICTIONS = metrics.counter("weather_city_store_evictions_total", "城市数据因超出内存预算被淘汰的次数")
+
+
+def _collect_metrics() -> None:
+	info = _coords_for.cache_info()
+	metrics.CACHE_REQUESTS.set_total(info.hits, cache="coords", result="hit")
+	metrics.CACHE_REQUESTS.set_total(info.misses, cache="coords", result="miss")
+	stats = _CITY_STORE.stats()
+	_STORE_BYTES.set(stats["bytes"], state="used")
+	_STORE_BYTES.set(stats["budget"], state="budget")
+	_STORE_CITIES.set(stats["cities"])
+	_STORE_EVICTIONS.set_total(stats["evictions"])
+	meta = city_metadata()
+	for gauge in (_CITY_INFO, _CITY_AGE, _CITY_LAG):
+		gauge.clear()
+	for city, m in meta.items():
+		_CITY_INFO.set(1, city=city, source=m["source"])
+		_CITY_AGE.set(m["age_seconds"], city=city)
+		if m["lag_days"] is not None:
+			_CITY_LAG.set(m["lag_days"], city=city)
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+import json
+import math
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import Response
+
+from .metrics import STAGE_SECONDS
+
+# 可选：orjson（可直接序列化 NumPy 数组，NaN 输出为 null）；未安装时退回标准库 json
+try:
+	import orjson  # type: ignore
+	_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except Exception:
+	orjson = None
+
+HISTORY_FIELDS = ["temperature_c", "tmin", "tmax", "precipitation_mm", "humidity", "wind_speed_ms"]
+FORECAST_FIELDS = ["date", "temperature_c", "tmax", "tmin", "precipitation_mm", "humidity", "wind_speed_ms"]
+
+
+def _plain(obj: Any) -> Any:
+	"""标准库 json 的兜底转换：NumPy 数组/标量转为 Python 对象，NaN/Inf 转为 None。"""
+	if isinstance(obj, np.ndarray):
+		obj = obj.tolist()
+	if isinstance(obj, np.generic):
+		obj = obj.item()
+	if isinstance(obj, float):
+		return obj if math.isfinite(obj) else None
+	if isinstance(obj, dict):
+		return {str(k): _plain(v) for k, v in obj.items()}
+	if isinstance(obj, (list, tuple)):
+		return [_plain(v) for v in obj]
+	return obj
+
+
+def dumps(obj: Any) -> bytes:
+	"""JSON 编码为 UTF-8 字节串，支持直接传入 NumPy 数组。"""
+	with STAGE_SECONDS.time(stage="json_encode"):
+		if orjson is not None:
+			try:
+				return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+			except TypeError:
+				pass
+		return json.dumps(_plain(obj), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+	media_type = "application/json"
+
+	def render(self, content: Any) -> bytes:
+		return dumps(content)
+
+
+def _date_strings(values) -> List[str]:
+	return np.datetime_as_string(pd.to_datetime(values).values.astype("datetime64[D]"), unit="D").tolist()
+
+
+def history_rows(df: pd.DataFrame) -> List[dict]:
+	"""逐行格式（默认）：每天一个对象。缺少 tmin/tmax 时以日均温代替。"""
+	columns = history_columns(df)
+	names = ["date"] + HISTORY_FIELDS
+	values = [columns["date"]] + [np.asarray(columns[f], dtype=float).tolist() for f in HISTORY_FIELDS]
+	return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def history_columns(df: pd.DataFrame) -> Dict[str, Any]:
+	"""列式格式：每个字段一个数组（数值列保持 NumPy 数组，由编码器直接序列化）。"""
+	temp = np.ascontiguousarray(df["temperature_c"].to_numpy(dtype=float))
+	out: Dict[str, Any] = {"date": _date_strings(df["date"])}
+	for field in HISTORY_FIELDS:
+		if field in df:
+			out[field] = np.ascontiguousarray(df[field].to_numpy(dtype=float))
+		elif field in ("tmin", "tmax"):
+			out[field] = temp
+	return out
+
+
+def records_to_columns(records: Sequence[dict], fields: Sequence[str] = FORECAST_FIELDS) -> Dict[str, list]:
+	"""把逐条字典列表转为列式结构（仅保留 fields 中的字段）。"""
+	return {field: [r.get(field) for r in records] for field in fields}
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# 轻量预测引擎（engine=fast）：纯 NumPy 的季节基线 + 指数加权（折扣最小二乘）水平/阻尼趋势，
+# 单条序列亚毫秒级。所有函数按行处理二维数组（每行一条序列，列为连续的日期），一维输入视为一行。
+
+# 温度水平/趋势的指数权重半衰期（天）与趋势阻尼系数
+FAST_HALFLIFE = float(os.environ.get("FAST_HALFLIFE", "7"))
+FAST_DAMPING = float(os.environ.get("FAST_DAMPING", "0.8"))
+# 降水的指数权重半衰期（天）；低于阈值（毫米）视为无降水
+FAST_PRECIP_HALFLIFE = float(os.environ.get("FAST_PRECIP_HALFLIFE", "14"))
+FAST_PRECIP_THRESHOLD = 0.1
+# 至少有这么多天历史时才拟合年周期（正余弦）基线
+SEASONAL_MIN_DAYS = 730
+
+_YEAR = 365.25
+
+
+def _day_offsets(dates) -> Tuple[np.datetime64, np.ndarray, np.ndarray]:
+	"""(起始日期, 各行相对起始日的天数, 按日期排序的下标)。已是 datetime64 的列不再经过 pd.to_datetime。"""
+	raw = dates.to_numpy() if isinstance(dates, pd.Series) else np.asarray(dates)
+	if not np.issubdtype(raw.dtype, np.datetime64):
+		raw = pd.to_datetime(raw).to_numpy()
+	days = raw.astype("datetime64[D]")
+	order = np.argsort(days, kind="stable")
+	days = days[order]
+	return days[0], (days - days[0]).astype(np.int64), order
+
+
+def _spread(offsets: np.ndarray, order: np.ndarray, values) -> np.ndarray:
+	out = np.full(int(offsets[-1]) + 1, np.nan)
+	out[offsets] = np.asarray(values, dtype=float)[order]
+	return fill_gaps(out)
+
+
+def daily_values(df: pd.DataFrame, col: str) -> Tuple[np.datetime64, np.ndarray]:
+	"""按日期展开为连续日序列 (起始日期, 数值)，缺测日期与 NaN 用线性插值补齐（两端取最近值）。"""
+	start, offsets, order = _day_offsets(df["date"])
+	return start, _spread(offsets, order, pd.to_numeric(df[col], errors="coerce"))
+
+
+def fill_gaps(values: np.ndarray) -> np.ndarray:
+	"""逐行线性插值补齐 NaN，两端取最近的有效值；整行缺失时保持 NaN。"""
+	arr = np.array(values, dtype=float, ndmin=2)
+	n, t = arr.shape
+	mask = np.isfinite(arr)
+	if mask.all():
+		return arr.reshape(np.shape(values))
+	idx = np.arange(t)
+	# 每个位置左/右最近的有效下标
+	left = np.where(mask, idx, -1)
+	np.maximum.accumulate(left, axis=1, out=left)
+	right = np.where(mask, idx, t)
+	right = np.flip(np.minimum.accumulate(np.flip(right, axis=1), axis=1), axis=1)
+	has_left, has_right = left >= 0, right < t
+	li, ri = np.clip(left, 0, t - 1), np.clip(right, 0, t - 1)
+	rows = np.arange(n)[:, None]
+	lv, rv = arr[rows, li], arr[rows, ri]
+	span = np.where(ri > li, ri - li, 1)
+	frac = (idx - li) / span
+	filled = np.where(has_left & has_right, lv + (rv - lv) * frac, np.where(has_left, lv, rv))
+	return np.where(mask, arr, filled).reshape(np.shape(values))
+
+
+def _seasonal_design(start: Optional[np.datetime64], t: int, steps: int) -> np.ndarray:
+	"""(t + steps) × k 设计矩阵：常数项，历史足够长时加年周期正余弦项。"""
+	if start is None or t < SEASONAL_MIN_DAYS:
+		return np.ones((t + steps, 1))
+	doy = (np.datetime64(start, "D") + np.arange(t + steps)).astype("datetime64[D]")
+	phase = 2 * np.pi * (doy - doy.astype("datetime64[Y]")).astype(float) / _YEAR
+	return np.column_stack([np.ones(t + steps), np.sin(phase), np.cos(phase)])
+
+
+def _seasonal_baseline(arr: np.ndarray, start: Optional[np.datetime64], steps: int) -> np.ndarray:
+	"""各行拟合季节基线，返回历史 + 未来共 t + steps 列（所有行共用同一个设计矩阵，一次求解）。"""
+	t = arr.shape[1]
+	design = _seasonal_design(start, t, steps)
+	coef, *_ = np.linalg.lstsq(design[:t], arr.T, rcond=None)
+	return (design @ coef).T
+
+
+def _discounted_level_trend(resid: np.ndarray, halflife: float) -> Tuple[np.ndarray, np.ndarray]:
+	"""指数加权最小二乘：返回各行在最后一天的水平与日趋势（等价于 Brown 双指数平滑）。"""
+	t = resid.shape[1]
+	x = np.arange(t, dtype=float) - (t - 1)
+	w = 0.5 ** (-x / max(halflife, 1e-6))
+	w /= w.sum()
+	xm = float(w @ x)
+	ym = resid @ w
+	xc = x - xm
+	denom = float(w @ (xc * xc))
+	slope = ((resid - ym[:, None]) @ (w * xc)) / denom if denom > 1e-12 else np.zeros(resid.shape[0])
+	level = ym - slope * xm
+	return level, slope
+
+
+def temperature(values: np.ndarray, steps: int, start: Optional[np.datetime64] = None,
+				halflife: float = FAST_HALFLIFE, damping: float = FAST_DAMPING) -> np.ndarray:
+	"""温度预测：季节基线（两年以上历史时含年周期）+ 残差的指数加权水平 + 阻尼趋势。输入需已补齐缺测。"""
+	arr = np.array(values, dtype=float, ndmin=2)
+	t = arr.shape[1]
+	baseline = _seasonal_baseline(arr, start, steps)
+	level, slope = _discounted_level_trend(arr - baseline[:, :t], halflife)
+	damped = np.cumsum(damping ** np.arange(1, steps + 1))
+	out = baseline[:, t:] + level[:, None] + slope[:, None] * damped[None, :]
+	return out if np.ndim(values) > 1 else out[0]
+
+
+def precipitation(values: np.ndarray, steps: int, start: Optional[np.datetime64] = None,
+				  halflife: float = FAST_PRECIP_HALFLIFE) -> np.ndarray:
+	"""降水预测（零膨胀序列不做趋势外推）：近期指数加权均值，两年以上历史时与季节基线各占一半。"""
+	arr = np.array(values, dtype=float, ndmin=2)
+	arr = np.nan_to_num(arr)
+	arr = np.where(arr < FAST_PRECIP_THRESHOLD, 0.0, arr)
+	t = arr.shape[1]
+	x = np.arange(t, dtype=float) - (t - 1)
+	w = 0.5 ** (-x / max(halflife, 1e-6))
+	recent = (arr @ w) / w.sum()
+	out = np.repeat(recent[:, None], steps, axis=1)
+	if start is not None and t >= SEASONAL_MIN_DAYS:
+		out = 0.5 * out + 0.5 * np.maximum(_seasonal_baseline(arr, start, steps)[:, t:], 0.0)
+	return out if np.ndim(values) > 1 else out[0]
+
+
+def forecast_frame(df: pd.DataFrame, steps: int) -> Tuple[np.ndarray, np.ndarray]:
+	"""单个城市：返回 (日均温预测, 降水预测)。"""
+	start, offsets, order = _day_offsets(df["date"])
+	temp = _spread(offsets, order, pd.to_numeric(df["temperature_c"], errors="coerce"))
+	prec = _spread(offsets, order, pd.to_numeric(df["precipitation_mm"], errors="coerce")) if "precipitation_mm" in df else np.zeros_like(temp)
+	return temperature(temp, steps, start), precipitation(prec, steps, start)
+
+
+# 多城市批量：把 N 个城市的历史对齐为 城市 × 天 的二维数组，补齐、预测与 tmax/tmin 差值估计一次完成
+
+_BATCH_COLUMNS = ("temperature_c", "precipitation_mm", "tmax", "tmin", "humidity", "wind_speed_ms")
+# tmax/tmin 与日均温差值的估计窗口（最近的有效观测条数）与缺省值；单城市与批量路径共用下面的函数
+SPREAD_WINDOW = 30
+DEFAULT_SPREAD = 4.5
+
+
+def stack_frames(
+	frames: Sequence[pd.DataFrame], columns: Sequence[str] = _BATCH_COLUMNS,
+) -> List[Tuple[np.ndarray, np.datetime64, Dict[str, np.ndarray]]]:
+	"""把多个城市的历史按 (最后日期, 天数) 分组，每组对齐为 {列: 城市 × 天} 数组（缺测为 NaN，尚未补齐）。
+
+	所有城市合并成一张表后一次性取列、换算日期，避免逐城市访问 DataFrame 的开销。
+	返回 [(组内城市在 frames 中的下标, 最后日期, 数组)]；frames 不能含空表。
+	"""
+	sizes = np.array([len(df) for df in frames])
+	table = pd.concat(frames, ignore_index=True, sort=False)
+	raw = table["date"].to_numpy()
+	if not np.issubdtype(raw.dtype, np.datetime64):
+		raw = pd.to_datetime(raw).to_numpy()
+	days = raw.astype("datetime64[D]").astype(np.int64)
+	owner = np.repeat(np.arange(len(frames)), sizes)
+	bounds = np.cumsum(sizes) - sizes
+	first = np.minimum.reduceat(days, bounds)
+	last = np.maximum.reduceat(days, bounds)
+	values = {
+		col: pd.to_numeric(table[col], errors="coerce").to_numpy(dtype=float) if col in table else np.full(len(table), np.nan)
+		for col in columns
+	}
+	keys, group_of = np.unique(np.stack([last, last - first + 1], axis=1), axis=0, return_inverse=True)
+	group_of = group_of.reshape(-1)
+	out = []
+	for g, (end, length) in enumerate(keys):
+		members = np.flatnonzero(group_of == g)
+		row_of = np.empty(len(frames), dtype=np.int64)
+		row_of[members] = np.arange(len(members))
+		mask = group_of[owner] == g
+		rows = row_of[owner[mask]]
+		cols = days[mask] - (end - length + 1)
+		arrays = {}
+		for col, vals in values.items():
+			arr = np.full((len(members), int(length)), np.nan)
+			arr[rows, cols] = vals[mask]
+			arrays[col] = arr
+		out.append((members, np.datetime64(int(end), "D"), arrays))
+	return out
+
+
+def recent_mean(values: np.ndarray, count: int, default: float) -> np.ndarray:
+	"""逐行取最近 count 个有效值（跳过 NaN 与缺测日期）的均值；没有有效值的行取 default。
+
+	只数有效值而不是日历天数，按日期展开的数组（批量路径）与只含观测行的序列（单城市路径）结果相同。
+	"""
+	arr = np.array(values, dtype=float, ndmin=2)
+	valid = np.isfinite(arr)
+	# 每个位置右侧（含自身）的有效值个数
+	rank = np.cumsum(valid[:, ::-1], axis=1)[:, ::-1]
+	keep = valid & (rank <= count)
+	n = keep.sum(axis=1)
+	total = np.where(keep, arr, 0.0).sum(axis=1)
+	return np.where(n > 0, total / np.maximum(n, 1), default)
+
+
+def spread(temp: np.ndarray, tmax: np.ndarray, tmin: np.ndarray, window: int = SPREAD_WINDOW) -> Tuple[np.ndarray, np.ndarray]:
+	"""逐行 tmax/tmin 与日均温在最近 window 个有效观测上的平均差值；无 tmax/tmin 的行取缺省值。"""
+	temp = np.array(temp, dtype=float, ndmin=2)
+	return (
+		recent_mean(np.array(tmax, dtype=float, ndmin=2) - temp, window, DEFAULT_SPREAD),
+		recent_mean(temp - np.array(tmin, dtype=float, ndmin=2), window, DEFAULT_SPREAD),
+	)
+
+
+def forecast_batch(frames: Dict[str, pd.DataFrame], steps: int) -> Dict[str, dict]:
+	"""多城市快速预测。按 (最后日期, 天数) 分组，每组一次性完成补齐、预测、温差与近 7 天湿度/风速估计。
+
+	返回 {城市: {temperature, precipitation, delta_max, delta_min, humidity, wind, dates}}，
+	dates 为预测日期（各城市最后日期之后的 steps 天）。
+	"""
+	cities = [c for c, df in frames.items() if df is not None and not df.empty]
+	out: Dict[str, dict] = {}
+	if not cities:
+		return out
+	for members, last, arrays in stack_frames([frames[c] for c in cities]):
+		start = last - np.timedelta64(arrays["temperature_c"].shape[1] - 1, "D")
+		temp = fill_gaps(arrays["temperature_c"])
+		prec = fill_gaps(arrays["precipitation_mm"])
+		temp_fc = temperature(temp, steps, start)
+		prec_fc = precipitation(prec, steps, start)
+		delta_max, delta_min = spread(arrays["temperature_c"], arrays["tmax"], arrays["tmin"])
+		humidity = recent_mean(arrays["humidity"], 7, 60.0)
+		wind = recent_mean(arrays["wind_speed_ms"], 7, 3.0)
+		dates = np.datetime_as_string(last + np.arange(1, steps + 1), unit="D").tolist()
+		for i, index in enumerate(members):
+			out[cities[index]] = {
+				"temperature": temp_fc[i], "precipitation": prec_fc[i],
+				"delta_max": float(delta_max[i]), "delta_min": float(delta_min[i]),
+				"humidity": float(humidity[i]), "wind": float(wind[i]), "dates": dates,
+			}
+	return out
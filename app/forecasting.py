@@ -1,24 +1,26 @@
 from __future__ import annotations
 
-from typing import List, Optional, Tuple
-
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import hashlib
+import os
+import threading
 import warnings
 import numpy as np
 import pandas as pd
-from statsmodels.tsa.arima.model import ARIMA
 
-# 可选：LSTM（若未安装则自动忽略）
-try:
-	import tensorflow as tf  # type: ignore
-	from tensorflow import keras  # type: ignore
-	_TF_AVAILABLE = True
-except Exception:
-	_TF_AVAILABLE = False
+# statsmodels / TensorFlow 在首次使用时才加载（LSTM 为可选，未安装则自动忽略）
+from . import backends, fast_engine
 
 # 从 data_loader 获取任意城市坐标
-from .data_loader import get_city_coords
+from .data_loader import BULK_CHUNK_SIZE, OPEN_METEO_FORECAST_URL, ROOT, get_city_coords, split_multi_location
+
+from .metrics import STAGE_SECONDS, cache_result
+from .upstream import submit_json
 
-import requests
 import time
 
 warnings.filterwarnings(
@@ -35,27 +37,71 @@ def _ensure_daily_series(series: pd.Series) -> pd.Series:
 	return series
 
 
+ARIMA_CANDIDATES = [(2, 1, 2), (5, 1, 0), (1, 1, 1), (2, 1, 0), (0, 1, 2)]
+# 候选阶数并行拟合的进程数（<=1 时串行）
+ARIMA_N_JOBS = int(os.environ.get("ARIMA_N_JOBS", "0")) or min(len(ARIMA_CANDIDATES), os.cpu_count() or 1)
+# 选定阶数的有效期（秒），过期后重新做阶数搜索
+ARIMA_ORDER_TTL = float(os.environ.get("ARIMA_ORDER_TTL", "86400"))
+
+# key: (城市, 序列名) -> (选定时间, 阶数)
+_ARIMA_ORDER_CACHE: Dict[Tuple[str, str], Tuple[float, tuple]] = {}
+_ARIMA_ORDER_LOCK = threading.Lock()
+
+
+def _fit_arima(series: pd.Series, order: tuple):
+	try:
+		return backends.arima()(series, order=order).fit()
+	except Exception:
+		return None
+
+
 def _select_arima_order(series: pd.Series) -> tuple:
-	candidates = [(2, 1, 2), (5, 1, 0), (1, 1, 1), (2, 1, 0), (0, 1, 2)]
-	best = candidates[0]
+	"""并行拟合候选阶数，返回 (AIC 最优阶数, 对应拟合结果)，拟合结果可直接复用。"""
+	n_jobs = min(ARIMA_N_JOBS, len(ARIMA_CANDIDATES))
+	with STAGE_SECONDS.time(stage="arima_order_search"):
+		if n_jobs > 1:
+			from joblib import Parallel, delayed
+			fitted = Parallel(n_jobs=n_jobs)(delayed(_fit_arima)(series, order) for order in ARIMA_CANDIDATES)
+		else:
+			fitted = [_fit_arima(series, order) for order in ARIMA_CANDIDATES]
+	best = ARIMA_CANDIDATES[0]
+	best_res = None
 	best_aic = float("inf")
-	for order in candidates:
-		try:
-			model = ARIMA(series, order=order)
-			res = model.fit()
-			if res.aic < best_aic:
-				best_aic = res.aic
-				best = order
-		except Exception:
-			continue
-	return best
+	for order, res in zip(ARIMA_CANDIDATES, fitted):
+		if res is not None and res.aic < best_aic:
+			best_aic = res.aic
+			best = order
+			best_res = res
+	return best, best_res
+
+
+def _cached_arima_order(cache_key: Optional[Tuple[str, str]]) -> Optional[tuple]:
+	if cache_key is None:
+		return None
+	with _ARIMA_ORDER_LOCK:
+		item = _ARIMA_ORDER_CACHE.get(cache_key)
+	if item is None or time.time() - item[0] > ARIMA_ORDER_TTL:
+		cache_result("arima_order", "miss")
+		return None
+	cache_result("arima_order", "hit")
+	return item[1]
 
 
-def _arima_forecast(series: pd.Series, steps: int) -> np.ndarray:
+def _arima_forecast(series: pd.Series, steps: int, cache_key: Optional[Tuple[str, str]] = None) -> np.ndarray:
+	"""ARIMA 预测。cache_key 形如 (城市, 序列名)，命中已选阶数时只拟合该阶数。"""
 	series = _ensure_daily_series(series)
-	order = _select_arima_order(series)
-	model = ARIMA(series, order=order)
-	res = model.fit()
+	res = None
+	order = _cached_arima_order(cache_key)
+	if order is not None:
+		with STAGE_SECONDS.time(stage="arima_fit"):
+			res = _fit_arima(series, order)
+	if res is None:
+		order, res = _select_arima_order(series)
+		if res is None:
+			res = backends.arima()(series, order=order).fit()
+		if cache_key is not None:
+			with _ARIMA_ORDER_LOCK:
+				_ARIMA_ORDER_CACHE[cache_key] = (time.time(), order)
 	fc = res.forecast(steps=steps)
 	# 简单偏差校正：使用最近14天的拟合残差均值
 	try:
@@ -69,8 +115,119 @@ def _arima_forecast(series: pd.Series, steps: int) -> np.ndarray:
 	return np.asarray(fc)
 
 
-def _lstm_forecast(series: pd.Series, steps: int, lookback: int = 14, epochs: int = 10) -> Optional[np.ndarray]:
-	if not _TF_AVAILABLE:
+# LSTM 模型缓存：内存 LRU + 磁盘（按数据哈希命名，数据不变则不重新训练）
+LSTM_MODEL_DIR = Path(os.environ.get("LSTM_MODEL_DIR", str(ROOT / "data" / "models" / "lstm")))
+LSTM_CACHE_SIZE = int(os.environ.get("LSTM_CACHE_SIZE", "16"))
+_LSTM_MODELS: "OrderedDict[str, dict]" = OrderedDict()
+_LSTM_LOCK = threading.Lock()
+
+
+def _lstm_model_name(values: np.ndarray, lookback: int, epochs: int, cache_key: Optional[Tuple[str, str]]) -> Tuple[str, str]:
+	"""返回 (模型前缀, 完整名称)：前缀区分城市与序列，完整名称再附加数据哈希。"""
+	prefix = hashlib.sha1(repr(cache_key).encode("utf-8")).hexdigest()[:12]
+	digest = hashlib.sha1(np.ascontiguousarray(values, dtype=float).tobytes())
+	digest.update(f"{lookback}-{epochs}".encode("ascii"))
+	return prefix, f"{prefix}-{digest.hexdigest()[:16]}"
+
+
+def _remember_lstm(name: str, model) -> dict:
+	"""缓存模型及其已编译的递推函数，返回缓存条目。"""
+	entry = {"model": model, "rollouts": {}}
+	with _LSTM_LOCK:
+		_LSTM_MODELS[name] = entry
+		_LSTM_MODELS.move_to_end(name)
+		while len(_LSTM_MODELS) > LSTM_CACHE_SIZE:
+			_LSTM_MODELS.popitem(last=False)
+	return entry
+
+
+def _load_lstm(name: str) -> Optional[dict]:
+	with _LSTM_LOCK:
+		entry = _LSTM_MODELS.get(name)
+		if entry is not None:
+			_LSTM_MODELS.move_to_end(name)
+	if entry is not None:
+		cache_result("lstm_model", "hit")
+		return entry
+	path = LSTM_MODEL_DIR / f"{name}.keras"
+	if not path.exists():
+		cache_result("lstm_model", "miss")
+		return None
+	try:
+		_, keras = backends.tensorflow()
+		model = keras.models.load_model(path, compile=False)
+	except Exception:
+		cache_result("lstm_model", "miss")
+		return None
+	cache_result("lstm_model", "disk")
+	return _remember_lstm(name, model)
+
+
+def _save_lstm(prefix: str, name: str, model) -> None:
+	"""落盘并删除同一城市/序列的旧模型。"""
+	try:
+		LSTM_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+		model.save(LSTM_MODEL_DIR / f"{name}.keras")
+		for old in LSTM_MODEL_DIR.glob(f"{prefix}-*.keras"):
+			if old.stem != name:
+				old.unlink()
+	except Exception:
+		pass
+
+
+def _train_lstm(norm: np.ndarray, lookback: int, epochs: int):
+	_, keras = backends.tensorflow()
+	X, y = [], []
+	for i in range(len(norm) - lookback):
+		X.append(norm[i : i + lookback])
+		y.append(norm[i + lookback])
+	X = np.array(X)
+	y = np.array(y)
+	if len(X) < 10:
+		return None
+
+	model = keras.Sequential([
+		keras.layers.Input(shape=(lookback, 1)),
+		keras.layers.LSTM(32),
+		keras.layers.Dense(16, activation="relu"),
+		keras.layers.Dense(1),
+	])
+	model.compile(optimizer="adam", loss="mse")
+	callbacks = [keras.callbacks.EarlyStopping(patience=2, restore_best_weights=True)]
+	model.fit(X, y, epochs=epochs, batch_size=16, verbose=0, callbacks=callbacks)
+	return model
+
+
+def _lstm_rollout(entry: dict, window: np.ndarray, steps: int) -> np.ndarray:
+	"""多步递推：整段循环编译为一个 tf.function，一次调用完成全部步数（按步数缓存）。"""
+	tf, _ = backends.tensorflow()
+	model = entry["model"]
+	lookback = int(window.shape[0])
+	rollout = entry["rollouts"].get((lookback, steps))
+	if rollout is None:
+		@tf.function(input_signature=[tf.TensorSpec([1, lookback, 1], tf.float32)])
+		def rollout(w):
+			out = tf.TensorArray(tf.float32, size=steps)
+			for i in tf.range(steps):
+				p = model(w, training=False)
+				out = out.write(i, p[0, 0])
+				w = tf.concat([w[:, 1:, :], tf.reshape(p, [1, 1, 1])], axis=1)
+			return out.stack()
+
+		entry["rollouts"][(lookback, steps)] = rollout
+	window = np.asarray(window, dtype="float32").reshape(1, lookback, 1)
+	return np.asarray(rollout(window), dtype=float)
+
+
+def _lstm_forecast(
+	series: pd.Series,
+	steps: int,
+	lookback: int = 14,
+	epochs: int = 10,
+	cache_key: Optional[Tuple[str, str]] = None,
+) -> Optional[np.ndarray]:
+	"""LSTM 预测。训练好的模型按 (cache_key, 数据哈希) 复用，只有数据变化时才重新训练。"""
+	if backends.tensorflow() is None:
 		return None
 	try:
 		series = _ensure_daily_series(series)
@@ -79,189 +236,303 @@ def _lstm_forecast(series: pd.Series, steps: int, lookback: int = 14, epochs: in
 		std = values.std() if values.std() > 1e-6 else 1.0
 		norm = (values - mean) / std
 
-		X, y = [], []
-		for i in range(len(norm) - lookback):
-			X.append(norm[i : i + lookback])
-			y.append(norm[i + lookback])
-		X = np.array(X)
-		y = np.array(y)
-		if len(X) < 10:
-			return None
-
-		model = keras.Sequential([
-			keras.layers.Input(shape=(lookback, 1)),
-			keras.layers.LSTM(32),
-			keras.layers.Dense(16, activation="relu"),
-			keras.layers.Dense(1),
-		])
-		model.compile(optimizer="adam", loss="mse")
-		callbacks = [keras.callbacks.EarlyStopping(patience=2, restore_best_weights=True)]
-		model.fit(X, y, epochs=epochs, batch_size=16, verbose=0, callbacks=callbacks)
-
-		window = norm[-lookback:].copy()
-		preds = []
-		for _ in range(steps):
-			inp = window.reshape(1, lookback, 1)
-			p = model.predict(inp, verbose=0)[0, 0]
-			preds.append(p)
-			window = np.concatenate([window[1:], np.array([p])])
-
-		preds = np.array(preds) * std + mean
+		prefix, name = _lstm_model_name(values, lookback, epochs, cache_key)
+		entry = _load_lstm(name)
+		if entry is None:
+			with STAGE_SECONDS.time(stage="lstm_train"):
+				model = _train_lstm(norm, lookback, epochs)
+			if model is None:
+				return None
+			entry = _remember_lstm(name, model)
+			_save_lstm(prefix, name, model)
+
+		with STAGE_SECONDS.time(stage="lstm_inference"):
+			preds = _lstm_rollout(entry, norm[-lookback:], steps) * std + mean
 		return preds.reshape(-1)
 	except Exception:
 		return None
 
 
+def _parse_open_meteo_forecast(js: dict) -> Optional[pd.DataFrame]:
+	d = js.get("daily", {})
+	times = d.get("time")
+	if not times:
+		return None
+	t_max = np.asarray(d.get("temperature_2m_max", []), dtype=float)
+	t_min = np.asarray(d.get("temperature_2m_min", []), dtype=float)
+	prec = np.asarray(d.get("precipitation_sum", []), dtype=float)
+	wind_kmh = np.asarray(d.get("windspeed_10m_max", []), dtype=float)
+	hum = np.asarray(d.get("relative_humidity_2m_mean", []), dtype=float)
+	wind_ms = wind_kmh / 3.6
+	t_avg = (t_max + t_min) / 2.0
+	df = pd.DataFrame({
+		"date": pd.to_datetime(times).date,
+		"temperature_c": t_avg,
+		"tmax": t_max,
+		"tmin": t_min,
+		"precipitation_mm": prec,
+		"humidity": hum,
+		"wind_speed_ms": wind_ms,
+	})
+	return df
+
+
+def _forecast_url(lat, lon, days: int) -> str:
+	return (
+		OPEN_METEO_FORECAST_URL +
+		f"?latitude={lat}&longitude={lon}"
+		"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max,relative_humidity_2m_mean"
+		"&forecast_days=" + str(min(max(days, 1), 14)) + "&timezone=Asia%2FShanghai"
+	)
+
+
+def prefetch_open_meteo_forecast(days: int, city: str) -> Future:
+	"""后台发起 Open‑Meteo 未来预测请求，Future 结果为 DataFrame 或 None。"""
+	lat, lon = get_city_coords(city)
+	return submit_json(_forecast_url(lat, lon, days), timeout=20, retries=2, parse=_parse_open_meteo_forecast)
+
+
+def _parse_open_meteo_forecasts(count: int):
+	def _parse(js) -> List[Optional[pd.DataFrame]]:
+		frames = []
+		for item in split_multi_location(js, count):
+			try:
+				frames.append(_parse_open_meteo_forecast(item))
+			except Exception:
+				frames.append(None)
+		return frames
+	return _parse
+
+
+def prefetch_open_meteo_forecasts(days: int, cities: Sequence[str]) -> Dict[str, Future]:
+	"""批量发起多个城市的未来预测请求（多坐标合并为少量请求），返回每个城市各自的 Future。"""
+	cities = list(dict.fromkeys(cities))
+	result: Dict[str, Future] = {}
+	for i in range(0, len(cities), BULK_CHUNK_SIZE):
+		chunk = cities[i:i + BULK_CHUNK_SIZE]
+		coords = [get_city_coords(c) for c in chunk]
+		url = _forecast_url(",".join(str(c[0]) for c in coords), ",".join(str(c[1]) for c in coords), days)
+		chunk_future = submit_json(url, timeout=60, retries=2, parse=_parse_open_meteo_forecasts(len(chunk)))
+		city_futures = [Future() for _ in chunk]
+
+		def _split(f: Future, city_futures=city_futures) -> None:
+			try:
+				frames = f.result()
+			except Exception:
+				frames = [None] * len(city_futures)
+			for cf, frame in zip(city_futures, frames):
+				cf.set_result(frame)
+
+		chunk_future.add_done_callback(_split)
+		result.update(zip(chunk, city_futures))
+	return result
+
+
+def _resolve_external(external) -> Optional[pd.DataFrame]:
+	if isinstance(external, Future):
+		try:
+			return external.result()
+		except Exception:
+			return None
+	return external
+
+
 def _fetch_open_meteo_forecast(days: int, city: str) -> Optional[pd.DataFrame]:
 	"""尝试获取 Open‑Meteo 的未来预测，包含 tmin/tmax。"""
 	try:
-		lat, lon = get_city_coords(city)
-		url = (
-			"https://api.open-meteo.com/v1/forecast"
-			f"?latitude={lat}&longitude={lon}"
-			"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max,relative_humidity_2m_mean"
-			"&forecast_days=" + str(min(max(days, 1), 14)) + "&timezone=Asia%2FShanghai"
-		)
-		js = _http_get_json(url, timeout=20, retries=2)
-		d = js.get("daily", {})
-		times = d.get("time")
-		if not times:
-			return None
-		t_max = np.asarray(d.get("temperature_2m_max", []), dtype=float)
-		t_min = np.asarray(d.get("temperature_2m_min", []), dtype=float)
-		prec = np.asarray(d.get("precipitation_sum", []), dtype=float)
-		wind_kmh = np.asarray(d.get("windspeed_10m_max", []), dtype=float)
-		hum = np.asarray(d.get("relative_humidity_2m_mean", []), dtype=float)
-		wind_ms = wind_kmh / 3.6
-		t_avg = (t_max + t_min) / 2.0
-		df = pd.DataFrame({
-			"date": pd.to_datetime(times).date,
-			"temperature_c": t_avg,
-			"tmax": t_max,
-			"tmin": t_min,
-			"precipitation_mm": prec,
-			"humidity": hum,
-			"wind_speed_ms": wind_ms,
-		})
-		return df
+		return _resolve_external(prefetch_open_meteo_forecast(days, city))
 	except Exception:
 		return None
 
 
-# --- HTTP 重试辅助（与 data_loader 一致的轻量实现） ---
-def _http_get_json(url: str, timeout: float = 15.0, retries: int = 2, backoff_base: float = 0.5) -> dict:
-	for attempt in range(retries + 1):
-		try:
-			r = requests.get(url, timeout=timeout)
-			r.raise_for_status()
-			return r.json() or {}
-		except Exception:
-			if attempt >= retries:
-				break
-			time.sleep(backoff_base * (2 ** attempt))
-	return {}
-
-
 def _estimate_spread_from_history(df: pd.DataFrame) -> Tuple[float, float]:
-	"""估计近30天 tmax/tmin 与日均的平均差值，用于无外部数据时恢复范围。"""
+	"""估计最近 30 个有效观测的 tmax/tmin 与日均的平均差值，用于无外部数据时恢复范围（与批量路径相同）。"""
 	try:
-		dd = df.sort_values("date").tail(30)
+		dd = df.sort_values("date")
 		if "tmax" in dd.columns and "tmin" in dd.columns:
-			delta_max = float(np.nanmean(dd["tmax"].values - dd["temperature_c"].values))
-			delta_min = float(np.nanmean(dd["temperature_c"].values - dd["tmin"].values))
-		else:
-			delta_max, delta_min = 4.5, 4.5
-		return delta_max, delta_min
+			delta_max, delta_min = fast_engine.spread(dd["temperature_c"].values, dd["tmax"].values, dd["tmin"].values)
+			return float(delta_max[0]), float(delta_min[0])
+		return fast_engine.DEFAULT_SPREAD, fast_engine.DEFAULT_SPREAD
 	except Exception:
-		return 4.5, 4.5
+		return fast_engine.DEFAULT_SPREAD, fast_engine.DEFAULT_SPREAD
+
+
+def _external_column(df_ext: pd.DataFrame, col: str, n: int) -> np.ndarray:
+	if col not in df_ext:
+		return np.full(n, np.nan)
+	return df_ext[col].to_numpy(dtype=float)[:n]
+
+
+def _fuse_forecast(
+	temp_model: np.ndarray,
+	prec_local: np.ndarray,
+	df_ext: Optional[pd.DataFrame],
+	dates: List[str],
+	mean_humidity: float,
+	mean_wind: float,
+	delta_max: float,
+	delta_min: float,
+) -> List[dict]:
+	"""按列融合外部预测（85%）与本地模型（15%），整段向量化计算后再组装输出。
+
+	df_ext 为空时只使用本地模型，日期取 dates；否则日期与湿度、风速取外部预测。
+	"""
+	days = len(dates)
+	local_temp = np.asarray(temp_model, dtype=float)[:days]
+	local_prec = np.asarray(prec_local, dtype=float)[:days]
+	w_ext, w_local = (0.85, 0.15) if df_ext is not None else (0.0, 1.0)
+
+	if df_ext is not None:
+		out_dates = [str(d) for d in df_ext["date"].to_numpy()[:days]]
+		ex_temp = _external_column(df_ext, "temperature_c", days)
+		ex_prec = _external_column(df_ext, "precipitation_mm", days)
+		ex_tmax = _external_column(df_ext, "tmax", days)
+		ex_tmin = _external_column(df_ext, "tmin", days)
+		out_temp = w_ext * ex_temp + w_local * local_temp
+		out_prec = np.fmax(0.0, w_ext * ex_prec + w_local * local_prec)
+		# tmin/tmax 优先用外部，缺失则用 spread 估计
+		has_range = np.isfinite(ex_tmax) & np.isfinite(ex_tmin)
+		out_tmax = np.where(has_range, w_ext * ex_tmax + w_local * (out_temp + delta_max), out_temp + delta_max)
+		out_tmin = np.where(has_range, w_ext * ex_tmin + w_local * (out_temp - delta_min), out_temp - delta_min)
+		out_hum = _external_column(df_ext, "humidity", days).tolist()
+		out_wind = _external_column(df_ext, "wind_speed_ms", days).tolist()
+		ex_temp_list, ex_prec_list = ex_temp.tolist(), ex_prec.tolist()
+		data_source = "external_fusion"
+	else:
+		out_dates = list(dates)
+		out_temp = local_temp
+		out_prec = np.fmax(0.0, local_prec)
+		out_tmax = out_temp + delta_max
+		out_tmin = out_temp - delta_min
+		out_hum = [mean_humidity] * days
+		out_wind = [mean_wind] * days
+		ex_temp_list = ex_prec_list = [None] * days
+		data_source = "local_only"
+
+	weights = {"external": w_ext, "local": w_local}
+	return [
+		{
+			"date": d,
+			"temperature_c": t,
+			"tmax": tmax,
+			"tmin": tmin,
+			"precipitation_mm": p,
+			"humidity": h,
+			"wind_speed_ms": w,
+			# 详细计算过程
+			"calculation_details": {
+				"external_temp": et,
+				"external_prec": ep,
+				"local_temp": lt,
+				"local_prec": lp,
+				"weights": dict(weights),
+				"data_source": data_source,
+			},
+		}
+		for d, t, tmax, tmin, p, h, w, et, ep, lt, lp in zip(
+			out_dates, out_temp.tolist(), out_tmax.tolist(), out_tmin.tolist(), out_prec.tolist(),
+			out_hum, out_wind, ex_temp_list, ex_prec_list, local_temp.tolist(), local_prec.tolist(),
+		)
+	]
+
 
+# 本地模型引擎：fast 为纯 NumPy 季节/指数平滑（亚毫秒，见 app.fast_engine）；arima 仅 ARIMA；
+# ensemble 为 ARIMA 与 LSTM（可用时）平均温度、ARIMA 预测降水
+ENGINES = ("fast", "arima", "ensemble")
+FORECAST_ENGINE = os.environ.get("FORECAST_ENGINE", "ensemble")
+if FORECAST_ENGINE not in ENGINES:
+	FORECAST_ENGINE = "ensemble"
 
-def forecast_temperature_and_precipitation(df: pd.DataFrame, days: int = 7, city: str = "北京") -> List[dict]:
-	"""融合 Open‑Meteo 外部预测与本地模型的结果，输出日均、最高、最低温。"""
+
+def local_model_forecast(df: pd.DataFrame, days: int, city: str = "北京", engine: str = FORECAST_ENGINE) -> Tuple[np.ndarray, np.ndarray]:
+	"""本地模型部分：返回 (日均温预测, 降水预测)。
+
+	纯 CPU 计算、不访问网络，arima/ensemble 可在计算进程中执行（见 app.compute）。
+	"""
+	if engine == "fast":
+		return fast_engine.forecast_frame(df, days)
 	df = df.sort_values("date").reset_index(drop=True)
 	temp_series = pd.Series(df["temperature_c"].values, index=pd.to_datetime(df["date"]))
 	prec_series = pd.Series(df["precipitation_mm"].values, index=pd.to_datetime(df["date"]))
 
-	temp_arima = _arima_forecast(temp_series, steps=days)
-	prec_arima = _arima_forecast(prec_series, steps=days)
+	temp_arima = _arima_forecast(temp_series, steps=days, cache_key=(city, "temperature_c"))
+	prec_arima = _arima_forecast(prec_series, steps=days, cache_key=(city, "precipitation_mm"))
 
-	temp_lstm = _lstm_forecast(temp_series, steps=days)
+	temp_lstm = _lstm_forecast(temp_series, steps=days, cache_key=(city, "temperature_c")) if engine == "ensemble" else None
 	if temp_lstm is not None and len(temp_lstm) == days:
 		temp_model = (temp_arima + temp_lstm) / 2.0
 	else:
 		temp_model = temp_arima
+	return temp_model, prec_arima
 
-	df_ext = _fetch_open_meteo_forecast(days, city)
+
+def fuse_with_external(df: pd.DataFrame, temp_model: np.ndarray, prec_local: np.ndarray, external, days: int) -> List[dict]:
+	"""把本地模型结果与外部预测（DataFrame / Future / None）融合为逐日输出。"""
+	df = df.sort_values("date").reset_index(drop=True)
+	df_ext = _resolve_external(external)
 	use_external = df_ext is not None and len(df_ext) >= days
 
-	mean_humidity = float(pd.Series(df["humidity"].values).tail(7).mean()) if "humidity" in df else 60.0
-	mean_wind = float(pd.Series(df["wind_speed_ms"].values).tail(7).mean()) if "wind_speed_ms" in df else 3.0
+	# 最近 7 个有效观测的均值（与多城市批量路径一致）
+	mean_humidity = float(fast_engine.recent_mean(df["humidity"].values, 7, 60.0)[0]) if "humidity" in df else 60.0
+	mean_wind = float(fast_engine.recent_mean(df["wind_speed_ms"].values, 7, 3.0)[0]) if "wind_speed_ms" in df else 3.0
 
 	delta_max, delta_min = _estimate_spread_from_history(df)
 
 	last_date = pd.to_datetime(df["date"].iloc[-1]).normalize()
 	dates = [(last_date + pd.Timedelta(days=i + 1)).date().isoformat() for i in range(days)]
 
-	forecast_list: List[dict] = []
-	for i in range(days):
-		if use_external:
-			ex_date = df_ext["date"].iloc[min(i, len(df_ext)-1)]
-			ex_temp = float(df_ext["temperature_c"].iloc[min(i, len(df_ext)-1)])
-			ex_prec = float(df_ext["precipitation_mm"].iloc[min(i, len(df_ext)-1)])
-			ex_hum = float(df_ext["humidity"].iloc[min(i, len(df_ext)-1)])
-			ex_wind = float(df_ext["wind_speed_ms"].iloc[min(i, len(df_ext)-1)])
-			ex_tmax = float(df_ext.get("tmax", pd.Series([np.nan]*len(df_ext))).iloc[min(i, len(df_ext)-1)])
-			ex_tmin = float(df_ext.get("tmin", pd.Series([np.nan]*len(df_ext))).iloc[min(i, len(df_ext)-1)])
-			out_date = str(ex_date)
-			base_temp = 0.85 * ex_temp + 0.15 * float(temp_model[i])
-			out_prec = max(0.0, 0.85 * ex_prec + 0.15 * float(prec_arima[i]))
-			# tmin/tmax 优先用外部，缺失则用 spread 估计
-			if np.isfinite(ex_tmax) and np.isfinite(ex_tmin):
-				out_tmax = 0.85 * ex_tmax + 0.15 * (base_temp + delta_max)
-				out_tmin = 0.85 * ex_tmin + 0.15 * (base_temp - delta_min)
-			else:
-				out_tmax = base_temp + delta_max
-				out_tmin = base_temp - delta_min
-			out_temp = base_temp
-			out_hum = ex_hum
-			out_wind = ex_wind
-			
-			# 添加详细计算过程
-			calculation_details = {
-				"external_temp": ex_temp,
-				"external_prec": ex_prec,
-				"local_temp": float(temp_model[i]),
-				"local_prec": float(prec_arima[i]),
-				"weights": {"external": 0.85, "local": 0.15},
-				"data_source": "external_fusion"
-			}
-		else:
-			out_date = dates[i]
-			out_temp = float(temp_model[i])
-			out_prec = float(max(0.0, prec_arima[i]))
-			out_hum = mean_humidity
-			out_wind = mean_wind
-			out_tmax = out_temp + delta_max
-			out_tmin = out_temp - delta_min
-			
-			# 添加详细计算过程
-			calculation_details = {
-				"external_temp": None,
-				"external_prec": None,
-				"local_temp": float(temp_model[i]),
-				"local_prec": float(prec_arima[i]),
-				"weights": {"external": 0.0, "local": 1.0},
-				"data_source": "local_only"
-			}
-
-		forecast_list.append({
-			"date": out_date,
-			"temperature_c": out_temp,
-			"tmax": out_tmax,
-			"tmin": out_tmin,
-			"precipitation_mm": out_prec,
-			"humidity": out_hum,
-			"wind_speed_ms": out_wind,
-			"calculation_details": calculation_details
-		})
-	return forecast_list
+	return _fuse_forecast(
+		temp_model, prec_local, df_ext if use_external else None,
+		dates, mean_humidity, mean_wind, delta_max, delta_min,
+	)
+
+
+def forecast_temperature_and_precipitation(
+	df: pd.DataFrame, days: int = 7, city: str = "北京", external=None, engine: str = FORECAST_ENGINE,
+) -> List[dict]:
+	"""融合 Open‑Meteo 外部预测与本地模型的结果，输出日均、最高、最低温。
+
+	external 可传入已拉取的外部预测 DataFrame 或 prefetch_open_meteo_forecast 返回的 Future；
+	为空时在本地模型拟合前发起请求，使网络等待与模型计算重叠。engine 见 ENGINES。
+	"""
+	if external is None:
+		try:
+			external = prefetch_open_meteo_forecast(days, city)
+		except Exception:
+			external = None
+	temp_model, prec_local = local_model_forecast(df, days, city, engine)
+	return fuse_with_external(df, temp_model, prec_local, external, days)
+
+
+def forecast_cities_fast(
+	frames: Dict[str, pd.DataFrame], days: int = 7, externals: Optional[Dict[str, object]] = None,
+) -> Dict[str, List[dict]]:
+	"""多城市 engine=fast 预测：本地模型对所有城市一次性向量化计算（见 fast_engine.forecast_batch），再逐城市融合外部预测。
+
+	externals 为 {城市: DataFrame / Future}，缺省的城市只用本地模型。
+	"""
+	externals = externals or {}
+	out: Dict[str, List[dict]] = {}
+	for city, item in fast_engine.forecast_batch(frames, days).items():
+		df_ext = _resolve_external(externals.get(city))
+		use_external = df_ext is not None and len(df_ext) >= days
+		out[city] = _fuse_forecast(
+			item["temperature"], item["precipitation"], df_ext if use_external else None,
+			item["dates"], item["humidity"], item["wind"], item["delta_max"], item["delta_min"],
+		)
+	return out
+
+
+def arima_orders(city: str) -> Dict[Tuple[str, str], Tuple[float, tuple]]:
+	"""该城市已选定的 ARIMA 阶数（供计算进程之间同步）。"""
+	with _ARIMA_ORDER_LOCK:
+		return {k: v for k, v in _ARIMA_ORDER_CACHE.items() if k[0] == city}
+
+
+def remember_arima_orders(orders: Dict[Tuple[str, str], Tuple[float, tuple]]) -> None:
+	"""合并其他进程选定的阶数，保留选定时间较新的一方。"""
+	with _ARIMA_ORDER_LOCK:
+		for key, item in orders.items():
+			current = _ARIMA_ORDER_CACHE.get(key)
+			if current is None or current[0] < item[0]:
+				_ARIMA_ORDER_CACHE[key] = item
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import csv
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from . import backends
+
+# 随代码分发的中国行政区划地名表（省/地级/县级，含坐标与拼音），由 `python -m app.gazetteer build` 生成
+GAZETTEER_FILE = Path(os.environ.get("GAZETTEER_FILE", str(Path(__file__).resolve().parent / "resources" / "gazetteer.csv")))
+# 远程地理编码结果的落盘位置（仅在本地地名表无法解析时才会调用远程接口）
+GEOCODE_CACHE_FILE = Path(os.environ.get(
+	"GEOCODE_CACHE_FILE",
+	str(Path(__file__).resolve().parent.parent / "data" / "geocode_cache.json"),
+))
+
+COLUMNS = ["adcode", "name", "short", "province", "level", "lat", "lon", "pinyin", "initials"]
+
+# 同名地点的优先级：直辖市 > 地级市 > 省级 > 县级
+_LEVEL_RANK = {"prefecture": 3, "province": 2, "county": 1}
+_MUNICIPALITY_RANK = 4
+
+# 行政区划后缀（由长到短匹配），去掉后得到简称，如 “阳江市” -> “阳江”
+_SUFFIXES = (
+	"特别行政区", "维吾尔自治区", "壮族自治区", "回族自治区", "自治区", "自治州", "自治县", "自治旗",
+	"林区", "地区", "新区", "省", "市", "盟", "县", "区", "旗",
+)
+
+_lock = threading.Lock()
+_index: Optional["_Index"] = None
+_remembered: Optional[Dict[str, List[float]]] = None
+
+
+def short_name(name: str) -> str:
+	for suffix in _SUFFIXES:
+		if name.endswith(suffix) and len(name) - len(suffix) >= 2:
+			return name[: -len(suffix)]
+	return name
+
+
+def _normalize(text: str) -> str:
+	return "".join(ch for ch in str(text).lower() if not ch.isspace() and ch not in "'’-·")
+
+
+class _Index:
+	"""地名内存索引：中文全称/简称、全拼、拼音首字母的精确匹配与前缀匹配。"""
+
+	def __init__(self, places: List[dict]):
+		self.places = places
+		# 精确解析只用中文名与全拼；拼音首字母歧义较大，仅用于自动补全
+		exact: Dict[str, List[int]] = {}
+		keyed: Dict[str, List[int]] = {}
+		for i, place in enumerate(places):
+			for key in {place["name"], place["short"], place["pinyin"]}:
+				exact.setdefault(_normalize(key), []).append(i)
+			for key in {place["name"], place["short"], place["pinyin"], place["initials"]}:
+				keyed.setdefault(_normalize(key), []).append(i)
+		for ids in list(exact.values()) + list(keyed.values()):
+			ids.sort(key=self._rank)
+		self.exact = exact
+		self.keyed = keyed
+		# 前缀匹配：有序键列表 + 二分查找
+		self.keys = sorted(keyed)
+		self.by_adcode = {place["adcode"]: i for i, place in enumerate(places)}
+		self._tree = None
+		self._tree_lock = threading.Lock()
+
+	def tree(self):
+		"""球面距离（haversine）BallTree，首次使用时构建一次。"""
+		if self._tree is None:
+			with self._tree_lock:
+				if self._tree is None:
+					coords = np.radians(np.array([[p["lat"], p["lon"]] for p in self.places], dtype=float).reshape(-1, 2))
+					self._tree = backends.sklearn().BallTree(coords, metric="haversine")
+		return self._tree
+
+	def _rank(self, i: int) -> Tuple[int, int, str]:
+		place = self.places[i]
+		level = _LEVEL_RANK.get(place["level"], 0)
+		if place["level"] == "province" and place["name"].endswith("市"):
+			level = _MUNICIPALITY_RANK
+		return (-level, len(place["name"]), place["adcode"])
+
+	def lookup(self, key: str) -> List[int]:
+		return self.exact.get(_normalize(key), [])
+
+	def prefix(self, prefix: str, limit: int) -> List[int]:
+		prefix = _normalize(prefix)
+		if not prefix:
+			return []
+		# 完全匹配的在前，其余前缀匹配按级别排序
+		exact = self.keyed.get(prefix, [])
+		seen = set(exact)
+		rest: List[int] = []
+		start = bisect_left(self.keys, prefix)
+		for key in self.keys[start:]:
+			if not key.startswith(prefix) or len(rest) >= limit * 20:
+				break
+			for i in self.keyed[key]:
+				if i not in seen:
+					seen.add(i)
+					rest.append(i)
+		rest.sort(key=self._rank)
+		return exact + rest
+
+
+def _load_places(path: Path) -> List[dict]:
+	places: List[dict] = []
+	with path.open("r", encoding="utf-8", newline="") as fh:
+		for row in csv.DictReader(fh):
+			row["lat"] = float(row["lat"])
+			row["lon"] = float(row["lon"])
+			places.append(row)
+	return places
+
+
+def _get_index() -> "_Index":
+	global _index
+	if _index is not None:
+		return _index
+	with _lock:
+		if _index is None:
+			try:
+				places = _load_places(GAZETTEER_FILE)
+			except Exception:
+				places = []
+			_index = _Index(places)
+	return _index
+
+
+def places() -> List[dict]:
+	"""全部地名记录（只读）。"""
+	return _get_index().places
+
+
+def public(place: dict) -> dict:
+	return {k: place[k] for k in ("name", "short", "province", "level", "lat", "lon", "adcode")}
+
+
+def _matches_hint(place: dict, hint: str) -> bool:
+	return short_name(hint) in place["province"]
+
+
+def resolve(name: str) -> Optional[Tuple[float, float]]:
+	"""本地解析城市名称为 (纬度, 经度)，不访问网络。
+
+	支持中文全称/简称、全拼与拼音首字母，名称后可追加省份提示（如 “南阳,河南”）。
+	同名时按 直辖市 > 地级市 > 省级 > 县级 选取。
+	"""
+	raw = (name or "").replace("，", ",").strip()
+	parts = raw.split(",", 1)
+	query = parts[0].strip()
+	hint = parts[1].strip() if len(parts) > 1 else ""
+	index = _get_index()
+	ids = index.lookup(query) or index.lookup(short_name(query))
+	if hint:
+		ids = [i for i in ids if _matches_hint(index.places[i], hint)] or ids
+	if ids:
+		place = index.places[ids[0]]
+		return place["lat"], place["lon"]
+	coords = _get_remembered().get(raw)
+	return (coords[0], coords[1]) if coords else None
+
+
+def suggest(q: str, limit: int = 10, province: str = "") -> List[dict]:
+	"""城市自动补全：按中文、拼音或首字母前缀匹配，精确匹配优先。"""
+	index = _get_index()
+	ids = index.prefix(q, limit)
+	if province:
+		ids = [i for i in ids if _matches_hint(index.places[i], province)]
+	return [public(index.places[i]) for i in ids[:limit]]
+
+
+def prefecture_of(place: dict) -> dict:
+	"""县级地点所属的地级市（直辖市的区县返回直辖市）；找不到时返回自身。"""
+	index = _get_index()
+	code = place["adcode"]
+	for parent in (code[:4] + "00", code[:2] + "0000"):
+		i = index.by_adcode.get(parent)
+		if i is not None and parent != code:
+			parent_place = index.places[i]
+			if parent_place["level"] == "prefecture" or parent_place["name"].endswith("市"):
+				return parent_place
+	return place
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def spatial_index():
+	"""构建（或返回已构建的）空间索引；nearest/within 首次调用时自动构建，预加载 sklearn 时在启动时后台调用。"""
+	return _get_index().tree()
+
+
+def nearest(lat: float, lon: float, level: str = "") -> Optional[Tuple[dict, float]]:
+	"""距离 (lat, lon) 最近的地点（可按级别过滤）及其球面距离（公里）。"""
+	index = _get_index()
+	total = len(index.places)
+	point = np.radians([[float(lat), float(lon)]])
+	k = min(1 if not level else 16, total)
+	while k:
+		dist, ids = index.tree().query(point, k=k)
+		for i, d in zip(ids[0], dist[0]):
+			place = index.places[int(i)]
+			if not level or place["level"] == level:
+				return place, float(d * EARTH_RADIUS_KM)
+		# 最近的 k 个地点都不是该级别：扩大范围重查
+		k = 0 if k >= total else min(k * 4, total)
+	return None
+
+
+def within(lat: float, lon: float, radius_km: float, level: str = "", limit: int = 0) -> List[Tuple[dict, float]]:
+	"""半径 radius_km 公里内的全部地点（按距离升序），可按级别（province/prefecture/county）过滤。"""
+	index = _get_index()
+	if not index.places or radius_km <= 0:
+		return []
+	ids, dist = index.tree().query_radius(
+		np.radians([[float(lat), float(lon)]]), r=float(radius_km) / EARTH_RADIUS_KM, return_distance=True, sort_results=True,
+	)
+	out = []
+	for i, d in zip(ids[0], dist[0]):
+		place = index.places[int(i)]
+		if level and place["level"] != level:
+			continue
+		out.append((place, float(d * EARTH_RADIUS_KM)))
+		if limit and len(out) >= limit:
+			break
+	return out
+
+
+def _get_remembered() -> Dict[str, List[float]]:
+	global _remembered
+	if _remembered is not None:
+		return _remembered
+	with _lock:
+		if _remembered is None:
+			try:
+				_remembered = json.loads(GEOCODE_CACHE_FILE.read_text(encoding="utf-8"))
+			except Exception:
+				_remembered = {}
+	return _remembered
+
+
+def remember(name: str, lat: float, lon: float) -> None:
+	"""落盘一次远程地理编码结果，之后同名查询不再访问网络。"""
+	global _remembered
+	data = dict(_get_remembered())
+	data[name] = [float(lat), float(lon)]
+	with _lock:
+		_remembered = data
+		try:
+			GEOCODE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+			tmp = GEOCODE_CACHE_FILE.with_suffix(".tmp")
+			tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+			os.replace(tmp, GEOCODE_CACHE_FILE)
+		except Exception:
+			pass
+
+
+# 生成地名表时地名读音的修正（多音字）
+_PINYIN_OVERRIDES = {
+	"朝阳": ["chao", "yang"],
+	"乐亭": ["lao", "ting"],
+	"番禺": ["pan", "yu"],
+}
+
+
+def build(source: Path, target: Path = GAZETTEER_FILE) -> int:
+	"""由行政区划表（adcode,name,longitude,latitude，如 cpca 的 adcodes.csv）生成地名表，需要 pypinyin。"""
+	from pypinyin import lazy_pinyin  # 仅生成时需要
+
+	with Path(source).open("r", encoding="utf-8", newline="") as fh:
+		rows = [r for r in csv.DictReader(fh) if r.get("longitude") and r.get("latitude")]
+	provinces = {r["adcode"][:2]: r["name"] for r in rows if r["adcode"][2:].strip("0") == ""}
+	out = []
+	for r in rows:
+		name = r["name"].strip()
+		if name in ("市辖区", "县") or "直辖" in name:
+			continue
+		code = r["adcode"]
+		if code[2:].strip("0") == "":
+			level = "province"
+		elif code[4:].strip("0") == "":
+			level = "prefecture"
+		else:
+			level = "county"
+		short = short_name(name)
+		syllables = _PINYIN_OVERRIDES.get(short) or lazy_pinyin(short)
+		pinyin = "".join(syllables)
+		initials = "".join(s[0] for s in syllables if s)
+		out.append([
+			code[:6], name, short, provinces.get(code[:2], ""), level,
+			round(float(r["latitude"]), 4), round(float(r["longitude"]), 4), pinyin, initials,
+		])
+	out.sort(key=lambda row: row[0])
+	target = Path(target)
+	target.parent.mkdir(parents=True, exist_ok=True)
+	with target.open("w", encoding="utf-8", newline="") as fh:
+		writer = csv.writer(fh, lineterminator="\n")
+		writer.writerow(COLUMNS)
+		writer.writerows(out)
+	return len(out)
+
+
+def _main(argv: Sequence[str]) -> None:
+	"""命令行：python -m app.gazetteer build <adcodes.csv> [输出路径]"""
+	if len(argv) < 2 or argv[0] != "build":
+		print(_main.__doc__)
+		sys.exit(2)
+	target = Path(argv[2]) if len(argv) > 2 else GAZETTEER_FILE
+	print(f"{build(Path(argv[1]), target)} places -> {target}")
+
+
+if __name__ == "__main__":
+	_main(sys.argv[1:])
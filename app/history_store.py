@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 每个城市一个 NPZ 文件（列式存储：日期 + 各数值列）
+HISTORY_STORE_DIR = Path(os.environ.get("HISTORY_STORE_DIR", str(ROOT / "data" / "history")))
+HISTORY_STORE_ENABLED = os.environ.get("HISTORY_STORE_ENABLED", "1") not in ("0", "false", "False")
+# 落盘保留的最长天数
+HISTORY_MAX_DAYS = int(os.environ.get("HISTORY_MAX_DAYS", "3650"))
+# 文件在该时长（秒）内更新过则直接使用，不再请求上游
+HISTORY_STORE_FRESH = float(os.environ.get("HISTORY_STORE_FRESH", "3600"))
+
+COLUMNS = ["temperature_c", "tmin", "tmax", "precipitation_mm", "humidity", "wind_speed_ms"]
+
+_lock = threading.Lock()
+
+
+def _path(city: str) -> Path:
+	digest = hashlib.sha1(city.encode("utf-8")).hexdigest()[:16]
+	return HISTORY_STORE_DIR / f"{digest}.npz"
+
+
+def load(city: str) -> Optional[Tuple[pd.DataFrame, str, float]]:
+	"""读取已落盘的历史数据，返回 (数据, 来源, 写入时间戳)；不存在或损坏返回 None。"""
+	if not HISTORY_STORE_ENABLED:
+		return None
+	path = _path(city)
+	if not path.exists():
+		return None
+	try:
+		with np.load(path, allow_pickle=False) as z:
+			df = pd.DataFrame({"date": pd.to_datetime(z["date"].astype("datetime64[D]"))})
+			for col in COLUMNS:
+				df[col] = z[col].astype(float)
+			source = str(z["source"])
+			saved_at = float(z["saved_at"])
+		return df, source, saved_at
+	except Exception:
+		return None
+
+
+def save(city: str, df: pd.DataFrame, source: str) -> None:
+	"""原子写入（先写临时文件再替换），只保留最近 HISTORY_MAX_DAYS 天。"""
+	if not HISTORY_STORE_ENABLED:
+		return
+	df = df.sort_values("date").tail(HISTORY_MAX_DAYS)
+	arrays = {
+		"date": pd.to_datetime(df["date"]).values.astype("datetime64[D]"),
+		"source": np.asarray(source),
+		"saved_at": np.asarray(time.time()),
+		"city": np.asarray(city),
+	}
+	for col in COLUMNS:
+		values = df[col].values if col in df else np.full(len(df), np.nan)
+		arrays[col] = np.asarray(values, dtype=float)
+	path = _path(city)
+	tmp = path.with_suffix(".tmp.npz")
+	with _lock:
+		try:
+			HISTORY_STORE_DIR.mkdir(parents=True, exist_ok=True)
+			np.savez(tmp, **arrays)
+			os.replace(tmp, path)
+		except Exception:
+			try:
+				tmp.unlink()
+			except Exception:
+				pass
+
+
+def merge(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+	"""按日期合并，重叠日期以新数据为准（近期数据会被上游修订）。"""
+	df = pd.concat([old, new[[c for c in ["date"] + COLUMNS if c in new]]], ignore_index=True)
+	df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+	df = df.drop_duplicates(subset="date", keep="last").sort_values("date")
+	return df.tail(HISTORY_MAX_DAYS).reset_index(drop=True)
+
+
+def is_fresh(saved_at: float) -> bool:
+	return time.time() - saved_at <= HISTORY_STORE_FRESH
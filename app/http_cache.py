@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Optional, Tuple
+
+import hashlib
+import os
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .encoding import FastJSONResponse
+from .metrics import cache_result
+
+# /api/* 响应的默认缓存时长（秒）
+API_CACHE_MAX_AGE = int(os.environ.get("API_CACHE_MAX_AGE", "60"))
+
+# 不允许缓存的接口（有副作用或反映进程实时状态）
+NO_STORE_PATHS = {"/api/health", "/api/refresh", "/api/startup", "/api/metrics"}
+# 个别接口的 Cache-Control（未列出的使用 public, max-age=API_CACHE_MAX_AGE）
+CACHE_CONTROL_OVERRIDES = {
+	"/api/ip-city": "private, max-age=300",
+	"/api/config/options": "public, max-age=3600",
+	"/api/cities/suggest": "public, max-age=86400",
+	"/api/cities/nearby": "public, max-age=86400",
+}
+
+
+def cache_control_for(path: str) -> str:
+	if path in NO_STORE_PATHS:
+		return "no-store"
+	return CACHE_CONTROL_OVERRIDES.get(path, f"public, max-age={API_CACHE_MAX_AGE}")
+
+
+def make_etag(*parts: Any) -> str:
+	digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+	return f'W/"{digest}"'
+
+
+def body_etag(body: bytes) -> str:
+	return f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+	"""If-None-Match 弱比较（忽略 W/ 前缀），支持逗号分隔的多个值与 *。"""
+	header = request.headers.get("if-none-match")
+	if not header:
+		return False
+	matched = header.strip() == "*"
+	want = etag[2:] if etag.startswith("W/") else etag
+	for candidate in header.split(","):
+		candidate = candidate.strip()
+		if candidate.startswith("W/"):
+			candidate = candidate[2:]
+		if candidate == want:
+			matched = True
+			break
+	cache_result("http_etag", "hit" if matched else "miss")
+	return matched
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+	return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def _request_etag(request: Request, parts: Tuple[Any, ...]) -> str:
+	query = sorted(request.query_params.multi_items())
+	return make_etag(request.url.path, query, *parts)
+
+
+def conditional_json(
+	request: Request,
+	build: Callable[[], Any],
+	etag_parts: Callable[[], Optional[Tuple[Any, ...]]],
+) -> Response:
+	"""带 ETag 的 JSON 响应。
+
+	etag_parts() 不得触发计算（数据/预测未就绪时返回 None）。若其结果与 If-None-Match 匹配，
+	直接返回 304 而不执行 build()；否则执行 build()，再按就绪后的版本（或响应体哈希）生成 ETag。
+	"""
+	cache_control = cache_control_for(request.url.path)
+	parts = etag_parts()
+	if parts is not None:
+		etag = _request_etag(request, parts)
+		if etag_matches(request, etag):
+			return not_modified(etag, cache_control)
+	body = build()
+	parts = etag_parts() if parts is None else parts
+	response = FastJSONResponse(body)
+	etag = _request_etag(request, parts) if parts is not None else body_etag(response.body)
+	if etag_matches(request, etag):
+		return not_modified(etag, cache_control)
+	response.headers["ETag"] = etag
+	response.headers["Cache-Control"] = cache_control
+	return response
+
+
+async def api_cache_headers(request: Request, call_next):
+	"""/api/* 兜底：补充 Cache-Control，未自带 ETag 的 200 响应按响应体哈希生成 ETag 并处理 304。"""
+	response = await call_next(request)
+	path = request.url.path
+	if not path.startswith("/api/"):
+		return response
+	cache_control = cache_control_for(path)
+	if "cache-control" not in response.headers:
+		response.headers["Cache-Control"] = cache_control
+	if response.status_code != 200 or "etag" in response.headers or path in NO_STORE_PATHS:
+		return response
+	body = b"".join([chunk async for chunk in response.body_iterator])
+	etag = body_etag(body)
+	if etag_matches(request, etag):
+		return not_modified(etag, response.headers["Cache-Control"])
+	headers = dict(response.headers)
+	headers.pop("content-length", None)
+	headers["ETag"] = etag
+	return Response(content=body, status_code=response.status_code, headers=headers, media_type=response.media_type)
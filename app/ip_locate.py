@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import csv
+import ipaddress
+import os
+import re
+import threading
+import time
+
+from . import gazetteer
+from .cache import TTLCache
+from .singleflight import SingleFlight
+from .upstream import submit_json
+
+# 整体截止时间（秒）：所有 IP 定位服务并发请求，取最先返回的有效结果
+IP_CITY_DEADLINE = float(os.environ.get("IP_CITY_DEADLINE", "4"))
+# 按客户端 IP 缓存定位结果（秒）；失败结果只缓存 IP_CITY_NEGATIVE_TTL 秒
+IP_CITY_CACHE_TTL = float(os.environ.get("IP_CITY_CACHE_TTL", "3600"))
+IP_CITY_NEGATIVE_TTL = float(os.environ.get("IP_CITY_NEGATIVE_TTL", "60"))
+# 可选：本地 IP 段库（CSV，表头含 start,end,city，可选 province,lat,lon），命中则不访问网络
+IP_CITY_DB = os.environ.get("IP_CITY_DB", "")
+# 受信任的反向代理（逗号分隔的 IP 或网段）；仅来自这些地址的请求才读取 X-Forwarded-For / X-Real-IP
+TRUSTED_PROXIES = os.environ.get("TRUSTED_PROXIES", "")
+
+_CACHE = TTLCache(ttl=IP_CITY_CACHE_TTL, maxsize=4096, name="ip_city")
+_LOOKUPS = SingleFlight("ip-city", timeout=IP_CITY_DEADLINE + 2)
+
+_db_lock = threading.Lock()
+_db: Optional[Tuple[List[int], List[int], List[dict]]] = None
+
+
+def _parse_networks(raw: str) -> list:
+	networks = []
+	for item in raw.split(","):
+		item = item.strip()
+		if not item:
+			continue
+		try:
+			networks.append(ipaddress.ip_network(item, strict=False))
+		except ValueError:
+			continue
+	return networks
+
+
+_TRUSTED_NETWORKS = _parse_networks(TRUSTED_PROXIES)
+
+
+def _trusted(ip: Optional[str]) -> bool:
+	try:
+		addr = ipaddress.ip_address(ip or "")
+	except ValueError:
+		return False
+	return any(addr in net for net in _TRUSTED_NETWORKS)
+
+
+def client_ip(headers, peer: Optional[str]) -> Optional[str]:
+	"""客户端 IP：直连地址；来自受信任代理时取 X-Forwarded-For 中最右侧的非代理地址（或 X-Real-IP）。"""
+	if not _trusted(peer):
+		return peer
+	forwarded = headers.get("x-forwarded-for")
+	if forwarded:
+		hops = [h.strip() for h in forwarded.split(",") if h.strip()]
+		for hop in reversed(hops):
+			if not _trusted(hop):
+				return hop
+		if hops:
+			return hops[0]
+	return headers.get("x-real-ip") or peer
+
+
+def _public_ip(ip: Optional[str]) -> Optional[str]:
+	"""仅公网 IP 才按客户端查询；本机/内网访问时交由服务商识别出口 IP（与以前的行为一致）。"""
+	try:
+		addr = ipaddress.ip_address(ip or "")
+	except ValueError:
+		return None
+	return str(addr) if addr.is_global else None
+
+
+def _load_db() -> Optional[Tuple[List[int], List[int], List[dict]]]:
+	global _db
+	if not IP_CITY_DB:
+		return None
+	if _db is not None:
+		return _db
+	with _db_lock:
+		if _db is None:
+			rows = []
+			try:
+				with Path(IP_CITY_DB).open("r", encoding="utf-8", newline="") as fh:
+					for r in csv.DictReader(fh):
+						try:
+							start = int(ipaddress.ip_address(r["start"].strip()))
+							end = int(ipaddress.ip_address(r["end"].strip()))
+						except (KeyError, ValueError):
+							continue
+						lat, lon = r.get("lat"), r.get("lon")
+						rows.append((start, end, {
+							"city": r.get("city") or None,
+							"province": r.get("province") or None,
+							"lat": float(lat) if lat else None,
+							"lon": float(lon) if lon else None,
+						}))
+			except OSError:
+				rows = []
+			rows.sort(key=lambda row: row[0])
+			_db = ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+	return _db
+
+
+def _lookup_db(ip: Optional[str]) -> Optional[dict]:
+	db = _load_db()
+	if db is None or not ip:
+		return None
+	try:
+		value = int(ipaddress.ip_address(ip))
+	except ValueError:
+		return None
+	starts, ends, infos = db
+	i = bisect_right(starts, value) - 1
+	if i >= 0 and value <= ends[i]:
+		return dict(infos[i])
+	return None
+
+
+# ip.cn 地址解析：提取省与市（可能不含经纬度）
+def _pick_ipcn(j: dict) -> Optional[dict]:
+	addr = str(j.get("address") or j.get("location") or j.get("addr") or "")
+	prov = None
+	_mprov = re.search(r"([\u4e00-\u9fa5]{2,7})(?:省|市|自治区|特别行政区)", addr)
+	if _mprov:
+		prov = _mprov.group(1)
+	cand = re.findall(r"([\u4e00-\u9fa5]{2,8}(?:市|自治州|地区|盟|州|县|区))", addr)
+	if cand:
+		for c in cand:
+			if c.endswith("市"):
+				return {"city": c, "province": prov}
+		return {"city": cand[-1], "province": prov}
+	for k in ("city", "city_name"):
+		if j.get(k):
+			return {"city": j.get(k), "province": prov}
+	return None
+
+
+def _providers(ip: Optional[str]) -> List[Tuple[str, str, Callable[[dict], Optional[dict]]]]:
+	"""(名称, URL, 解析函数)；ip 为空时查询请求方（即服务器出口）IP。"""
+	return [
+		("ip.cn", f"https://ip.cn/api/index?ip={ip or ''}&type={1 if ip else 0}", _pick_ipcn),
+		(
+			"ipapi",
+			f"https://ipapi.co/{ip + '/' if ip else ''}json/",
+			lambda j: {"city": j.get("city") or j.get("region_city"), "lat": j.get("latitude"), "lon": j.get("longitude")},
+		),
+		(
+			"ipwho",
+			f"https://ipwho.is/{ip or ''}",
+			lambda j: None if j.get("success") is False else {"city": j.get("city"), "lat": j.get("latitude"), "lon": j.get("longitude")},
+		),
+		(
+			"ip-api",
+			f"http://ip-api.com/json/{ip or ''}?fields=status,city,lat,lon&lang=zh-CN",
+			lambda j: {"city": j.get("city"), "lat": j.get("lat"), "lon": j.get("lon")} if j.get("status") == "success" else None,
+		),
+	]
+
+
+def _safe(pick: Callable[[dict], Optional[dict]]) -> Callable[[dict], Optional[dict]]:
+	def parse(j: dict) -> Optional[dict]:
+		try:
+			info = pick(j or {})
+		except Exception:
+			return None
+		return info if info and (info.get("city") or info.get("lat") is not None) else None
+	return parse
+
+
+def _query_providers(ip: Optional[str], deadline: float) -> Tuple[Optional[dict], Optional[str]]:
+	"""并发请求全部服务商，返回最先到达的有效结果 (信息, 服务商)，截止时间内都失败则返回 (None, None)。"""
+	futures = {
+		submit_json(url, timeout=deadline, retries=0, parse=_safe(pick)): name
+		for name, url, pick in _providers(ip)
+	}
+	pending = set(futures)
+	end = time.monotonic() + deadline
+	while pending:
+		remaining = end - time.monotonic()
+		if remaining <= 0:
+			break
+		done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+		for future in done:
+			try:
+				info = future.result()
+			except Exception:
+				info = None
+			if info:
+				for other in pending:
+					other.cancel()
+				return info, futures[future]
+	return None, None
+
+
+def _normalize(info: dict) -> Optional[str]:
+	"""归一化为中文城市简称（如“北京”，与预计算/接口使用的城市名一致）：有坐标时取本地地名表中最近地点所属的地级市，否则按名称匹配。"""
+	lat, lon = info.get("lat"), info.get("lon")
+	if lat is not None and lon is not None:
+		try:
+			hit = gazetteer.nearest(float(lat), float(lon))
+		except (TypeError, ValueError):
+			hit = None
+		if hit is not None:
+			return gazetteer.prefecture_of(hit[0])["short"]
+	city = info.get("city")
+	if city:
+		hint = f"{city},{info['province']}" if info.get("province") else city
+		coords = gazetteer.resolve(hint)
+		hit = gazetteer.nearest(*coords) if coords is not None else None
+		if hit is not None:
+			return gazetteer.prefecture_of(hit[0])["short"]
+	return None
+
+
+def _locate(ip: Optional[str]) -> dict:
+	info, source = _lookup_db(ip), "ipdb"
+	if info is None:
+		info, source = _query_providers(_public_ip(ip), IP_CITY_DEADLINE)
+	info = info or {}
+	result = {
+		"city": info.get("city"),
+		"lat": info.get("lat"),
+		"lon": info.get("lon"),
+		"normalized": _normalize(info) if info else None,
+		"source": source,
+	}
+	ttl = IP_CITY_CACHE_TTL if result["normalized"] or result["city"] else IP_CITY_NEGATIVE_TTL
+	_CACHE.set(ip or "", result, ttl=ttl)
+	return result
+
+
+def locate(ip: Optional[str]) -> dict:
+	"""按客户端 IP 猜测城市：本地 IP 库 → 多服务商并发（截止时间内取最先的有效结果）→ 本地地名表归一化。
+
+	结果按 IP 缓存；同一 IP 的并发请求只查询一次。
+	"""
+	hit = _CACHE.get(ip or "")
+	if hit is not None:
+		return hit
+	return _LOOKUPS.do(ip or "", lambda: _locate(ip))
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+
+# 压测驱动：按真实的接口与城市分布请求运行中的 FastAPI 服务，报告吞吐与 p50/p95/p99 延迟。
+# 配合 app.openmeteo_stub 可在无网络的机器上评估不同 worker 数下的容量。
+
+# 接口权重（大致对应前端的请求构成：首页看板为主，其次是预测、自动补全等）
+DEFAULT_MIX = {
+	"dashboard": 35, "forecast": 20, "history": 10, "alerts": 8, "alerts_summary": 5,
+	"recommend": 5, "nlp": 5, "suggest": 9, "batch": 3,
+}
+DEFAULT_CITIES = (
+	"北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "西安", "南京", "重庆",
+	"天津", "苏州", "长沙", "郑州", "青岛", "沈阳", "哈尔滨", "昆明", "厦门", "南宁",
+)
+NLP_QUERIES = ("明天穿什么", "未来一周会下雨吗", "明天温度多少", "有高温预警吗", "需要带伞吗")
+SUGGEST_PREFIXES = ("bei", "shang", "广", "sz", "hang", "成", "wu", "xi", "南", "chong")
+
+Route = Callable[[random.Random, str, Sequence[str]], Tuple[str, dict]]
+
+ROUTES: Dict[str, Route] = {
+	"dashboard": lambda rng, city, cities: ("/api/dashboard", {"city": city, "days": 7, "history_days": 14}),
+	"forecast": lambda rng, city, cities: ("/api/forecast", {"city": city, "days": rng.choice((3, 7, 14))}),
+	"history": lambda rng, city, cities: ("/api/history", {"city": city, "days": rng.choice((7, 30, 90))}),
+	"alerts": lambda rng, city, cities: ("/api/alerts", {"city": city, "days": 7}),
+	"alerts_summary": lambda rng, city, cities: ("/api/alerts/summary", {"city": city, "days": 7}),
+	"recommend": lambda rng, city, cities: ("/api/recommend", {"city": city, "days": 1}),
+	"nlp": lambda rng, city, cities: ("/api/nlp", {"city": city, "q": rng.choice(NLP_QUERIES)}),
+	"suggest": lambda rng, city, cities: ("/api/cities/suggest", {"q": rng.choice(SUGGEST_PREFIXES), "limit": 8}),
+	"batch": lambda rng, city, cities: ("/api/forecast/batch", {"cities": ",".join(rng.sample(list(cities), min(5, len(cities)))), "days": 7}),
+}
+
+
+def zipf_weights(n: int, s: float = 1.1) -> List[float]:
+	"""城市热度：排名靠前的城市请求更多（Zipf 分布）。"""
+	return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+	"""解析 "dashboard=5,forecast=2" 形式的接口权重。"""
+	mix = {}
+	for part in text.split(","):
+		if not part.strip():
+			continue
+		name, _, weight = part.partition("=")
+		name = name.strip()
+		if name not in ROUTES:
+			raise ValueError(f"未知接口 {name!r}，可选：{', '.join(ROUTES)}")
+		mix[name] = float(weight or 1)
+	return mix
+
+
+def percentiles(values: Sequence[float]) -> dict:
+	if not values:
+		return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+	p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+	return {
+		"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+		"max_ms": round(max(values) * 1000, 2),
+	}
+
+
+async def _worker(client: httpx.AsyncClient, plan: dict, end: float, records: list, etags: dict) -> None:
+	rng = plan["rng"]
+	while time.monotonic() < end:
+		route = rng.choices(plan["routes"], weights=plan["route_weights"])[0]
+		city = rng.choices(plan["cities"], weights=plan["city_weights"])[0]
+		path, params = ROUTES[route](rng, city, plan["cities"])
+		key = (path, tuple(sorted(params.items())))
+		headers = {}
+		# 模拟浏览器带 ETag 的条件请求
+		if key in etags and rng.random() < plan["conditional"]:
+			headers["If-None-Match"] = etags[key]
+		t0 = time.perf_counter()
+		try:
+			resp = await client.get(path, params=params, headers=headers)
+			status = resp.status_code
+			if resp.headers.get("etag"):
+				etags[key] = resp.headers["etag"]
+		except httpx.HTTPError as exc:
+			status = type(exc).__name__
+		records.append((route, status, time.perf_counter() - t0))
+
+
+def summarize(records: list, seconds: float) -> dict:
+	"""汇总一轮压测：吞吐、状态码分布、整体与各接口的延迟分位数。错误指 5xx 与连接/超时异常。"""
+	statuses: Dict[str, int] = {}
+	by_route: Dict[str, List[float]] = {}
+	errors = 0
+	for route, status, latency in records:
+		statuses[str(status)] = statuses.get(str(status), 0) + 1
+		by_route.setdefault(route, []).append(latency)
+		if not isinstance(status, int) or status >= 500:
+			errors += 1
+	return {
+		"requests": len(records),
+		"seconds": round(seconds, 2),
+		"throughput_rps": round(len(records) / seconds, 2) if seconds > 0 else None,
+		"error_rate": round(errors / len(records), 4) if records else None,
+		"statuses": dict(sorted(statuses.items())),
+		"latency": percentiles([r[2] for r in records]),
+		"routes": {
+			route: {"requests": len(values), **percentiles(values)}
+			for route, values in sorted(by_route.items())
+		},
+	}
+
+
+async def run_level(
+	base_url: str,
+	concurrency: int,
+	duration: float,
+	warmup: float = 0.0,
+	mix: Optional[Dict[str, float]] = None,
+	cities: Sequence[str] = DEFAULT_CITIES,
+	conditional: float = 0.3,
+	timeout: float = 60.0,
+	seed: int = 0,
+) -> dict:
+	"""以固定并发（闭环：每个虚拟用户收到响应后立即发下一个请求）压测 duration 秒，warmup 期间的结果不计入。"""
+	mix = mix or DEFAULT_MIX
+	limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+	etags: dict = {}
+	async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+		def plans(offset: int):
+			return [
+				{
+					"rng": random.Random(seed + offset + i),
+					"routes": list(mix), "route_weights": list(mix.values()),
+					"cities": list(cities), "city_weights": zipf_weights(len(cities)),
+					"conditional": conditional,
+				}
+				for i in range(concurrency)
+			]
+
+		if warmup > 0:
+			end = time.monotonic() + warmup
+			await asyncio.gather(*(_worker(client, p, end, [], etags) for p in plans(10_000)))
+		records: list = []
+		t0 = time.monotonic()
+		end = t0 + duration
+		await asyncio.gather(*(_worker(client, p, end, records, etags) for p in plans(0)))
+		elapsed = time.monotonic() - t0
+	out = summarize(records, elapsed)
+	out["concurrency"] = concurrency
+	return out
+
+
+def _stub_stats(stub_url: str) -> Optional[dict]:
+	try:
+		return httpx.get(stub_url.rstrip("/") + "/_stub/stats", timeout=5).json().get("requests")
+	except Exception:
+		return None
+
+
+def _format_level(result: dict) -> List[str]:
+	lat = result["latency"]
+	lines = [
+		f"concurrency {result['concurrency']:>4}: {result['requests']} req in {result['seconds']}s"
+		f"  {result['throughput_rps']} req/s  errors {result['error_rate']}"
+		f"  p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms  statuses {result['statuses']}",
+	]
+	for route, r in result["routes"].items():
+		lines.append(f"    {route:<16} {r['requests']:>7}  p50 {r['p50_ms']:>9} ms  p95 {r['p95_ms']:>9} ms  p99 {r['p99_ms']:>9} ms")
+	return lines
+
+
+def _main(argv: Sequence[str]) -> int:
+	"""命令行：python -m app.loadtest [--url http://127.0.0.1:8000] [--concurrency 1,8,32] [--duration 30] [--mix dashboard=5,forecast=2]"""
+	parser = argparse.ArgumentParser(prog="python -m app.loadtest", description="对运行中的服务做端到端压测")
+	parser.add_argument("--url", default="http://127.0.0.1:8000", help="被测服务地址")
+	parser.add_argument("--concurrency", default="8", help="并发用户数，逗号分隔时依次压测各档")
+	parser.add_argument("--duration", type=float, default=30.0, help="每档压测秒数")
+	parser.add_argument("--warmup", type=float, default=5.0, help="每档预热秒数（不计入结果）")
+	parser.add_argument("--mix", default="", help=f"接口权重，可选：{', '.join(ROUTES)}")
+	parser.add_argument("--cities", default="", help="城市列表（逗号分隔，靠前的更热门）")
+	parser.add_argument("--conditional", type=float, default=0.3, help="携带 If-None-Match 的请求比例")
+	parser.add_argument("--timeout", type=float, default=60.0)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--stub", default="", help="Open-Meteo 替身地址，报告中附带各档的上游请求数")
+	parser.add_argument("--out", help="把结果写入 JSON 文件")
+	args = parser.parse_args(argv)
+
+	mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+	cities = [c.strip() for c in args.cities.split(",") if c.strip()] or list(DEFAULT_CITIES)
+	results = []
+	for level in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+		before = _stub_stats(args.stub) if args.stub else None
+		result = asyncio.run(run_level(
+			args.url, level, args.duration, args.warmup, mix, cities, args.conditional, args.timeout, args.seed,
+		))
+		if before is not None:
+			after = _stub_stats(args.stub) or {}
+			result["upstream_requests"] = {k: v - before.get(k, 0) for k, v in after.items() if v != before.get(k, 0)}
+		results.append(result)
+		print("\n".join(_format_level(result)), flush=True)
+	out = {"url": args.url, "duration": args.duration, "warmup": args.warmup, "mix": mix, "cities": cities, "levels": results}
+	if args.out:
+		Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+		Path(args.out).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+		print(f"-> {args.out}")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(_main(sys.argv[1:]))
@@ -1,22 +1,55 @@
-from fastapi import FastAPI, Query
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
+from datetime import date
 from pathlib import Path
 import os
+import threading
 
 # 设置环境变量来禁用TensorFlow的oneDNN警告
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # 禁用INFO和WARNING日志
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # 禁用oneDNN优化
 
-from .data_loader import load_city_weather, get_data_source, refresh_data
-from .forecasting import forecast_temperature_and_precipitation
-from .alerts import generate_alerts
+from .data_loader import city_metadata, city_store_stats, get_data_source, get_loaded_version, load_city_weather, refresh_data
+from .pipeline import city_versions, get_cities_forecast, get_city_alerts, get_city_forecast, note_city_request
+from .scheduler import PRECOMPUTE_ENABLED, PrecomputeScheduler
+from .forecasting import FORECAST_ENGINE
+from . import backends, compute, gazetteer, ip_locate, metrics, upstream
+from .encoding import FastJSONResponse, history_columns, history_rows, records_to_columns
+from .http_cache import api_cache_headers, conditional_json
+from .compute import ComputeSaturated
+from .singleflight import CoalesceTimeout
 from .recommend import recommend_outfit
 from .nlp import parse_intent, parse_outfit_target, parse_assistant_topic
 from .clustering import compute_weather_clusters
 
-app = FastAPI(title="天气智能网站", version="0.2.0")
+# 批量预测接口单次最多城市数
+MAX_BATCH_CITIES = 100
+
+scheduler = PrecomputeScheduler()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+	# 可选：启动时预加载 statsmodels/TensorFlow/scikit-learn（PRELOAD_BACKENDS=all 或逗号列表）
+	if backends.PRELOAD_BACKENDS:
+		backends.preload()
+	# 后台预计算内置/热门城市，避免首个请求承担冷启动的拉取与建模
+	if PRECOMPUTE_ENABLED:
+		scheduler.start()
+	# 空间索引（BallTree）依赖 scikit-learn：默认在首次附近查询时构建，预加载 sklearn 时才在后台提前构建
+	if "sklearn" in backends.preload_names():
+		threading.Thread(target=gazetteer.spatial_index, name="gazetteer-index", daemon=True).start()
+	yield
+	scheduler.stop()
+	compute.shutdown()
+	upstream.close()
+
+
+app = FastAPI(title="天气智能网站", version="0.2.0", lifespan=lifespan)
 
 app.add_middleware(
 	CORSMiddleware,
@@ -24,7 +57,25 @@ app.add_middleware(
 	allow_credentials=True,
 	allow_methods=["*"],
 	allow_headers=["*"],
+	expose_headers=["ETag"],
 )
+# /api/* 统一补充 Cache-Control；未自带 ETag 的响应按响应体生成 ETag 并支持 304
+app.middleware("http")(api_cache_headers)
+app.middleware("http")(metrics.http_middleware)
+
+
+@app.exception_handler(CoalesceTimeout)
+def coalesce_timeout(_request: Request, exc: CoalesceTimeout):
+	# 同一城市的冷启动计算仍在进行，提示客户端稍后重试
+	return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "5", "Cache-Control": "no-store"})
+
+
+@app.exception_handler(ComputeSaturated)
+def compute_saturated(_request: Request, exc: ComputeSaturated):
+	# 计算队列已满：立即拒绝，而不是让排队延迟无限增长
+	return JSONResponse(
+		{"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after), "Cache-Control": "no-store"},
+	)
 
 frontend_dir = Path(__file__).resolve().parent.parent / "frontend"
 if frontend_dir.exists():
@@ -41,122 +92,36 @@ def index():
 
 @app.get("/api/health")
 def health():
-	return {"status": "ok", "data_source": get_data_source()}
+	return {
+		"status": "ok",
+		# 默认城市（北京）的数据来源，保留原有字段；各已加载城市见 data_sources
+		"data_source": get_data_source("北京"),
+		"data_sources": {city: m["source"] for city, m in city_metadata().items()},
+		"compute": compute.tier.stats(),
+		"city_store": city_store_stats(),
+	}
+
+
+@app.get("/api/metrics")
+def metrics_endpoint():
+	"""Prometheus 文本格式指标：各阶段耗时、上游请求、缓存命中率与各城市数据来源/新鲜度。"""
+	return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/startup")
+def startup_report():
+	"""启动耗时与各机器学习后端的导入耗时/内存增量。"""
+	return backends.report()
 
 
 @app.get("/api/ip-city")
-def ip_city():
-	"""服务端基于来访 IP 猜测城市名称。精细化流程：
-	1) 多源 IP 服务拿到 city 与经纬度
-	2) 反向地理编码（Open‑Meteo）选取最近的中国城市
-	3) 返回原始 city、经纬度与归一化中文名
+def ip_city(request: Request):
+	"""服务端基于来访 IP 猜测城市名称：
+	1) 可选的本地 IP 段库（IP_CITY_DB）命中则不访问网络
+	2) 否则多个 IP 服务并发查询，在 IP_CITY_DEADLINE 秒内取最先返回的有效结果
+	3) 用本地地名表把坐标/名称归一化为中文地级市名；结果按客户端 IP 缓存
 	"""
-	import math
-	import requests as _rq
-
-	def _try(url, pick):
-		try:
-			r = _rq.get(url, timeout=6)
-			r.raise_for_status()
-			j = r.json()
-			return pick(j)
-		except Exception:
-			return None
-
-	# ip.cn 地址解析：提取省与市（可能不含经纬度）
-	def _pick_ipcn(j):
-		import re
-		addr = str(j.get("address") or j.get("location") or j.get("addr") or "")
-		prov = None
-		_mprov = re.search(r"([\u4e00-\u9fa5]{2,7})(?:省|市|自治区|特别行政区)", addr)
-		if _mprov:
-			prov = _mprov.group(1)
-		cand = re.findall(r"([\u4e00-\u9fa5]{2,8}(?:市|自治州|地区|盟|州|县|区))", addr)
-		if cand:
-			for c in cand:
-				if c.endswith("市"):
-					return {"city": c, "province": prov}
-			return {"city": cand[-1], "province": prov}
-		for k in ("city", "city_name"):
-			if j.get(k):
-				return {"city": j.get(k), "province": prov}
-		return None
-
-	# 1) IP -> 粗定位（优先 ip.cn，其次 ipapi/ipwho/ip-api）
-	info = _try("https://ip.cn/api/index?type=0", _pick_ipcn)
-	if not info:
-		info = _try(
-			"https://ipapi.co/json/",
-			lambda j: {
-				"city": j.get("city") or j.get("region_city"),
-				"lat": j.get("latitude"),
-				"lon": j.get("longitude"),
-			},
-		)
-	if not info:
-		info = _try(
-			"https://ipwho.is/",
-			lambda j: None if (j is None or j.get("success") is False) else {"city": j.get("city"), "lat": j.get("latitude"), "lon": j.get("longitude")},
-		)
-	if not info:
-		info = _try(
-			"http://ip-api.com/json/?fields=status,city,lat,lon&lang=zh-CN",
-			lambda j: ({"city": j.get("city"), "lat": j.get("lat"), "lon": j.get("lon")} if j and j.get("status") == "success" else None),
-		)
-	# （ip.cn 已作为首选数据源，不再在此兜底）
-
-	city = (info or {}).get("city")
-	lat = (info or {}).get("lat")
-	lon = (info or {}).get("lon")
-
-	# 2) 反向地理编码：取最近的中国城市
-	def _reverse(lat_: float, lon_: float):
-		if lat_ is None or lon_ is None:
-			return None
-		resp = _try(
-			f"https://geocoding-api.open-meteo.com/v1/reverse?latitude={lat_}&longitude={lon_}&language=zh&count=10",
-			lambda j: j,
-		)
-		if not resp:
-			return None
-		items = resp.get("results") or []
-		if not items:
-			return None
-		# 排序策略：先中国优先 → 距离最近优先 → 再考虑行政等级
-		def _score(it: dict):
-			code = (it.get("feature_code") or "").upper()
-			rank = {"PPLC": 5, "PPLA": 4, "PPLA2": 4, "PPLA3": 3, "PPLA4": 3}
-			lvl = rank.get(code, 2 if code.startswith("PPL") else 1)
-			# 近者优先；接口里可能没有距离，自己算一下
-			try:
-				la = float(it.get("latitude")); lo = float(it.get("longitude"))
-				# 粗略球面距离
-				d = (la - float(lat_)) ** 2 + (lo - float(lon_)) ** 2
-			except Exception:
-				d = 9e9
-			# 注意我们把距离放到第二维（-d 越大说明越近），避免偏向省会
-			return (1 if it.get("country_code") == "CN" else 0, -d, lvl)
-		items.sort(key=_score, reverse=True)
-		return items[0]
-
-	best = _reverse(lat, lon)
-	normalized = best.get("name") if best else None
-
-	# 3) 若仍无 normalized，则退化到 name 搜索归一化
-	if not normalized and city:
-		geo = _try(
-			f"https://geocoding-api.open-meteo.com/v1/search?name={city}&language=zh&count=5",
-			lambda j: j,
-		)
-		try:
-			items = (geo or {}).get("results") or []
-			cn_items = [it for it in items if it.get("country_code") == "CN"] or items
-			if cn_items:
-				normalized = cn_items[0].get("name")
-		except Exception:
-			pass
-
-	return {"city": city, "lat": lat, "lon": lon, "normalized": normalized}
+	return ip_locate.locate(ip_locate.client_ip(request.headers, request.client.host if request.client else None))
 
 
 @app.get("/api/refresh")
@@ -165,48 +130,110 @@ def refresh(city: str = Query("北京")):
 	return {"refreshed": True, "data_source": source}
 
 
-@app.get("/api/history")
-def history(city: str = Query("北京"), days: int = Query(30, ge=7, le=90)):
-	df = load_city_weather(city)
-	df = df.sort_values("date").tail(days)
-	return {
-		"city": city,
-		"data_source": get_data_source(),
-		"history": [
-			{
-				"date": str(row.date.date() if hasattr(row.date, 'date') else row.date),
-				"temperature_c": float(row.temperature_c),
-				"tmin": float(getattr(row, 'tmin', row.temperature_c)),
-				"tmax": float(getattr(row, 'tmax', row.temperature_c)),
-				"precipitation_mm": float(row.precipitation_mm),
-				"humidity": float(row.humidity),
-				"wind_speed_ms": float(row.wind_speed_ms),
-			}
-			for row in df.itertuples(index=False)
-		],
-	}
+def _versions(city: str, alerts: bool = False, engine: str = FORECAST_ENGINE):
+	"""ETag 组成部分：城市数据版本、结果标签与数据来源；未就绪时返回 None（不触发计算）。"""
+	versions = city_versions(city, alerts=alerts, engine=engine)
+	if versions is None:
+		return None
+	return versions + (get_data_source(city),)
+
+
+@app.get("/api/history", response_class=FastJSONResponse)
+def history(
+	request: Request,
+	city: str = Query("北京"),
+	days: int = Query(30, ge=7, le=90),
+	format: str = Query("rows", pattern="^(rows|columnar)$"),
+):
+	note_city_request(city)
+
+	def build():
+		df = load_city_weather(city)
+		df = df.sort_values("date").tail(days)
+		body = {"city": city, "data_source": get_data_source(city)}
+		if format == "columnar":
+			body["format"] = "columnar"
+			body["history"] = history_columns(df)
+		else:
+			body["history"] = history_rows(df)
+		return body
+
+	def etag_parts():
+		version = get_loaded_version(city)
+		return None if version is None else (version, get_data_source(city))
+
+	return conditional_json(request, build, etag_parts)
+
+
+@app.get("/api/forecast", response_class=FastJSONResponse)
+def forecast(
+	request: Request,
+	city: str = Query("北京"),
+	days: int = Query(7, ge=1, le=14),
+	format: str = Query("rows", pattern="^(rows|columnar)$"),
+	engine: str = Query(FORECAST_ENGINE, pattern="^(fast|arima|ensemble)$", description="本地模型：fast（NumPy 快速）/ arima / ensemble"),
+):
+	def build():
+		_, forecast_list = get_city_forecast(city, days, engine)
+		body = {"city": city, "days": days, "engine": engine, "data_source": get_data_source(city)}
+		if format == "columnar":
+			body["format"] = "columnar"
+			body["forecast"] = records_to_columns(forecast_list)
+		else:
+			body["forecast"] = forecast_list
+		return body
+
+	note_city_request(city)
+	return conditional_json(request, build, lambda: _versions(city, engine=engine))
+
+
+@app.get("/api/forecast/batch", response_class=FastJSONResponse)
+def forecast_batch(
+	request: Request,
+	cities: str = Query(..., description="逗号分隔的城市列表"),
+	days: int = Query(7, ge=1, le=14),
+	engine: str = Query(FORECAST_ENGINE, pattern="^(fast|arima|ensemble)$", description="本地模型，fast 时所有城市一次向量化计算"),
+):
+	names = [c.strip() for c in cities.replace("，", ",").split(",") if c.strip()]
+	names = list(dict.fromkeys(names))[:MAX_BATCH_CITIES]
+
+	def build():
+		forecasts = get_cities_forecast(names, days, engine)
+		return {
+			"days": days,
+			"engine": engine,
+			"forecasts": [{"city": c, "forecast": forecasts[c], "data_source": get_data_source(c)} for c in names],
+		}
+
+	def etag_parts():
+		parts = [city_versions(c, engine=engine) for c in names]
+		return None if any(p is None for p in parts) else tuple(parts) + tuple(get_data_source(c) for c in names)
 
+	return conditional_json(request, build, etag_parts)
 
-@app.get("/api/forecast")
-def forecast(city: str = Query("北京"), days: int = Query(7, ge=1, le=14)):
-	df = load_city_weather(city)
-	forecast_list = forecast_temperature_and_precipitation(df, days=days, city=city)
-	return {"city": city, "days": days, "forecast": forecast_list, "data_source": get_data_source()}
 
+@app.get("/api/alerts", response_class=FastJSONResponse)
+def alerts(request: Request, city: str = Query("北京"), days: int = Query(7, ge=1, le=14)):
+	def build():
+		_, forecast_list, alerts_list = get_city_alerts(city, days)
+		return {"city": city, "alerts": alerts_list, "data_source": get_data_source(city)}
 
-@app.get("/api/alerts")
-def alerts(city: str = Query("北京"), days: int = Query(7, ge=1, le=14)):
-	df = load_city_weather(city)
-	forecast_list = forecast_temperature_and_precipitation(df, days=days, city=city)
-	alerts_list = generate_alerts(df, forecast_list)
-	return {"city": city, "alerts": alerts_list, "data_source": get_data_source()}
+	note_city_request(city)
+	return conditional_json(request, build, lambda: _versions(city, alerts=True))
 
 
-@app.get("/api/alerts/summary")
-def alerts_summary(city: str = Query("北京"), days: int = Query(7, ge=1, le=14)):
-	df = load_city_weather(city)
-	forecast_list = forecast_temperature_and_precipitation(df, days=days, city=city)
-	alerts_list = generate_alerts(df, forecast_list)
+@app.get("/api/alerts/summary", response_class=FastJSONResponse)
+def alerts_summary(request: Request, city: str = Query("北京"), days: int = Query(7, ge=1, le=14)):
+	note_city_request(city)
+	return conditional_json(request, lambda: _alerts_summary(city, days), lambda: _versions(city, alerts=True))
+
+
+def _alerts_summary(city: str, days: int) -> dict:
+	_, forecast_list, alerts_list = get_city_alerts(city, days)
+	return {"city": city, "extremes": _extremes(forecast_list, alerts_list), "data_source": get_data_source(city)}
+
+
+def _extremes(forecast_list: list, alerts_list: list) -> list:
 	extremes = []
 	for i, a in enumerate(alerts_list):
 		d = forecast_list[i]
@@ -219,13 +246,25 @@ def alerts_summary(city: str = Query("北京"), days: int = Query(7, ge=1, le=14
 				"precipitation_mm": d.get("precipitation_mm"),
 				"reasons": a.get("reasons", []),
 			})
-	return {"city": city, "extremes": extremes, "data_source": get_data_source()}
+	return extremes
+
+
+@app.get("/api/recommend", response_class=FastJSONResponse)
+def outfit_recommend(request: Request, city: str = Query("北京"), days: int = Query(1, ge=1, le=7)):
+	note_city_request(city)
+	return conditional_json(request, lambda: _outfit_recommend(city, days), lambda: _versions(city))
 
 
-@app.get("/api/recommend")
-def outfit_recommend(city: str = Query("北京"), days: int = Query(1, ge=1, le=7)):
-	df = load_city_weather(city)
-	forecast_list = forecast_temperature_and_precipitation(df, days=days, city=city)
+def _outfit_recommend(city: str, days: int) -> dict:
+	_, forecast_list = get_city_forecast(city, days)
+	body = {"city": city}
+	body.update(_outfit_for(forecast_list))
+	body["data_source"] = get_data_source(city)
+	return body
+
+
+def _outfit_for(forecast_list: list) -> dict:
+	"""按预测首日生成穿衣推荐。"""
 	first_day = forecast_list[0]
 	recs = recommend_outfit(
 		temperature_c=first_day.get("temperature_c", 18.0),
@@ -233,23 +272,60 @@ def outfit_recommend(city: str = Query("北京"), days: int = Query(1, ge=1, le=
 		wind_speed_ms=first_day.get("wind_speed_ms", 2.0),
 		humidity=first_day.get("humidity", 50.0),
 	)
-	return {"city": city, "for_date": first_day.get("date"), "recommendations": recs, "data_source": get_data_source()}
-
-
-@app.get("/api/nlp")
-def nlp_endpoint(q: str = "", city: str = Query("北京")):
-	# 生活助手：umbrella/sunscreen/outfit
+	return {"for_date": first_day.get("date"), "recommendations": recs}
+
+
+@app.get("/api/dashboard", response_class=FastJSONResponse)
+def dashboard(
+	request: Request,
+	city: str = Query("北京"),
+	days: int = Query(7, ge=1, le=14),
+	history_days: int = Query(14, ge=7, le=90),
+):
+	"""首页聚合接口：一次加载数据、一次预测，同时返回历史、预报、极端天气摘要与穿衣推荐。"""
+	def build():
+		df, forecast_list, alerts_list = get_city_alerts(city, days)
+		return {
+			"city": city,
+			"days": days,
+			"data_source": get_data_source(city),
+			"history": history_rows(df.sort_values("date").tail(history_days)),
+			"forecast": forecast_list,
+			"extremes": _extremes(forecast_list, alerts_list),
+			"recommend": _outfit_for(forecast_list),
+		}
+
+	note_city_request(city)
+	return conditional_json(request, build, lambda: _versions(city, alerts=True))
+
+
+@app.get("/api/nlp", response_class=FastJSONResponse)
+def nlp_endpoint(request: Request, q: str = "", city: str = Query("北京")):
 	# 输入清洗与长度限制（避免极端长文本带来的性能/安全问题）
 	if not isinstance(q, str):
 		q = ""
 	q = (q or "").replace("\u200b", "").replace("\u200e", "").strip()
 	if len(q) > 200:
 		q = q[:200]
+	if parse_outfit_target(q) is not None:
+		note_city_request(city)
+
+	def etag_parts():
+		if parse_outfit_target(q) is None:
+			return ("unknown",)
+		# “今天/明天”等相对日期随自然日变化，ETag 中带上当天日期
+		versions = _versions(city)
+		return None if versions is None else versions + (date.today().isoformat(),)
+
+	return conditional_json(request, lambda: _nlp_answer(q, city), etag_parts)
+
+
+def _nlp_answer(q: str, city: str) -> dict:
+	# 生活助手：umbrella/sunscreen/outfit
 	target_date = parse_outfit_target(q)
 	topic = parse_assistant_topic(q)
 	if target_date is not None:
-		df = load_city_weather(city)
-		forecast_list = forecast_temperature_and_precipitation(df, days=14)
+		_, forecast_list = get_city_forecast(city, 14)
 		match = next((d for d in forecast_list if d.get("date") == str(target_date)), None)
 		if match is None:
 			match = forecast_list[0]
@@ -277,6 +353,39 @@ def nlp_endpoint(q: str = "", city: str = Query("北京")):
 	return {"intent": "unknown", "message": "请换个方式问问吧"}
 
 
+@app.get("/api/cities/suggest")
+def cities_suggest(
+	q: str = Query("", max_length=40),
+	limit: int = Query(10, ge=1, le=50),
+	province: str = Query("", max_length=20),
+):
+	"""城市自动补全（本地地名表，支持中文、全拼与拼音首字母前缀）。"""
+	return {"query": q, "results": gazetteer.suggest(q.strip(), limit=limit, province=province.strip())}
+
+
+@app.get("/api/cities/nearby")
+def cities_nearby(
+	lat: float = Query(..., ge=-90, le=90),
+	lon: float = Query(..., ge=-180, le=180),
+	radius_km: float = Query(0, ge=0, le=1000),
+	level: str = Query("", pattern="^(|province|prefecture|county)$"),
+	limit: int = Query(20, ge=1, le=200),
+):
+	"""附近城市（本地空间索引，球面距离）：radius_km 为 0 时只返回最近的一个地点（同样按 level 过滤）。"""
+	if radius_km > 0:
+		hits = gazetteer.within(lat, lon, radius_km, level=level, limit=limit)
+	else:
+		hit = gazetteer.nearest(lat, lon, level=level)
+		hits = [hit] if hit is not None else []
+	results = []
+	for place, km in hits:
+		item = gazetteer.public(place)
+		item["distance_km"] = round(km, 2)
+		item["prefecture"] = gazetteer.prefecture_of(place)["name"]
+		results.append(item)
+	return {"lat": lat, "lon": lon, "radius_km": radius_km, "results": results}
+
+
 @app.get("/api/config/options")
 def config_options():
 	return {
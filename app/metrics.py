@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+import math
+import threading
+import time
+
+# Prometheus 文本格式（0.0.4）的内容类型
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认直方图分桶（秒），覆盖从 JSON 编码（微秒级）到冷启动建模（数十秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: Dict[str, "_Metric"] = {}
+_REGISTRY_LOCK = threading.Lock()
+# 抓取时调用的回调：把其他模块维护的状态（lru_cache 统计、城市元数据等）同步到指标
+_COLLECTORS: List[Callable[[], None]] = []
+
+
+def _escape(value: str) -> str:
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+	parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+	if extra:
+		parts.append(extra)
+	return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+	if math.isnan(value):
+		return "NaN"
+	if math.isinf(value):
+		return "+Inf" if value > 0 else "-Inf"
+	if value == int(value) and abs(value) < 1e15:
+		return str(int(value))
+	return repr(float(value))
+
+
+class _Metric:
+	kind = "untyped"
+
+	def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labels)
+		self._values: Dict[Tuple[str, ...], object] = {}
+		self._lock = threading.Lock()
+
+	def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+		return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._values.clear()
+
+	def drain(self) -> Dict[Tuple[str, ...], object]:
+		"""取出当前全部取值并清空（供计算进程把增量带回主进程）。"""
+		with self._lock:
+			values, self._values = self._values, {}
+		return values
+
+	def merge(self, values: Dict[Tuple[str, ...], object]) -> None:
+		"""累加 drain() 取出的增量。"""
+		with self._lock:
+			for key, value in values.items():
+				self._values[key] = self._values.get(key, 0.0) + value
+
+	def samples(self) -> List[str]:
+		with self._lock:
+			items = sorted(self._values.items())
+		return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Counter(_Metric):
+	kind = "counter"
+
+	def inc(self, amount: float = 1.0, **labels) -> None:
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0.0) + amount
+
+	def set_total(self, value: float, **labels) -> None:
+		"""同步由其他组件累计的计数（如 functools.lru_cache 的命中数）。"""
+		with self._lock:
+			self._values[self._key(labels)] = float(value)
+
+
+class Gauge(_Metric):
+	kind = "gauge"
+
+	def set(self, value: float, **labels) -> None:
+		with self._lock:
+			self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+	kind = "histogram"
+
+	def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+		super().__init__(name, help, labels)
+		self.buckets = tuple(sorted(buckets))
+
+	def observe(self, value: float, **labels) -> None:
+		key = self._key(labels)
+		index = bisect_left(self.buckets, value)
+		with self._lock:
+			state = self._values.get(key)
+			if state is None:
+				state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+			state[0][index] += 1
+			state[1] += value
+			state[2] += 1
+
+	def merge(self, values: Dict[Tuple[str, ...], object]) -> None:
+		with self._lock:
+			for key, (counts, total, count) in values.items():
+				state = self._values.get(key)
+				if state is None:
+					state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+				state[0] = [a + b for a, b in zip(state[0], counts)]
+				state[1] += total
+				state[2] += count
+
+	@contextmanager
+	def time(self, **labels) -> Iterator[None]:
+		t0 = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - t0, **labels)
+
+	def samples(self) -> List[str]:
+		with self._lock:
+			items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+		lines = []
+		for key, (counts, total, count) in items:
+			cumulative = 0
+			for bound, n in zip(self.buckets + (math.inf,), counts):
+				cumulative += n
+				le = f'le="{_format_value(bound)}"'
+				lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+			lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+			lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+		return lines
+
+
+def _register(cls, name: str, help: str, labels: Sequence[str], **kwargs) -> _Metric:
+	with _REGISTRY_LOCK:
+		metric = _REGISTRY.get(name)
+		if metric is None:
+			metric = _REGISTRY[name] = cls(name, help, labels, **kwargs)
+		return metric
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+	return _register(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+	return _register(Gauge, name, help, labels)
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+	return _register(Histogram, name, help, labels, buckets=buckets)
+
+
+def register_collector(fn: Callable[[], None]) -> None:
+	if fn not in _COLLECTORS:
+		_COLLECTORS.append(fn)
+
+
+def drain() -> Dict[str, Dict[Tuple[str, ...], object]]:
+	"""取出并清空全部计数器与直方图的增量（在计算进程中调用）；仪表盘由主进程自行采集，不包含在内。"""
+	with _REGISTRY_LOCK:
+		metrics = [m for m in _REGISTRY.values() if m.kind in ("counter", "histogram")]
+	out = {}
+	for metric in metrics:
+		values = metric.drain()
+		if values:
+			out[metric.name] = values
+	return out
+
+
+def merge(snapshot: Dict[str, Dict[Tuple[str, ...], object]]) -> None:
+	"""把计算进程 drain() 带回的增量累加到本进程的同名指标（本进程尚未注册的指标忽略）。"""
+	for name, values in snapshot.items():
+		with _REGISTRY_LOCK:
+			metric = _REGISTRY.get(name)
+		if metric is not None and metric.kind in ("counter", "histogram"):
+			metric.merge(values)
+
+
+def render() -> str:
+	"""按 Prometheus 文本格式输出全部指标。"""
+	for fn in list(_COLLECTORS):
+		try:
+			fn()
+		except Exception:
+			pass
+	with _REGISTRY_LOCK:
+		metrics = sorted(_REGISTRY.values(), key=lambda m: m.name)
+	lines: List[str] = []
+	for metric in metrics:
+		lines.append(f"# HELP {metric.name} {metric.help}")
+		lines.append(f"# TYPE {metric.name} {metric.kind}")
+		lines.extend(metric.samples())
+	return "\n".join(lines) + "\n"
+
+
+# 各模块共用的指标
+HTTP_SECONDS = histogram("weather_http_request_seconds", "API 请求耗时（秒）", ("route", "method", "status"))
+UPSTREAM_SECONDS = histogram("weather_upstream_request_seconds", "上游 HTTP 单次请求耗时（秒）", ("host", "status"))
+UPSTREAM_RETRIES = counter("weather_upstream_retries_total", "上游 HTTP 重试次数", ("host",))
+CITY_LOAD_SECONDS = histogram("weather_city_load_seconds", "城市历史数据加载耗时（秒），按最终选用的来源", ("source",))
+STAGE_SECONDS = histogram(
+	"weather_stage_seconds",
+	"计算阶段耗时（秒）：arima_order_search / arima_fit / lstm_train / lstm_inference / alert_train / json_encode",
+	("stage",),
+)
+CACHE_REQUESTS = counter("weather_cache_requests_total", "缓存查询次数（result: hit / stale / disk / miss）", ("cache", "result"))
+
+
+def cache_result(cache: str, result: str) -> None:
+	CACHE_REQUESTS.inc(cache=cache, result=result)
+
+
+async def http_middleware(request, call_next):
+	"""记录 API 请求耗时，route 使用路由模板以控制标签基数。"""
+	t0 = time.perf_counter()
+	status = 500
+	try:
+		response = await call_next(request)
+		status = response.status_code
+		return response
+	finally:
+		route = request.scope.get("route")
+		path = getattr(route, "path", None) or "unmatched"
+		HTTP_SECONDS.observe(time.perf_counter() - t0, route=path, method=request.method, status=status)
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+import argparse
+import asyncio
+import datetime as dt
+import os
+import random
+import threading
+
+import numpy as np
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse
+
+from . import gazetteer
+
+# 本地 Open‑Meteo 替身：预测（/v1/forecast，含 past_days 与多坐标）、归档（/v1/era5）、地理编码（/v1/search）。
+# 数据由坐标与日期确定性生成，不访问网络。应用通过 OPEN_METEO_BASE_URL=http://127.0.0.1:8090 指向本服务。
+
+_VARS = ("temperature_2m_max", "temperature_2m_min", "precipitation_sum", "windspeed_10m_max", "relative_humidity_2m_mean")
+_UNITS = {
+	"temperature_2m_max": "°C", "temperature_2m_min": "°C", "precipitation_sum": "mm",
+	"windspeed_10m_max": "km/h", "relative_humidity_2m_mean": "%",
+}
+_FEATURE_CODES = {"province": "PPLA", "prefecture": "PPLA2", "county": "PPLA3"}
+
+
+class StubConfig:
+	"""注入的延迟与故障：每个请求延迟 N(latency_ms, jitter_ms)，并以 failure_rate 的概率返回 failure_status。"""
+
+	def __init__(self):
+		self.latency_ms = float(os.environ.get("STUB_LATENCY_MS", "50"))
+		self.jitter_ms = float(os.environ.get("STUB_JITTER_MS", "20"))
+		self.failure_rate = float(os.environ.get("STUB_FAILURE_RATE", "0"))
+		self.failure_status = int(os.environ.get("STUB_FAILURE_STATUS", "503"))
+
+	def as_dict(self) -> dict:
+		return dict(vars(self))
+
+	def update(self, values: dict) -> None:
+		for key, value in values.items():
+			if key in vars(self):
+				setattr(self, key, type(getattr(self, key))(value))
+
+
+config = StubConfig()
+_stats: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+
+app = FastAPI(title="Open-Meteo stub")
+
+
+def _count(key: str) -> None:
+	with _stats_lock:
+		_stats[key] = _stats.get(key, 0) + 1
+
+
+async def _inject(endpoint: str) -> Optional[JSONResponse]:
+	delay = random.gauss(config.latency_ms, config.jitter_ms) if config.jitter_ms > 0 else config.latency_ms
+	if delay > 0:
+		await asyncio.sleep(delay / 1000.0)
+	if config.failure_rate > 0 and random.random() < config.failure_rate:
+		_count(f"{endpoint} {config.failure_status}")
+		return JSONResponse({"error": True, "reason": "stub injected failure"}, status_code=config.failure_status)
+	_count(f"{endpoint} 200")
+	return None
+
+
+def _noise(ordinals: np.ndarray, lat: float, lon: float, salt: float) -> np.ndarray:
+	"""[0, 1) 的确定性伪随机数：同一坐标同一天每次请求结果相同（预测与归档重叠的日期一致）。"""
+	x = np.sin(ordinals * 12.9898 + lat * 78.233 + lon * 37.719 + salt) * 43758.5453
+	return x - np.floor(x)
+
+
+def daily(lat: float, lon: float, dates: List[dt.date]) -> dict:
+	"""按纬度与季节生成日度数据（字段与单位同 Open‑Meteo）。"""
+	ordinals = np.array([d.toordinal() for d in dates], dtype=float)
+	doy = np.array([d.timetuple().tm_yday for d in dates], dtype=float)
+	# 纬度越高年均温越低、年较差越大
+	mean = 28.0 - 0.55 * (lat - 18.0)
+	amplitude = 4.0 + 0.45 * max(lat - 18.0, 0.0)
+	tavg = mean - amplitude * np.cos(2 * np.pi * (doy - 15) / 365.25) + 3.0 * (_noise(ordinals, lat, lon, 1.0) - 0.5)
+	spread = 3.0 + 2.0 * _noise(ordinals, lat, lon, 2.0)
+	wet = _noise(ordinals, lat, lon, 3.0)
+	summer = 0.5 + 0.5 * np.sin(2 * np.pi * (doy - 105) / 365.25)
+	prec = np.where(wet < 0.25 + 0.25 * summer, -np.log1p(-_noise(ordinals, lat, lon, 4.0)) * (2.0 + 8.0 * summer), 0.0)
+	values = {
+		"temperature_2m_max": tavg + spread,
+		"temperature_2m_min": tavg - spread,
+		"precipitation_sum": prec,
+		"windspeed_10m_max": 6.0 + 24.0 * _noise(ordinals, lat, lon, 5.0),
+		"relative_humidity_2m_mean": 45.0 + 30.0 * summer + 15.0 * _noise(ordinals, lat, lon, 6.0),
+	}
+	out = {"time": [d.isoformat() for d in dates]}
+	out.update({k: np.round(v, 1).tolist() for k, v in values.items()})
+	return out
+
+
+def _coords(latitude: str, longitude: str) -> List[tuple]:
+	lats = [float(x) for x in latitude.split(",") if x.strip()]
+	lons = [float(x) for x in longitude.split(",") if x.strip()]
+	return list(zip(lats, lons))
+
+
+def _payload(lat: float, lon: float, dates: List[dt.date], requested: str) -> dict:
+	data = daily(lat, lon, dates)
+	names = [v for v in requested.split(",") if v in _VARS] or list(_VARS)
+	return {
+		"latitude": lat,
+		"longitude": lon,
+		"timezone": "Asia/Shanghai",
+		"daily_units": {"time": "iso8601", **{n: _UNITS[n] for n in names}},
+		"daily": {"time": data["time"], **{n: data[n] for n in names}},
+	}
+
+
+def _locations(coords: List[tuple], dates: List[dt.date], requested: str):
+	items = [_payload(lat, lon, dates, requested) for lat, lon in coords]
+	# 与 Open‑Meteo 一致：单坐标返回对象，多坐标返回数组
+	return items[0] if len(items) == 1 else items
+
+
+def _bad_request(reason: str) -> JSONResponse:
+	return JSONResponse({"error": True, "reason": reason}, status_code=400)
+
+
+@app.get("/v1/forecast")
+async def forecast(
+	latitude: str = Query(...),
+	longitude: str = Query(...),
+	daily_vars: str = Query("", alias="daily"),
+	past_days: int = Query(0, ge=0, le=92),
+	forecast_days: int = Query(7, ge=0, le=16),
+):
+	failed = await _inject("forecast")
+	if failed is not None:
+		return failed
+	coords = _coords(latitude, longitude)
+	if not coords:
+		return _bad_request("latitude/longitude required")
+	today = dt.date.today()
+	dates = [today + dt.timedelta(days=i) for i in range(-past_days, forecast_days)]
+	return _locations(coords, dates, daily_vars)
+
+
+@app.get("/v1/era5")
+async def archive(
+	latitude: str = Query(...),
+	longitude: str = Query(...),
+	start_date: dt.date = Query(...),
+	end_date: dt.date = Query(...),
+	daily_vars: str = Query("", alias="daily"),
+):
+	failed = await _inject("archive")
+	if failed is not None:
+		return failed
+	coords = _coords(latitude, longitude)
+	if not coords or end_date < start_date:
+		return _bad_request("invalid coordinates or date range")
+	dates = [start_date + dt.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+	return _locations(coords, dates, daily_vars)
+
+
+@app.get("/v1/search")
+async def search(name: str = Query(""), count: int = Query(10, ge=1, le=100)):
+	failed = await _inject("geocoding")
+	if failed is not None:
+		return failed
+	places = gazetteer.suggest(name, limit=count)
+	if not places:
+		return {"generationtime_ms": 0.1}
+	return {"results": [
+		{
+			"id": int(p["adcode"]),
+			"name": p["name"],
+			"latitude": p["lat"],
+			"longitude": p["lon"],
+			"feature_code": _FEATURE_CODES.get(p["level"], "PPL"),
+			"country_code": "CN",
+			"admin1": p["province"],
+			"population": 0,
+		}
+		for p in places
+	]}
+
+
+@app.get("/_stub/stats")
+def stats():
+	"""各接口按状态码的请求计数与当前注入配置。"""
+	with _stats_lock:
+		counts = dict(sorted(_stats.items()))
+	return {"requests": counts, "config": config.as_dict()}
+
+
+@app.post("/_stub/config")
+async def update_config(request: Request):
+	"""运行中调整延迟与故障率，如 {"latency_ms": 500, "failure_rate": 0.2}。"""
+	config.update(await request.json())
+	return config.as_dict()
+
+
+@app.post("/_stub/reset")
+def reset():
+	with _stats_lock:
+		_stats.clear()
+	return {"ok": True}
+
+
+def _main() -> None:
+	"""命令行：python -m app.openmeteo_stub [--port 8090] [--latency-ms 50] [--jitter-ms 20] [--failure-rate 0.02]"""
+	parser = argparse.ArgumentParser(prog="python -m app.openmeteo_stub", description="本地 Open-Meteo 替身")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8090)
+	parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+	parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+	parser.add_argument("--failure-rate", type=float, default=config.failure_rate)
+	parser.add_argument("--failure-status", type=int, default=config.failure_status)
+	args = parser.parse_args()
+	config.update({
+		"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+		"failure_rate": args.failure_rate, "failure_status": args.failure_status,
+	})
+	import uvicorn
+
+	uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+	_main()
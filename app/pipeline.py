@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import hashlib
+import os
+import threading
+import time
+
+import pandas as pd
+
+from . import compute as compute_tier
+from .cache import TTLCache
+from .singleflight import SingleFlight
+from .encoding import dumps
+from .data_loader import (
+	CITY_COORDS,
+	get_data_version,
+	get_loaded_version,
+	is_city_loaded,
+	load_cities_weather,
+	load_city_weather,
+	register_refresh_hook,
+	reload_city_weather,
+	reload_stored_city_weather,
+)
+from .forecasting import ENGINES, FORECAST_ENGINE, forecast_cities_fast, prefetch_open_meteo_forecast, prefetch_open_meteo_forecasts
+
+# 预测统一按最长 14 天计算一次，较短的 days 直接切片
+FORECAST_HORIZON = 14
+FORECAST_CACHE_TTL = float(os.environ.get("FORECAST_CACHE_TTL", "900"))
+# 缓存条目上限：默认容纳内置城市加一次满额批量请求（100 个城市），预测缓存再乘以引擎数
+_CACHE_CITIES = len(CITY_COORDS) + 100
+FORECAST_CACHE_SIZE = int(os.environ.get("FORECAST_CACHE_SIZE", "") or _CACHE_CITIES * len(ENGINES))
+ALERTS_CACHE_SIZE = int(os.environ.get("ALERTS_CACHE_SIZE", "") or _CACHE_CITIES)
+
+# key: (城市, 数据版本, 引擎) -> 14 天预测；(城市, 数据版本) -> 预警列表（基于默认引擎的预测）
+_FORECAST_CACHE = TTLCache(ttl=FORECAST_CACHE_TTL, maxsize=FORECAST_CACHE_SIZE, name="forecast")
+_ALERTS_CACHE = TTLCache(ttl=FORECAST_CACHE_TTL, maxsize=ALERTS_CACHE_SIZE, name="alerts")
+
+# 过期条目先返回旧结果，再在后台重新计算（stale-while-revalidate）
+_REVALIDATOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidate")
+_REVALIDATING: set = set()
+_REVALIDATING_LOCK = threading.Lock()
+
+# 最近的城市请求记录，供后台预计算挑选热门城市
+_RECENT_REQUESTS: deque = deque(maxlen=5000)
+
+# 缓存未命中时同一 (缓存, 城市, 数据版本) 只计算一次，并发请求等待同一结果
+_COMPUTES = SingleFlight("compute")
+
+
+def _content_tag(value) -> str:
+	return hashlib.sha1(dumps(value)).hexdigest()[:12]
+
+
+def _store(cache: TTLCache, key: Hashable, value) -> None:
+	"""写入缓存并附带内容哈希标签（用于 ETag）。"""
+	cache.set(key, value, tag=_content_tag(value))
+
+
+def _revalidate(cache: TTLCache, key: Hashable, compute: Callable[[], object]) -> None:
+	tag = (cache.name, key)
+	with _REVALIDATING_LOCK:
+		if tag in _REVALIDATING:
+			return
+		_REVALIDATING.add(tag)
+
+	def _run():
+		try:
+			with compute_tier.background():
+				_store(cache, key, compute())
+		except Exception:
+			pass
+		finally:
+			with _REVALIDATING_LOCK:
+				_REVALIDATING.discard(tag)
+
+	_REVALIDATOR.submit(_run)
+
+
+def _get_or_compute(cache: TTLCache, key: Hashable, compute: Callable[[], object]):
+	hit = cache.get_stale(key)
+	if hit is not None:
+		value, fresh = hit
+		if not fresh:
+			_revalidate(cache, key, compute)
+		return value
+	return _COMPUTES.do((cache.name, key), lambda: _compute_and_store(cache, key, compute))
+
+
+def _compute_and_store(cache: TTLCache, key: Hashable, compute: Callable[[], object]):
+	hit = cache.get_stale(key, record=False)
+	if hit is not None:
+		return hit[0]
+	value = compute()
+	_store(cache, key, value)
+	return value
+
+
+def _prefetch_external(city: str):
+	try:
+		return prefetch_open_meteo_forecast(FORECAST_HORIZON, city)
+	except Exception:
+		return None
+
+
+def _prefetch_external_many(cities: Sequence[str]) -> Dict[str, object]:
+	if not cities:
+		return {}
+	try:
+		return prefetch_open_meteo_forecasts(FORECAST_HORIZON, cities)
+	except Exception:
+		return {}
+
+
+def _forecast_full(city: str, df: pd.DataFrame, external=None, engine: str = FORECAST_ENGINE) -> List[dict]:
+	return _get_or_compute(
+		_FORECAST_CACHE,
+		(city, get_data_version(df), engine),
+		lambda: compute_tier.forecast(df, FORECAST_HORIZON, city, external, engine),
+	)
+
+
+def _alerts_full(city: str, df: pd.DataFrame) -> List[dict]:
+	key = (city, get_data_version(df))
+	return _get_or_compute(
+		_ALERTS_CACHE,
+		key,
+		lambda: compute_tier.alerts(df, _forecast_full(city, df), cache_key=key),
+	)
+
+
+def city_versions(city: str, alerts: bool = False, engine: str = FORECAST_ENGINE) -> Optional[Tuple[str, ...]]:
+	"""不触发计算地返回 (数据版本, 预测标签[, 预警标签])；数据未加载或结果未就绪/已过期时返回 None。"""
+	data_version = get_loaded_version(city)
+	if data_version is None:
+		return None
+	parts = [data_version, _FORECAST_CACHE.tag((city, data_version, engine))]
+	if alerts:
+		parts.append(_ALERTS_CACHE.tag((city, data_version)))
+	if any(p is None for p in parts):
+		return None
+	return tuple(parts)
+
+
+def note_city_request(city: str) -> None:
+	_RECENT_REQUESTS.append((time.time(), city))
+
+
+def popular_cities(limit: int = 10, window: float = 3600.0) -> List[str]:
+	"""最近 window 秒内请求最多的城市。"""
+	since = time.time() - window
+	counts = Counter(city for ts, city in list(_RECENT_REQUESTS) if ts >= since)
+	return [city for city, _ in counts.most_common(limit)]
+
+
+def get_city_forecast(city: str, days: int = 7, engine: str = FORECAST_ENGINE) -> Tuple[pd.DataFrame, List[dict]]:
+	"""返回城市历史数据与未来 days 天预测；各接口共享同一份缓存结果（按引擎分别缓存）。
+
+	返回的预测字典为缓存中的共享对象，调用方不应修改。请求热度由接口层记录（含 304 命中）。
+	"""
+	external = None
+	if not is_city_loaded(city):
+		# 冷启动：外部预测与历史数据同时拉取
+		external = _prefetch_external(city)
+	df = load_city_weather(city)
+	days = int(max(1, min(days, FORECAST_HORIZON)))
+	return df, _forecast_full(city, df, external, engine)[:days]
+
+
+def get_city_alerts(city: str, days: int = 7) -> Tuple[pd.DataFrame, List[dict], List[dict]]:
+	"""返回 (历史数据, 预测, 预警)，预警与预测一一对应且同样来自缓存。"""
+	df, forecast_list = get_city_forecast(city, days)
+	return df, forecast_list, _alerts_full(city, df)[:len(forecast_list)]
+
+
+def _forecast_many_fast(frames: Dict[str, pd.DataFrame], externals: Dict[str, object]) -> Dict[str, List[dict]]:
+	"""engine=fast 的多城市预测：缓存中没有新鲜结果的城市一次性向量化计算后写入缓存。"""
+	out: Dict[str, List[dict]] = {}
+	missing: Dict[str, pd.DataFrame] = {}
+	for city, df in frames.items():
+		hit = _FORECAST_CACHE.get_stale((city, get_data_version(df), "fast"))
+		if hit is not None and hit[1]:
+			out[city] = hit[0]
+		else:
+			missing[city] = df
+	if missing:
+		computed = forecast_cities_fast(missing, FORECAST_HORIZON, externals)
+		for city, value in computed.items():
+			_store(_FORECAST_CACHE, (city, get_data_version(missing[city]), "fast"), value)
+		out.update(computed)
+	return out
+
+
+def _load_many(cities: Sequence[str], engine: str) -> Tuple[Dict[str, pd.DataFrame], Dict[str, object]]:
+	"""批量加载历史数据，并为需要计算的城市合并拉取外部预测。"""
+	# 未加载数据的城市：外部预测与历史数据同时批量拉取
+	cold = [c for c in cities if not is_city_loaded(c)]
+	externals = _prefetch_external_many(cold)
+	frames = load_cities_weather(cities)
+	missing = [
+		c for c in cities
+		if c not in externals and _FORECAST_CACHE.get_stale((c, get_data_version(frames[c]), engine)) is None
+	]
+	externals.update(_prefetch_external_many(missing))
+	return frames, externals
+
+
+def get_cities_forecast(cities: Sequence[str], days: int = 7, engine: str = FORECAST_ENGINE) -> Dict[str, List[dict]]:
+	"""批量获取多个城市的预测：历史数据与外部预测均按多坐标合并请求；engine=fast 时本地模型对所有城市一次算完。"""
+	cities = list(dict.fromkeys(cities))
+	days = int(max(1, min(days, FORECAST_HORIZON)))
+	for city in cities:
+		note_city_request(city)
+	frames, externals = _load_many(cities, engine)
+	batch = _forecast_many_fast(frames, externals) if engine == "fast" else {}
+	return {
+		c: (batch[c] if c in batch else _forecast_full(c, frames[c], externals.get(c), engine))[:days]
+		for c in cities
+	}
+
+
+def warm_cities_fast(cities: Sequence[str]) -> None:
+	"""为一组城市一次性算好 engine=fast 的预测（全国概览等多城市场景），不计入请求热度。"""
+	_forecast_many_fast(*_load_many(list(dict.fromkeys(cities)), "fast"))
+
+
+def _prepare_city(city: str, df: pd.DataFrame, external=None) -> None:
+	key = (city, get_data_version(df))
+	forecast_list = compute_tier.forecast(df, FORECAST_HORIZON, city, external)
+	_store(_FORECAST_CACHE, key + (FORECAST_ENGINE,), forecast_list)
+	_store(_ALERTS_CACHE, key, compute_tier.alerts(df, forecast_list, cache_key=key))
+
+
+def warm_city(city: str) -> None:
+	"""确保城市数据、预测与预警均已在缓存中。"""
+	external = None if is_city_loaded(city) else _prefetch_external(city)
+	df = load_city_weather(city)
+	_forecast_full(city, df, external)
+	_alerts_full(city, df)
+
+
+def refresh_city(city: str) -> None:
+	"""重新拉取城市数据并预先算好预测与预警，完成前请求继续使用旧结果。"""
+	external = _prefetch_external(city)
+	reload_city_weather(city, prepare=lambda df: _prepare_city(city, df, external))
+
+
+def sync_city(city: str) -> bool:
+	"""从本地历史库同步城市数据并算好预测与预警（不向上游拉取历史数据）；库中还没有该城市时返回 False。"""
+	df = reload_stored_city_weather(city, prepare=lambda df: _prepare_city(city, df))
+	if df is None:
+		return False
+	_forecast_full(city, df)
+	_alerts_full(city, df)
+	return True
+
+
+def clear_forecast_cache(city: str = "") -> None:
+	"""删除某城市的预测与预警缓存（其余城市保留，仍可过期后先返回旧结果）；city 为空时全部清空。"""
+	if not city:
+		_FORECAST_CACHE.clear()
+		_ALERTS_CACHE.clear()
+		return
+	_FORECAST_CACHE.discard(lambda key: key[0] == city)
+	_ALERTS_CACHE.discard(lambda key: key[0] == city)
+
+
+register_refresh_hook(clear_forecast_cache)
@@ -3,7 +3,9 @@ from __future__ import annotations
 from typing import List
 
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
+
+# scikit-learn 在首次推荐时才加载
+from . import backends
 
 
 _PROTOTYPES = [
@@ -18,7 +20,7 @@ _PROTOTYPES = [
 def _knn_recommend(vec, top_k: int = 2) -> List[str]:
 	X = np.array([p["vec"] for p in _PROTOTYPES], dtype=float)
 	labels = [p["label"] for p in _PROTOTYPES]
-	nbrs = NearestNeighbors(n_neighbors=min(top_k, len(_PROTOTYPES)), metric="euclidean")
+	nbrs = backends.sklearn().NearestNeighbors(n_neighbors=min(top_k, len(_PROTOTYPES)), metric="euclidean")
 	nbrs.fit(X)
 	dist, idx = nbrs.kneighbors(np.array(vec, dtype=float).reshape(1, -1))
 	recs = []
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+import logging
+import os
+import tempfile
+import threading
+
+from .compute import background
+from .data_loader import CITY_COORDS, is_city_loaded
+from .pipeline import popular_cities, refresh_city, sync_city, warm_cities_fast, warm_city
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_ENABLED = os.environ.get("PRECOMPUTE_ENABLED", "1") not in ("0", "false", "False")
+# 两轮预计算之间的间隔（秒）
+PRECOMPUTE_INTERVAL = float(os.environ.get("PRECOMPUTE_INTERVAL", "1800"))
+# 额外预计算的近期热门城市数量
+PRECOMPUTE_POPULAR = int(os.environ.get("PRECOMPUTE_POPULAR", "10"))
+# 上游拉取锁文件：多个 worker（uvicorn --workers / gunicorn）中只有持有锁的一个向上游拉取并写入本地历史库，
+# 其余 worker 只从历史库同步数据、各自算好本进程的缓存；设为空则每个 worker 都向上游拉取
+PRECOMPUTE_LOCK_FILE = os.environ.get(
+	"PRECOMPUTE_LOCK_FILE", os.path.join(tempfile.gettempdir(), "weather-precompute.lock")
+)
+# 未持有锁的 worker 在历史库尚缺城市时，隔这么多秒（不超过 PRECOMPUTE_INTERVAL）再同步一次
+PRECOMPUTE_SYNC_RETRY = float(os.environ.get("PRECOMPUTE_SYNC_RETRY", "60"))
+
+
+def _acquire_lock(path: str):
+	"""非阻塞地获取文件锁：成功返回打开的文件（进程退出时锁自动释放），不加锁时返回 True，已被其他进程持有时返回 None。"""
+	if not path:
+		return True
+	try:
+		import fcntl
+	except ImportError:  # 非 POSIX 平台：不加锁
+		return True
+	fh = open(path, "a")
+	try:
+		fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+	except OSError:
+		fh.close()
+		return None
+	return fh
+
+
+class PrecomputeScheduler:
+	"""后台预计算：定期为内置城市与近期热门城市拉取数据并算好预测/预警。
+
+	首轮只补齐缺失的缓存；之后每轮重新拉取数据，新结果就绪后才替换旧结果。
+	多 worker 时只有持有锁文件的 worker 向上游拉取并写入历史库，其余 worker 从历史库同步后各自预热缓存；
+	持有锁的 worker 退出后，其他 worker 在下一轮接替。
+	"""
+
+	def __init__(self, interval: float = PRECOMPUTE_INTERVAL, popular: int = PRECOMPUTE_POPULAR):
+		self.interval = max(1.0, float(interval))
+		self.popular = int(popular)
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._lock = None
+		self.lock_file = PRECOMPUTE_LOCK_FILE
+		self.rounds = 0
+		self.pending_sync: List[str] = []
+		self.last_errors: Dict[str, str] = {}
+
+	def cities(self) -> List[str]:
+		names = list(CITY_COORDS)
+		for city in popular_cities(self.popular):
+			if city not in names:
+				names.append(city)
+		return names
+
+	def is_leader(self) -> bool:
+		"""是否由本进程向上游拉取（尝试获取锁文件，获取后一直持有到 stop）。"""
+		if self._lock is None:
+			self._lock = _acquire_lock(self.lock_file)
+		return self._lock is not None
+
+	def run_once(self, refresh: bool = True) -> None:
+		errors: Dict[str, str] = {}
+		missing: List[str] = []
+		cities = self.cities()
+		leader = self.is_leader()
+		for city in cities:
+			if self._stop.is_set():
+				break
+			try:
+				# 后台任务在计算层排队等待，不会因队列已满被拒绝
+				with background():
+					if not leader:
+						if not sync_city(city):
+							missing.append(city)
+					elif refresh:
+						refresh_city(city)
+					else:
+						warm_city(city)
+			except Exception as exc:
+				errors[city] = str(exc)
+				logger.warning("预计算失败 %s: %s", city, exc)
+		# engine=fast 的预测对所有城市一次向量化算完（毫秒级），供多城市概览直接命中缓存
+		if not leader:
+			cities = [c for c in cities if is_city_loaded(c)]
+		if cities and not self._stop.is_set():
+			try:
+				warm_cities_fast(cities)
+			except Exception as exc:
+				logger.warning("快速引擎批量预计算失败: %s", exc)
+		self.last_errors = errors
+		self.pending_sync = missing
+		self.rounds += 1
+
+	def _run(self) -> None:
+		refresh = False
+		while not self._stop.is_set():
+			self.run_once(refresh=refresh)
+			refresh = True
+			wait = self.interval
+			if self.pending_sync:
+				wait = min(wait, max(1.0, PRECOMPUTE_SYNC_RETRY))
+			self._stop.wait(wait)
+
+	def start(self, lock_file: str = PRECOMPUTE_LOCK_FILE) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self.lock_file = lock_file
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="precompute", daemon=True)
+		self._thread.start()
+
+	def stop(self, timeout: float = 5.0) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout)
+			self._thread = None
+		if self._lock not in (None, True):
+			self._lock.close()
+		self._lock = None
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import asyncio
+import os
+import threading
+
+from . import metrics
+
+# 等待同一 key 上进行中调用的最长时间（秒）
+COALESCE_TIMEOUT = float(os.environ.get("COALESCE_TIMEOUT", "60"))
+
+_INSTANCES: List["SingleFlight"] = []
+_CALLS = metrics.counter("weather_coalesced_calls_total", "合并调用次数（role: executed 实际执行 / shared 等待共享结果）", ("name", "role"))
+
+
+class CoalesceTimeout(TimeoutError):
+	"""等待进行中的同 key 调用超时。"""
+
+
+class SingleFlight:
+	"""按 key 合并并发调用。
+
+	同一 key 同时只有一个调用方（leader）执行 fn，其余调用方等待并共享其结果或异常；
+	等待超过 timeout 秒抛出 CoalesceTimeout。调用结束即移除，不缓存结果。
+	do 用于同步调用（线程间共享 Future），ado 用于协程（同一事件循环内共享 Task）。
+	"""
+
+	def __init__(self, name: str = "singleflight", timeout: float = COALESCE_TIMEOUT):
+		self.name = name
+		self.timeout = float(timeout)
+		self._calls: Dict[Hashable, Future] = {}
+		self._tasks: Dict[Hashable, asyncio.Future] = {}
+		self._lock = threading.Lock()
+		self.executed = 0
+		self.shared = 0
+		_INSTANCES.append(self)
+
+	def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+		with self._lock:
+			future = self._calls.get(key)
+			leader = future is None
+			if leader:
+				future = Future()
+				self._calls[key] = future
+				self.executed += 1
+			else:
+				self.shared += 1
+		if not leader:
+			try:
+				return future.result(timeout=self.timeout if timeout is None else timeout)
+			except FutureTimeout:
+				raise CoalesceTimeout(f"{self.name}: 等待 {key!r} 超时") from None
+		try:
+			value = fn()
+		except BaseException as exc:
+			future.set_exception(exc)
+			raise
+		else:
+			future.set_result(value)
+			return value
+		finally:
+			with self._lock:
+				self._calls.pop(key, None)
+
+	async def ado(
+		self,
+		key: Hashable,
+		fn: Callable[[], Awaitable[Any]],
+		timeout: Optional[float] = None,
+		share: Optional[Callable[[Any], Any]] = None,
+	) -> Any:
+		"""协程版本的 do；share 用于处理等待方拿到的共享结果（如深拷贝，避免互相修改）。
+
+		执行中的调用不随某个等待方被取消而取消。
+		"""
+		with self._lock:
+			task = self._tasks.get(key)
+			leader = task is None
+			if leader:
+				task = asyncio.ensure_future(fn())
+				self._tasks[key] = task
+				task.add_done_callback(lambda done: self._finish_task(key, done))
+				self.executed += 1
+			else:
+				self.shared += 1
+		if leader:
+			return await asyncio.shield(task)
+		try:
+			value = await asyncio.wait_for(asyncio.shield(task), self.timeout if timeout is None else timeout)
+		except asyncio.TimeoutError:
+			raise CoalesceTimeout(f"{self.name}: 等待 {key!r} 超时") from None
+		return share(value) if share is not None else value
+
+	def _finish_task(self, key: Hashable, task: asyncio.Future) -> None:
+		with self._lock:
+			if self._tasks.get(key) is task:
+				del self._tasks[key]
+
+	def in_flight(self) -> int:
+		with self._lock:
+			return len(self._calls) + len(self._tasks)
+
+	def stats(self) -> Dict[str, int]:
+		return {"executed": self.executed, "shared": self.shared, "in_flight": self.in_flight()}
+
+
+def _collect_metrics() -> None:
+	for sf in list(_INSTANCES):
+		_CALLS.set_total(sf.executed, name=sf.name, role="executed")
+		_CALLS.set_total(sf.shared, name=sf.name, role="shared")
+
+
+metrics.register_collector(_collect_metrics)
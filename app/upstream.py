@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Sequence
+
+import asyncio
+import copy
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import UPSTREAM_RETRIES, UPSTREAM_SECONDS
+from .singleflight import SingleFlight
+
+# 连接池上限（所有上游主机共享）
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "50"))
+UPSTREAM_KEEPALIVE = int(os.environ.get("UPSTREAM_KEEPALIVE", "20"))
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+# 进行中的同一 URL 请求（在事件循环线程内合并），并发的相同请求共享一次上游调用
+_FETCHES = SingleFlight("upstream")
+
+
+def _ensure_loop() -> asyncio.AbstractEventLoop:
+	"""在后台线程中运行专用事件循环，所有上游请求共享其中的连接池。"""
+	global _loop, _client
+	with _lock:
+		if _loop is not None and _loop.is_running():
+			return _loop
+		loop = asyncio.new_event_loop()
+		ready = threading.Event()
+
+		def _run():
+			asyncio.set_event_loop(loop)
+			loop.call_soon(ready.set)
+			loop.run_forever()
+
+		threading.Thread(target=_run, name="upstream-http", daemon=True).start()
+		ready.wait()
+		_client = httpx.AsyncClient(
+			limits=httpx.Limits(
+				max_connections=UPSTREAM_MAX_CONNECTIONS,
+				max_keepalive_connections=UPSTREAM_KEEPALIVE,
+			),
+			follow_redirects=True,
+		)
+		_loop = loop
+		return loop
+
+
+async def _get_json(url: str, timeout: float, retries: int, backoff_base: float) -> dict:
+	host = urlsplit(url).hostname or "unknown"
+	for attempt in range(retries + 1):
+		t0 = time.perf_counter()
+		status = "error"
+		try:
+			r = await _client.get(url, timeout=timeout)
+			status = str(r.status_code)
+			r.raise_for_status()
+			js = r.json() or {}
+		except Exception:
+			js = None
+		UPSTREAM_SECONDS.observe(time.perf_counter() - t0, host=host, status=status)
+		if js is not None:
+			return js
+		if attempt >= retries:
+			break
+		UPSTREAM_RETRIES.inc(host=host)
+		await asyncio.sleep(backoff_base * (2 ** attempt))
+	return {}
+
+
+async def _get_json_shared(url: str, timeout: float, retries: int, backoff_base: float) -> dict:
+	# 跟随者拿到副本，避免调用方原地修改（如排序）互相影响
+	return await _FETCHES.ado(url, lambda: _get_json(url, timeout, retries, backoff_base), share=copy.deepcopy)
+
+
+async def _get_json_parsed(url: str, timeout: float, retries: int, backoff_base: float, parse: Optional[Callable[[dict], Any]]) -> Any:
+	js = await _get_json_shared(url, timeout, retries, backoff_base)
+	return parse(js) if parse is not None else js
+
+
+def submit_json(
+	url: str,
+	timeout: float = 15.0,
+	retries: int = 2,
+	backoff_base: float = 0.5,
+	parse: Optional[Callable[[dict], Any]] = None,
+) -> Future:
+	"""提交 GET 请求并立即返回 Future；结果为 JSON（或 parse(JSON)），失败时为空 dict。
+
+	- retries 表示额外重试次数（总尝试=1+retries）
+	- backoff 形如 0.5, 1.0, 2.0 ... 秒，在事件循环中等待，不占用调用线程
+	- 同一 URL 已有请求进行中时不再重复发起，直接等待其结果
+	"""
+	loop = _ensure_loop()
+	return asyncio.run_coroutine_threadsafe(_get_json_parsed(url, timeout, retries, backoff_base, parse), loop)
+
+
+def get_json(url: str, timeout: float = 15.0, retries: int = 2, backoff_base: float = 0.5) -> dict:
+	"""同步 GET 并返回 JSON，失败返回空 dict。"""
+	return submit_json(url, timeout=timeout, retries=retries, backoff_base=backoff_base).result()
+
+
+def get_json_many(urls: Sequence[str], timeout: float = 15.0, retries: int = 2, backoff_base: float = 0.5) -> List[dict]:
+	"""并发请求多个 URL，按输入顺序返回 JSON 列表。"""
+	futures = [submit_json(u, timeout=timeout, retries=retries, backoff_base=backoff_base) for u in urls]
+	return [f.result() for f in futures]
+
+
+async def aget_json(url: str, timeout: float = 15.0, retries: int = 2, backoff_base: float = 0.5) -> dict:
+	"""供异步代码使用：在共享客户端上执行请求，不阻塞调用方事件循环。"""
+	return await asyncio.wrap_future(submit_json(url, timeout=timeout, retries=retries, backoff_base=backoff_base))
+
+
+async def aget_json_many(urls: Sequence[str], timeout: float = 15.0, retries: int = 2, backoff_base: float = 0.5) -> List[dict]:
+	return list(await asyncio.gather(*(aget_json(u, timeout, retries, backoff_base) for u in urls)))
+
+
+def close() -> None:
+	"""关闭连接池并停止后台事件循环。"""
+	global _loop, _client
+	with _lock:
+		loop, client = _loop, _client
+		_loop, _client = None, None
+	if loop is None:
+		return
+	if client is not None:
+		try:
+			asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+		except Exception:
+			pass
+	loop.call_soon_threadsafe(loop.stop)
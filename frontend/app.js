@@ -151,7 +151,7 @@ function applyI18n() {
 	const modalTitle = document.getElementById('modal-title');
 	if (modalTitle) modalTitle.textContent = t('data.source');
 	
-	// 重新渲染极端天气和预报
+	// 用已加载的数据重新渲染极端天气和预报（不重复请求）
 	renderExtremes();
 	renderForecast();
 	renderHistory();
@@ -358,10 +358,17 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // 存储最新的预报数据，用于历史图表
 let latestForecastData = [];
+// 最近一次 /api/dashboard 的结果（切换主题时重绘图表，无需再次请求）
+let latestDashboard = null;
 
-async function renderForecast(){
+async function loadDashboard(){
+	latestDashboard = await getJSON(`/api/dashboard?city=${encodeURIComponent(currentCity())}&days=7&history_days=14`);
+	return latestDashboard;
+}
+
+function renderForecast(data = latestDashboard){
+	if(!data) return;
 	try{
-		const data = await getJSON(`/api/forecast?city=${encodeURIComponent(currentCity())}&days=7`);
 		const list = data.forecast || [];
 		latestForecastData = list; // 保存预报数据
 		cardsEl.innerHTML = list.map(card).join('');
@@ -374,9 +381,9 @@ async function renderForecast(){
 	}
 }
 
-async function renderHistory(){
+function renderHistory(data = latestDashboard){
+	if(!data) return;
 	try{
-		const data = await getJSON(`/api/history?city=${encodeURIComponent(currentCity())}&days=14`);
 		let list = data.history || [];
 		
 		// 如果有预报数据，将前7天替换为预报数据以确保一致性
@@ -428,11 +435,10 @@ function extremeCard(x){
 	return `<div class="extreme-card"><div class="extreme-top"><div class="extreme-date">${x.date}</div>${badge}</div><div class="extreme-meta">↑${(x.tmax||0).toFixed?.(1)}°C ↓${(x.tmin||0).toFixed?.(1)}°C · ${t('label.precip')} ${(x.precipitation_mm||0).toFixed?.(1)}mm</div><div class="chips">${chips}</div></div>`;
 }
 
-async function renderExtremes(){
+function renderExtremes(data = latestDashboard){
 	const el = document.getElementById('extremes');
-	if(!el) return;
+	if(!el || !data) return;
 	try{
-		const data = await getJSON(`/api/alerts/summary?city=${encodeURIComponent(currentCity())}&days=7`);
 		const list = data.extremes || [];
 		if(list.length===0){ el.innerHTML = '<div class="extreme-card">--</div>'; return; }
 		el.innerHTML = list.map(extremeCard).join('');
@@ -565,9 +571,19 @@ async function refreshData(){
 	applyI18n();
 	showLoader();
 	try{
-		await renderForecast();
-		await renderHistory();
-		await renderExtremes();
+		// 一次请求拿到预报、历史与极端天气摘要（服务端只加载与预测一次）
+		let data;
+		try{
+			data = await loadDashboard();
+		}catch(e){
+			cardsEl.innerHTML = `<div class="card">${String(e)}</div>`;
+			const el = document.getElementById('extremes');
+			if(el){ el.innerHTML = `<div class="extreme-card">${String(e)}</div>`; }
+			return;
+		}
+		renderForecast(data);
+		renderHistory(data);
+		renderExtremes(data);
 	} finally {
 		hideLoader();
 	}
@@ -587,8 +603,9 @@ const cityDatalist=document.getElementById('city-suggestions');
 let citySearchTimer;
 async function geocode(q){
 	if(!q) return [];
-	const url=`https://geocoding-api.open-meteo.com/v1/search?name=${encodeURIComponent(q)}&language=zh&count=8`;
-	try{ const j=await getJSON(url); return (j.results||[]).map(r=>({name:r.name,admin:r.admin1,country:r.country,display:`${r.name}${r.admin1?(' · '+r.admin1):''} · ${r.country}`})); }catch(e){ return []; }
+	// 服务端本地地名表（中文/拼音/首字母），不依赖外部地理编码服务
+	const url=`/api/cities/suggest?q=${encodeURIComponent(q)}&limit=8`;
+	try{ const j=await getJSON(url); return (j.results||[]).map(r=>({name:r.name,admin:r.province,display:r.province&&r.province!==r.name?`${r.name} · ${r.province}`:r.name})); }catch(e){ return []; }
 }
 function setCity(v){
 	if(!v) return;
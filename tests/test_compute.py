@@ -0,0 +1,25 @@
+from app import compute, metrics
+
+
+def _record_stage(value):
+	metrics.STAGE_SECONDS.observe(value, stage="test_stage")
+	metrics.cache_result("test_cache", "hit")
+	return value * 2
+
+
+def _counts():
+	hits = metrics.CACHE_REQUESTS._values.get(("test_cache", "hit"), 0.0)
+	observed = metrics.STAGE_SECONDS._values.get(("test_stage",), [None, 0.0, 0])[2]
+	return hits, observed
+
+
+def test_pool_task_metrics_reach_parent_registry():
+	tier = compute.ComputeTier(workers=1)
+	hits, observed = _counts()
+	try:
+		assert tier.run("test", _record_stage, 0.25) == 0.5
+		assert tier.run("test", _record_stage, 0.5) == 1.0
+	finally:
+		tier.shutdown()
+	assert _counts() == (hits + 2, observed + 2)
+	assert 'weather_stage_seconds_count{stage="test_stage"}' in metrics.render()
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from app import fast_engine, forecasting
+from app.bench import make_history
+
+FIELDS = ("temperature_c", "tmax", "tmin", "precipitation_mm", "humidity", "wind_speed_ms")
+
+
+def _single(df, days):
+	temp, prec = forecasting.local_model_forecast(df, days, engine="fast")
+	return forecasting.fuse_with_external(df, temp, prec, None, days)
+
+
+@pytest.mark.parametrize("days", [45, 90, 800])
+def test_batch_matches_single_city_on_gappy_history(days):
+	frames = {f"c{i}": make_history(days, seed=i, gap_ratio=0.15) for i in range(6)}
+	# 缺测值（行存在但为 NaN）也应按同样的方式跳过
+	frames["c0"].loc[frames["c0"].index[-5:-2], ["tmax", "humidity"]] = np.nan
+	batch = forecasting.forecast_cities_fast(frames, 7)
+	for city, df in frames.items():
+		single = _single(df, 7)
+		assert [d["date"] for d in batch[city]] == [d["date"] for d in single]
+		for field in FIELDS:
+			np.testing.assert_allclose(
+				[d[field] for d in batch[city]], [d[field] for d in single], rtol=0, atol=1e-9, err_msg=f"{city} {field}",
+			)
+
+
+def test_spread_counts_valid_observations_not_calendar_days():
+	temp = np.array([[10.0, np.nan, 10.0, 10.0]])
+	tmax = np.array([[20.0, np.nan, 13.0, 15.0]])
+	delta_max, _ = fast_engine.spread(temp, tmax, temp - 1.0, window=2)
+	assert delta_max[0] == pytest.approx(4.0)
@@ -0,0 +1,22 @@
+import asyncio
+
+from app.singleflight import SingleFlight
+
+
+def test_ado_coalesces_concurrent_coroutines():
+	sf = SingleFlight("test-async")
+	calls = []
+
+	async def fetch():
+		calls.append(1)
+		await asyncio.sleep(0.05)
+		return {"value": [1, 2]}
+
+	async def main():
+		return await asyncio.gather(*(sf.ado("k", fetch, share=lambda v: {"value": list(v["value"])}) for _ in range(5)))
+
+	results = asyncio.run(main())
+	assert len(calls) == 1
+	assert all(r == {"value": [1, 2]} for r in results)
+	assert len({id(r) for r in results}) == 5
+	assert sf.stats() == {"executed": 1, "shared": 4, "in_flight": 0}